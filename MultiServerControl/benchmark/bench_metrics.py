@@ -0,0 +1,108 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+import common
+from multi_server_control import metrics
+
+"""
+资源采样开销测试
+启动若干个模拟子服（每个由一个父进程与一个子进程组成，对应子服的 MCDR 与 Minecraft 服务端），
+反复执行一次完整采样，统计每轮采样的耗时与 CPU 时间，并按采样间隔折算为占用的 CPU 比例
+
+python benchmark/bench_metrics.py --servers 20 --rounds 200 --output bench_metrics.json
+"""
+
+# 模拟子服：父进程启动一个子进程后等待
+CHILD_SCRIPT = 'import subprocess, sys, time; subprocess.Popen([sys.executable, "-c", "import time; time.sleep(3600)"]); time.sleep(3600)'
+
+
+def SpawnServers(count):
+    """
+    启动模拟子服
+    :param count: 数量
+    :return: {服务器名字: Popen}
+    """
+    return {f'server{i}': subprocess.Popen([sys.executable, '-c', CHILD_SCRIPT]) for i in range(count)}
+
+
+def StopServers(servers):
+    """
+    结束模拟子服及其子进程
+    :param servers: {服务器名字: Popen}
+    :return: None
+    """
+    for process in servers.values():
+        for pid in metrics.ProcessTree(process.pid)[1:]:
+            try:
+                os.kill(pid, 9)
+            except OSError:
+                pass
+        process.kill()
+        process.wait()
+
+
+def Benchmark(count, rounds, interval):
+    """
+    执行测试
+    :param count: 模拟子服数量
+    :param rounds: 采样轮数
+    :param interval: 折算 CPU 比例时使用的采样间隔（秒）
+    :return: 测试结果
+    """
+    servers = SpawnServers(count)
+    try:
+        # 等待子进程全部启动
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline and \
+                any(len(metrics.ProcessTree(process.pid)) < 2 for process in servers.values()):
+            time.sleep(0.05)
+        pids = {name: process.pid for name, process in servers.items()}
+        sampler = metrics.Sampler(lambda: pids, interval)
+        sampler.Sample()
+
+        wall = []
+        cpu = []
+        for _ in range(rounds):
+            wall_start = time.perf_counter()
+            cpu_start = time.process_time()
+            sampler.Sample()
+            cpu.append(time.process_time() - cpu_start)
+            wall.append(time.perf_counter() - wall_start)
+        sampled = sum(1 for name in servers if sampler.Latest(name) is not None)
+    finally:
+        StopServers(servers)
+
+    wall.sort()
+    return {
+        'servers': count,
+        'processes_per_server': 2,
+        'rounds': rounds,
+        'servers_sampled': sampled,
+        'round_wall_ms_mean': statistics.mean(wall) * 1000,
+        'round_wall_ms_p95': wall[int(len(wall) * 0.95) - 1] * 1000,
+        'round_cpu_ms_mean': statistics.mean(cpu) * 1000,
+        'interval_s': interval,
+        'cpu_overhead_percent': statistics.mean(cpu) / interval * 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='资源采样开销测试')
+    parser.add_argument('--servers', type=int, default=20, help='模拟子服数量')
+    parser.add_argument('--rounds', type=int, default=200, help='采样轮数')
+    parser.add_argument('--interval', type=float, default=metrics.SAMPLE_INTERVAL, help='采样间隔（秒）')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    if not metrics.Supported():
+        sys.exit('当前系统不支持资源采样（仅支持Linux）')
+    result = Benchmark(args.servers, args.rounds, args.interval)
+    common.WriteResults('metrics', [result], args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+import argparse
+import time
+
+import common
+import stubs
+from multi_server_control import my_lib, rcon_pool, settings
+
+"""
+Rcon 命令吞吐量测试
+对本机的 Rcon 模拟服务器分别测试：每条命令新建连接并登录（旧的做法）、通过连接池逐条执行、通过连接池批量执行
+
+python benchmark/bench_rcon.py --commands 1000 --output bench_rcon.json
+"""
+
+
+def Throughput(func, commands):
+    """
+    执行若干条命令并计算吞吐量
+    :param func: 执行一条命令的函数
+    :param commands: 命令条数
+    :return: {'commands', 'elapsed', 'commands_per_s', 'mean_ms'}
+    """
+    start = time.perf_counter()
+    for i in range(commands):
+        func(f'list {i}')
+    elapsed = time.perf_counter() - start
+    return {
+        'commands': commands,
+        'elapsed': elapsed,
+        'commands_per_s': commands / elapsed,
+        'mean_ms': elapsed / commands * 1000,
+    }
+
+
+def Benchmark(commands, batch):
+    """
+    执行测试（在子进程中执行）
+    :param commands: 每项测试执行的命令条数
+    :param batch: 批量执行时每批的命令条数
+    :return: 测试结果
+    """
+    stub = stubs.StubRconServer()
+    try:
+        my_lib.config = settings.Config.Parse({
+            'server_list': ['bench'],
+            'bench': {'port': 25565, 'target': './bench/server',
+                      'rcon': {'enable': True, 'host': '127.0.0.1', 'port': stub.port, 'password': stub.password}},
+        }, '', [])
+        my_lib.RconConnections = rcon_pool.RconPool()
+
+        def Reconnect(command):
+            rcon = my_lib.RconInit(my_lib.config.servers['bench'])
+            rcon.connect()
+            rcon.send_command(command)
+            rcon.disconnect()
+
+        results = {
+            'connect_per_command': Throughput(Reconnect, commands),
+            'pooled': Throughput(lambda command: my_lib.RconExecute('bench', command), commands),
+        }
+        start = time.perf_counter()
+        for i in range(0, commands, batch):
+            my_lib.RconExecuteBatch('bench', [f'list {j}' for j in range(i, min(i + batch, commands))])
+        elapsed = time.perf_counter() - start
+        results['pooled_batch'] = {
+            'commands': commands,
+            'batch': batch,
+            'elapsed': elapsed,
+            'commands_per_s': commands / elapsed,
+            'mean_ms': elapsed / commands * 1000,
+        }
+        my_lib.RconConnections.Close()
+    finally:
+        stub.Close()
+    return {'connections_opened': stub.connections, 'modes': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Rcon 命令吞吐量测试')
+    parser.add_argument('--commands', type=int, default=1000, help='每项测试执行的命令条数')
+    parser.add_argument('--batch', type=int, default=50, help='批量执行时每批的命令条数')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    result = common.RunIsolated(Benchmark, args.commands, args.batch)
+    common.WriteResults('rcon', [result], args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+import argparse
+import statistics
+import time
+
+import common
+import stubs
+from multi_server_control import my_lib, server_probe, settings
+
+"""
+状态查询性能测试
+在本机启动若干个响应 Server List Ping 的模拟服务器，分别测试逐个探测、并发探测（GetAllStatus）与命中缓存时的耗时
+
+python benchmark/bench_status.py --servers 20 --delay 0.05 --rounds 20 --output bench_status.json
+"""
+
+
+def Measure(func, rounds):
+    """
+    重复执行并统计耗时
+    :param func: 被测函数
+    :param rounds: 次数
+    :return: {'mean_ms', 'p95_ms', 'max_ms'}
+    """
+    samples = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'mean_ms': statistics.mean(samples) * 1000,
+        'p95_ms': samples[max(0, int(len(samples) * 0.95) - 1)] * 1000,
+        'max_ms': samples[-1] * 1000,
+    }
+
+
+def Benchmark(count, delay, rounds):
+    """
+    执行测试（在子进程中执行）
+    :param count: 模拟服务器数量
+    :param delay: 每个模拟服务器返回状态前的延迟（秒）
+    :param rounds: 每项测试的重复次数
+    :return: 测试结果
+    """
+    servers = {f'server{i}': stubs.StubSlpServer(delay) for i in range(count)}
+    try:
+        data = {name: {'port': stub.port, 'target': f'./{name}/server', 'rcon': {'host': '127.0.0.1'}}
+                for name, stub in servers.items()}
+        my_lib.config = settings.Config.Parse(dict(data, server_list=list(servers)), '', [])
+        my_lib.ServerStatus = server_probe.StatusCache(3600)
+
+        def Sequential():
+            for name in servers:
+                server_probe.ProbeServer(*my_lib.StatusTarget(my_lib.config.servers[name]))
+
+        results = {
+            'sequential': Measure(Sequential, rounds),
+            'concurrent': Measure(lambda: my_lib.GetAllStatus(refresh=True), rounds),
+            'cached': Measure(my_lib.GetAllStatus, rounds),
+        }
+        online = sum(1 for status in my_lib.GetAllStatus().values() if status['online'])
+    finally:
+        for stub in servers.values():
+            stub.Close()
+    return {'servers': count, 'delay_s': delay, 'rounds': rounds, 'servers_online': online, 'modes': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='状态查询性能测试')
+    parser.add_argument('--servers', type=int, default=20, help='模拟服务器数量')
+    parser.add_argument('--delay', type=float, default=0.05, help='模拟服务器的响应延迟（秒）')
+    parser.add_argument('--rounds', type=int, default=20, help='每项测试的重复次数')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    result = common.RunIsolated(Benchmark, args.servers, args.delay, args.rounds)
+    common.WriteResults('status', [result], args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+import argparse
+import json
+import logging
+import os
+import shutil
+import socket
+import tempfile
+import time
+
+import common
+import worldgen
+from multi_server_control import feedback, jobs, my_lib, settings, world_sync
+
+"""
+同步性能测试
+生成模拟存档后，按不同的同步方式与策略调用 ServerSync，记录耗时、吞吐量、各阶段耗时与峰值内存
+每一项测试在独立的子进程中运行
+
+python benchmark/bench_sync.py --regions 32 --region-mb 2 --output bench_sync.json
+"""
+
+# 测试项：名字、同步配置、是否先同步一次再修改主服存档（warm）
+CASES = [
+    {'name': 'full-copytree', 'sync_mode': 'full', 'sync_workers': 1, 'sync_strategy': 'copy'},
+    {'name': 'full-parallel', 'sync_mode': 'full', 'sync_workers': 4, 'sync_strategy': 'copy'},
+    {'name': 'full-reflink', 'sync_mode': 'full', 'sync_workers': 4, 'sync_strategy': 'reflink'},
+    {'name': 'incremental-cold', 'sync_mode': 'incremental', 'sync_workers': 4, 'sync_strategy': 'copy'},
+    {'name': 'incremental-noop', 'sync_mode': 'incremental', 'sync_workers': 4, 'sync_strategy': 'copy',
+     'warm': True, 'mutate': 0},
+    {'name': 'incremental-warm', 'sync_mode': 'incremental', 'sync_workers': 4, 'sync_strategy': 'copy',
+     'warm': True, 'mutate': 0.05},
+    {'name': 'incremental-warm-delta', 'sync_mode': 'incremental', 'sync_workers': 4, 'sync_strategy': 'copy',
+     'region_delta': True, 'warm': True, 'mutate': 0.05},
+]
+
+
+class ConsoleSink:
+    """
+    代替 MCDR 控制台接收插件输出的命令
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger('MSC-Bench')
+        self.commands = []
+
+    def execute(self, command):
+        self.commands.append(command)
+
+
+def FreePort():
+    """
+    :return: 本机当前没有被占用的端口（模拟的子服没有运行）
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def BenchJob(job_id):
+    """
+    :param job_id: 任务ID
+    :return: 使用当前配置的同步任务
+    """
+    job = jobs.Job(job_id, 'bench', 'sync', True)
+    job.config = my_lib.config
+    return job
+
+
+def RunCase(case, base_world, workdir):
+    """
+    运行一项同步测试（在子进程中执行）
+    :param case: 测试项
+    :param base_world: 模拟存档路径
+    :param workdir: 工作目录
+    :return: 结果字典
+    """
+    root = os.path.join(workdir, case['name'])
+    source = os.path.join(root, 'server')
+    target = os.path.join(root, 'Mirror', 'server')
+    log_path = os.path.join(root, 'sync.jsonl')
+    shutil.copytree(base_world, os.path.join(source, 'world'))
+    os.makedirs(target)
+
+    options = {key: value for key, value in case.items() if key not in ('name', 'warm', 'mutate')}
+    my_lib.config = settings.Config.Parse({
+        'server_list': ['bench'],
+        'sync_log': log_path,
+        'progress_interval': 3600,
+        'bench': dict(options, source=source, target=target, port=FreePort(), rcon={'host': '127.0.0.1'},
+                      ignore_files=['carpet.conf']),
+    }, '', [])
+    sink = feedback.Feedback(ConsoleSink())
+    changed = None
+    if case.get('warm'):
+        my_lib.ServerSync(BenchJob(0), sink, 'bench')
+        changed = worldgen.MutateWorld(os.path.join(source, 'world'), case['mutate']) if case['mutate'] else 0
+
+    start = time.perf_counter()
+    my_lib.ServerSync(BenchJob(1), sink, 'bench')
+    elapsed = time.perf_counter() - start
+
+    with open(log_path, 'r', encoding='utf-8') as f:
+        record = json.loads(f.read().splitlines()[-1])
+    shutil.rmtree(root)
+    world_bytes = record.get('skipped_bytes', 0) + record.get('copied_bytes', 0) + record.get('delta_bytes', 0) \
+        or record['total_bytes']
+    return {
+        'case': case['name'],
+        'config': options,
+        'changed_chunks': changed,
+        'result': record['result'],
+        'elapsed': elapsed,
+        'world_throughput_mb_s': world_bytes / elapsed / 1024 / 1024 if elapsed else None,
+        'written_bytes': record.get('copied_bytes', 0) + record.get('delta_bytes', 0) or record['done_bytes'],
+        'copied_files': record.get('copied_files', record['done_files']),
+        'delta_files': record.get('delta_files', 0),
+        'skipped_files': record.get('skipped_files', 0),
+        'copy_rate_mb_s': record['copy_rate'] / 1024 / 1024 if record['copy_rate'] else None,
+        'phases': record['phases'],
+        # reflink 不可用时会退回普通复制，结果需要结合这一项判断
+        'reflink_fallback': any(strategy == 'reflink' and not supported
+                                for (strategy, _, _), supported in world_sync.strategy_support.items()),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步性能测试')
+    parser.add_argument('--regions', type=int, default=32, help='区域文件数')
+    parser.add_argument('--region-mb', type=float, default=2, help='每个区域文件的大小（MiB）')
+    parser.add_argument('--playerdata', type=int, default=500, help='玩家数据文件数')
+    parser.add_argument('--datapacks', type=int, default=5, help='数据包数')
+    parser.add_argument('--cases', nargs='*', help=f'只运行指定的测试项：{" ".join(case["name"] for case in CASES)}')
+    parser.add_argument('--workdir', help='工作目录（应与实际存档位于同类文件系统），默认使用系统临时目录')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='msc_bench_', dir=args.workdir)
+    try:
+        base_world = os.path.join(workdir, 'base_world')
+        world = worldgen.GenerateWorld(
+            base_world, args.regions, int(args.region_mb * 1024 * 1024), args.playerdata, args.datapacks
+        )
+        results = []
+        for case in CASES:
+            if args.cases and case['name'] not in args.cases:
+                continue
+            result = common.RunIsolated(RunCase, case, base_world, workdir)
+            result['world_files'] = world['files']
+            result['world_bytes'] = world['bytes']
+            results.append(result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    common.WriteResults('sync', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
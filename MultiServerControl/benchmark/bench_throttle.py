@@ -0,0 +1,141 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import common
+from multi_server_control import throttle, world_sync
+
+"""
+同步限速测试
+复制一组大文件与一组小文件，比较不限速、只丢弃页缓存、按字节数限速、按 IOPS 限速与自适应降速时的实际速度，
+检查限速是否准确，以及限速器本身的开销
+
+python benchmark/bench_throttle.py --files 8 --file-mb 16 --caps 20 50 --output bench_throttle.json
+"""
+
+
+def CreateFiles(root, count, size):
+    """
+    生成测试文件
+    :param root: 文件夹
+    :param count: 文件数
+    :param size: 每个文件的大小
+    :return: 文件路径列表
+    """
+    os.makedirs(root, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = os.path.join(root, f'file{i}.bin')
+        with open(path, 'wb') as f:
+            f.write(os.urandom(size))
+        paths.append(path)
+    return paths
+
+
+def CopyCase(name, paths, workdir, workers, limiter, lag_events=0):
+    """
+    复制一组文件并统计实际速度
+    :param name: 测试项名字
+    :param paths: 源文件列表
+    :param workdir: 工作目录
+    :param workers: 并行复制的线程数
+    :param limiter: throttle.IoLimiter 或 None
+    :param lag_events: 复制前模拟主服卡顿的次数（自适应限速）
+    :return: 结果字典
+    """
+    target = os.path.join(workdir, 'target')
+    shutil.rmtree(target, ignore_errors=True)
+    os.makedirs(target)
+    tasks = [(path, os.path.join(target, os.path.basename(path)), os.path.getsize(path)) for path in paths]
+    if limiter is not None and limiter.monitor is not None:
+        for _ in range(lag_events):
+            limiter.monitor.OnLag()
+    cpu_start = time.process_time()
+    start = time.perf_counter()
+    world_sync.CopyFiles(tasks, workers, limiter=limiter)
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    total = sum(size for _, _, size in tasks)
+    blocks = sum(max(1, -(-size // throttle.BLOCK_SIZE)) for _, _, size in tasks)
+    return {
+        'case': name,
+        'files': len(tasks),
+        'bytes': total,
+        'workers': workers,
+        'elapsed': elapsed,
+        'cpu_s': cpu,
+        'throughput_mb_s': total / elapsed / 1024 / 1024,
+        'blocks_per_s': blocks / elapsed,
+        'throttle_wait': limiter.waited if limiter is not None else 0.0,
+    }
+
+
+def ConsumeOverhead(calls):
+    """
+    不需要等待时每次申请令牌的耗时
+    :param calls: 调用次数
+    :return: 结果字典
+    """
+    limiter = throttle.IoLimiter(1 << 50, 1 << 40, throttle.LagMonitor())
+    start = time.perf_counter()
+    for _ in range(calls):
+        limiter.Consume(throttle.BLOCK_SIZE, 1)
+    elapsed = time.perf_counter() - start
+    return {'case': 'consume-overhead', 'calls': calls, 'ns_per_call': elapsed / calls * 1e9}
+
+
+def Benchmark(workdir, files, file_mb, small_files, caps, iops, workers):
+    """
+    执行测试
+    :return: 结果列表
+    """
+    large = CreateFiles(os.path.join(workdir, 'large'), files, int(file_mb * 1024 * 1024))
+    small = CreateFiles(os.path.join(workdir, 'small'), small_files, 4096)
+    results = [
+        CopyCase('unlimited', large, workdir, workers, None),
+        CopyCase('fadvise-only', large, workdir, workers, throttle.IoLimiter(fadvise=True)),
+    ]
+    for cap in caps:
+        result = CopyCase(f'cap-{cap:g}mb', large, workdir, workers, throttle.IoLimiter(int(cap * 1024 * 1024)))
+        result['cap_mb_s'] = cap
+        result['cap_error_percent'] = (result['throughput_mb_s'] - cap) / cap * 100
+        results.append(result)
+    result = CopyCase(f'iops-{iops}', small, workdir, workers, throttle.IoLimiter(0, iops))
+    result['cap_iops'] = iops
+    result['cap_error_percent'] = (result['blocks_per_s'] - iops) / iops * 100
+    results.append(result)
+    # 模拟一次卡顿后限速减半
+    cap = caps[-1]
+    result = CopyCase(f'adaptive-{cap:g}mb', large, workdir, workers,
+                      throttle.IoLimiter(int(cap * 1024 * 1024), 0, throttle.LagMonitor()), 1)
+    result['cap_mb_s'] = cap / 2
+    result['cap_error_percent'] = (result['throughput_mb_s'] - cap / 2) / (cap / 2) * 100
+    results.append(result)
+    results.append(ConsumeOverhead(100000))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='同步限速测试')
+    parser.add_argument('--files', type=int, default=8, help='大文件数')
+    parser.add_argument('--file-mb', type=float, default=16, help='每个大文件的大小（MiB）')
+    parser.add_argument('--small-files', type=int, default=600, help='小文件数（IOPS 测试）')
+    parser.add_argument('--caps', type=float, nargs='*', default=[20, 50], help='字节数限速（MB/s）')
+    parser.add_argument('--iops', type=int, default=300, help='IOPS 限速')
+    parser.add_argument('--workers', type=int, default=4, help='并行复制的线程数')
+    parser.add_argument('--workdir', help='工作目录（应与实际存档位于同类文件系统），默认使用系统临时目录')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='msc_bench_', dir=args.workdir)
+    try:
+        results = Benchmark(workdir, args.files, args.file_mb, args.small_files, args.caps, args.iops, args.workers)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    common.WriteResults('throttle', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
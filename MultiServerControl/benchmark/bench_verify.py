@@ -0,0 +1,93 @@
+import argparse
+import os
+import shutil
+import tempfile
+
+import common
+import worldgen
+from multi_server_control import throttle, world_check
+
+"""
+存档完整性检查测试
+生成模拟存档后分别以单线程、多线程与多进程检查，并比较不同的抽查区块数，记录耗时与吞吐量；
+--cold 在每一项之前通过 posix_fadvise 丢弃存档的页缓存，模拟第一次读取
+
+python benchmark/bench_verify.py --regions 256 --region-mb 8 --output bench_verify.json
+"""
+
+# 测试项：名字、并行数（0 为 CPU 核数）、是否使用进程池、每个区域文件解压检查的区块数
+CASES = [
+    {'name': 'serial', 'workers': 1, 'processes': False, 'sample': world_check.SAMPLE_CHUNKS},
+    {'name': 'threads', 'workers': 0, 'processes': False, 'sample': world_check.SAMPLE_CHUNKS},
+    {'name': 'processes', 'workers': 0, 'processes': True, 'sample': world_check.SAMPLE_CHUNKS},
+    {'name': 'processes-header-only', 'workers': 0, 'processes': True, 'sample': 0},
+    {'name': 'processes-sample-16', 'workers': 0, 'processes': True, 'sample': 16},
+]
+
+
+def DropWorldCache(world):
+    """
+    丢弃存档所有文件的页缓存
+    :param world: 存档路径
+    :return: None
+    """
+    for root, _, names in os.walk(world):
+        for name in names:
+            fd = os.open(os.path.join(root, name), os.O_RDONLY)
+            try:
+                throttle.DropCache(fd)
+            finally:
+                os.close(fd)
+
+
+def RunCase(case, world, cold):
+    """
+    执行一项测试
+    :param case: 测试项
+    :param world: 存档路径
+    :param cold: 是否先丢弃页缓存
+    :return: 结果字典
+    """
+    if cold:
+        DropWorldCache(world)
+    report = world_check.VerifyWorld(world, ['session.lock'], None, case['sample'], case['workers'], case['processes'])
+    if report.problems:
+        raise RuntimeError(f'模拟存档检查出问题：{report.problems[:3]}')
+    return {
+        'case': case['name'],
+        'mode': report.mode,
+        'workers': case['workers'] or os.cpu_count(),
+        'sample': case['sample'],
+        'cold': cold,
+        'regions': report.regions,
+        'region_bytes': report.region_bytes,
+        'chunks': report.chunks,
+        'sampled': report.sampled,
+        'elapsed': report.elapsed,
+        'throughput_mb_s': report.region_bytes / report.elapsed / 1024 / 1024 if report.elapsed else None,
+        'chunks_per_s': report.chunks / report.elapsed if report.elapsed else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='存档完整性检查测试')
+    parser.add_argument('--regions', type=int, default=256, help='区域文件数')
+    parser.add_argument('--region-mb', type=float, default=8, help='每个区域文件的大小（MiB）')
+    parser.add_argument('--cases', nargs='*', choices=[case['name'] for case in CASES], help='只运行指定的测试项')
+    parser.add_argument('--cold', action='store_true', help='每一项之前丢弃页缓存')
+    parser.add_argument('--workdir', help='工作目录（应与实际存档位于同类文件系统），默认使用系统临时目录')
+    parser.add_argument('--output', help='结果输出文件（JSON），不填则输出到标准输出')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='msc_bench_', dir=args.workdir)
+    try:
+        world = os.path.join(workdir, 'world')
+        worldgen.GenerateWorld(world, args.regions, int(args.region_mb * 1024 * 1024), playerdata=0, datapacks=0)
+        results = [RunCase(case, world, args.cold) for case in CASES if not args.cases or case['name'] in args.cases]
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    common.WriteResults('verify', results, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows 下没有 resource，无法统计峰值内存
+    resource = None
+
+# 插件所在目录（MultiServerControl），加入搜索路径后即可导入 multi_server_control
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_ROOT)
+
+"""
+性能测试的公共部分：测试环境信息、在独立进程中运行测试以统计峰值内存、结果输出
+"""
+
+
+def Metadata():
+    """
+    测试环境信息，与结果一起保存，便于比较不同版本
+    :return: 信息字典
+    """
+    with open(os.path.join(PLUGIN_ROOT, 'mcdreforged.plugin.json'), 'r', encoding='utf-8') as f:
+        version = json.load(f)['version']
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=PLUGIN_ROOT, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'plugin_version': version,
+        'git_commit': commit,
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.time(),
+    }
+
+
+def PeakRss():
+    """
+    当前进程的峰值常驻内存
+    :return: 字节数，无法统计时返回 None
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 的单位是字节，Linux 是 KiB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def _IsolatedMain(queue, func, args):
+    try:
+        result = func(*args)
+        result['peak_rss'] = PeakRss()
+        queue.put((True, result))
+    except Exception as e:
+        queue.put((False, f'{type(e).__name__}: {e}'))
+
+
+def RunIsolated(func, *args):
+    """
+    在新的子进程中运行一项测试，使峰值内存只反映这一项测试
+    :param func: 测试函数（需要是模块级函数），返回结果字典
+    :param args: 测试函数的参数
+    :return: 结果字典，附带 peak_rss（字节）
+    """
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_IsolatedMain, args=(queue, func, args))
+    process.start()
+    ok, result = queue.get()
+    process.join()
+    if not ok:
+        raise RuntimeError(result)
+    return result
+
+
+def WriteResults(name, results, output=None):
+    """
+    输出测试结果（JSON），同时打印到标准输出
+    :param name: 测试名
+    :param results: 结果列表
+    :param output: 输出文件，None 时只打印
+    :return: 完整的结果字典
+    """
+    data = {'benchmark': name, 'metadata': Metadata(), 'results': results}
+    text = json.dumps(data, indent=2, ensure_ascii=False)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+    return data
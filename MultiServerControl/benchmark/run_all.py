@@ -0,0 +1,62 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import common
+
+"""
+依次运行全部性能测试，把结果合并到一个 JSON 文件中
+--quick 使用较小的规模，用于快速检查改动有没有明显的性能退化
+
+python benchmark/run_all.py --output bench_results.json
+"""
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 测试脚本与参数：(完整规模, 快速规模)
+BENCHMARKS = {
+    'sync': ('bench_sync.py', [], ['--regions', '6', '--region-mb', '1', '--playerdata', '100', '--datapacks', '2']),
+    'status': ('bench_status.py', [], ['--servers', '8', '--rounds', '5']),
+    'rcon': ('bench_rcon.py', [], ['--commands', '200']),
+    'metrics': ('bench_metrics.py', [], ['--servers', '5', '--rounds', '20']),
+    'throttle': ('bench_throttle.py', [], ['--files', '4', '--file-mb', '4', '--small-files', '150', '--caps', '10', '20']),
+    'verify': ('bench_verify.py', [], ['--regions', '24', '--region-mb', '2']),
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='运行全部性能测试')
+    parser.add_argument('--quick', action='store_true', help='使用较小的规模')
+    parser.add_argument('--only', nargs='*', choices=list(BENCHMARKS), help='只运行指定的测试')
+    parser.add_argument('--output', default='bench_results.json', help='结果输出文件（JSON）')
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='msc_bench_') as temp:
+        for name, (script, full_args, quick_args) in BENCHMARKS.items():
+            if args.only and name not in args.only:
+                continue
+            output = os.path.join(temp, f'{name}.json')
+            print(f'[MSC] 正在运行 {name} 测试...', file=sys.stderr)
+            process = subprocess.run(
+                [sys.executable, os.path.join(BENCHMARK_DIR, script), '--output', output]
+                + (quick_args if args.quick else full_args),
+                stdout=subprocess.DEVNULL
+            )
+            if process.returncode != 0:
+                results[name] = {'error': f'退出码 {process.returncode}'}
+                continue
+            with open(output, 'r', encoding='utf-8') as f:
+                results[name] = json.load(f)['results']
+
+    data = {'metadata': common.Metadata(), 'quick': args.quick, 'benchmarks': results}
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(json.dumps(data, indent=2, ensure_ascii=False) + '\n')
+    print(f'[MSC] 测试结果已写入 {args.output}', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
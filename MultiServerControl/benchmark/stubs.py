@@ -0,0 +1,139 @@
+import json
+import socket
+import struct
+import threading
+import time
+
+# 插件目录由调用方加入搜索路径（性能测试先导入 common，单元测试由 conftest 加入）
+from multi_server_control import server_probe
+
+"""
+用于性能测试（以及 tests 中的单元测试）的本地模拟服务器：只实现 Server List Ping 与 Rcon 协议中插件用到的部分
+"""
+
+
+class StubServer:
+    """
+    在本机随机端口上监听，每个连接一个线程处理
+    """
+
+    def __init__(self):
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.bind(('127.0.0.1', 0))
+        self.sock.listen(128)
+        self.port = self.sock.getsockname()[1]
+        self.connections = 0
+        # 已接受的连接，Drop 时全部断开
+        self.accepted = []
+        self.running = True
+        threading.Thread(target=self.Accept, daemon=True).start()
+
+    def Accept(self):
+        while self.running:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                return
+            self.connections += 1
+            self.accepted.append(conn)
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self.Serve, args=(conn,), daemon=True).start()
+
+    def Serve(self, conn):
+        raise NotImplementedError
+
+    def Drop(self):
+        """
+        断开所有已接受的连接（模拟服务器重启或连接被中间设备断开）
+        :return: None
+        """
+        for conn in self.accepted:
+            try:
+                conn.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.accepted.clear()
+
+    def Close(self):
+        self.running = False
+        self.sock.close()
+
+
+class StubSlpServer(StubServer):
+    """
+    响应 Server List Ping 的模拟服务器
+    """
+
+    def __init__(self, delay=0.0, players=3):
+        """
+        :param delay: 返回状态前等待的秒数（模拟服务器处理耗时或网络延迟）
+        :param players: 在线人数
+        """
+        self.delay = delay
+        self.status = json.dumps({
+            'version': {'name': '1.20.4', 'protocol': 765},
+            'players': {'online': players, 'max': 20},
+            'description': {'text': 'MSC benchmark'},
+        }).encode('utf-8')
+        super().__init__()
+
+    def Serve(self, conn):
+        with conn:
+            try:
+                stream = conn.makefile('rb')
+                server_probe.ReadPacket(stream)
+                server_probe.ReadPacket(stream)
+                if self.delay:
+                    time.sleep(self.delay)
+                conn.sendall(server_probe.PackPacket(0x00, server_probe.PackVarInt(len(self.status)) + self.status))
+                _, payload = server_probe.ReadPacket(stream)
+                conn.sendall(server_probe.PackPacket(0x01, payload))
+            except (OSError, ValueError):
+                pass
+
+
+class StubRconServer(StubServer):
+    """
+    Rcon 模拟服务器：每个数据包原样回复同一个请求ID，命令的返回内容为命令本身
+    """
+
+    def __init__(self, password='password', silent=False):
+        """
+        :param password: Rcon 密码
+        :param silent: 登录后不再回复任何数据包（模拟服务器卡住）
+        """
+        self.password = password
+        self.silent = silent
+        super().__init__()
+
+    @staticmethod
+    def Packet(request_id, packet_type, payload):
+        data = struct.pack('<ii', request_id, packet_type) + payload.encode('utf-8') + b'\0\0'
+        return struct.pack('<i', len(data)) + data
+
+    @staticmethod
+    def Read(stream, length):
+        data = stream.read(length)
+        if len(data) < length:
+            raise ConnectionError()
+        return data
+
+    def Serve(self, conn):
+        with conn:
+            stream = conn.makefile('rb')
+            try:
+                while True:
+                    length = struct.unpack('<i', self.Read(stream, 4))[0]
+                    data = self.Read(stream, length)
+                    request_id, packet_type = struct.unpack('<ii', data[:8])
+                    payload = data[8:-2].decode('utf-8')
+                    if packet_type == 3:
+                        conn.sendall(self.Packet(request_id if payload == self.password else -1, 2, ''))
+                    elif self.silent:
+                        continue
+                    elif packet_type == 2:
+                        conn.sendall(self.Packet(request_id, 0, payload))
+                    else:
+                        conn.sendall(self.Packet(request_id, 0, f'Unknown request {packet_type:x}'))
+            except (OSError, ConnectionError, struct.error):
+                pass
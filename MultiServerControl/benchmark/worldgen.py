@@ -0,0 +1,158 @@
+import gzip
+import json
+import os
+import random
+import struct
+import zlib
+
+# 插件目录由调用方加入搜索路径（性能测试先导入 common，单元测试由 conftest 加入）
+from multi_server_control import anvil
+
+"""
+生成用于性能测试的模拟存档
+区域文件带有合法的位置表与时间戳表，区块为不压缩（zlib 等级 0）的随机字节，可以触发区块级增量同步，
+也能通过存档完整性检查；另外生成 level.dat、大量小的玩家数据文件与数据包文件
+"""
+
+# 每个区块占用的扇区数范围
+CHUNK_SECTORS = (1, 3)
+
+
+def RandomBytes(rng, size):
+    """
+    生成不可压缩的随机数据
+    :param rng: 随机数生成器
+    :param size: 字节数
+    :return: 数据
+    """
+    return rng.getrandbits(size * 8).to_bytes(size, 'little') if size else b''
+
+
+def NbtBytes(name, data):
+    """
+    只包含一个 ByteArray 标签的 NBT 数据
+    :param name: 标签名
+    :param data: 数组内容
+    :return: NBT 数据
+    """
+    key = name.encode('utf-8')
+    return b'\x0a\x00\x00\x07' + struct.pack('>H', len(key)) + key + struct.pack('>i', len(data)) + data + b'\x00'
+
+
+def ChunkData(rng, count):
+    """
+    生成占满指定扇区数的区块：区块头 + zlib 等级 0 压缩的 NBT，剩余空间用随机字节填充
+    :param rng: 随机数生成器
+    :param count: 扇区数
+    :return: 数据
+    """
+    size = count * anvil.SECTOR_SIZE
+    payload = zlib.compress(NbtBytes('Data', RandomBytes(rng, size - 128)), 0)
+    return struct.pack('>IB', len(payload) + 1, 2) + payload + RandomBytes(rng, size - 5 - len(payload))
+
+
+def WriteRegion(file_path, rng, size, timestamp):
+    """
+    生成一个区域文件：依次放入区块直到达到目标大小
+    :param file_path: 文件路径
+    :param rng: 随机数生成器
+    :param size: 目标大小（字节）
+    :param timestamp: 区块时间戳
+    :return: 实际大小
+    """
+    locations = [0] * anvil.CHUNK_COUNT
+    timestamps = [0] * anvil.CHUNK_COUNT
+    sector = 2
+    max_sectors = max(3, size // anvil.SECTOR_SIZE)
+    for index in range(anvil.CHUNK_COUNT):
+        count = rng.randint(*CHUNK_SECTORS)
+        if sector + count > max_sectors:
+            break
+        locations[index] = (sector << 8) | count
+        timestamps[index] = timestamp
+        sector += count
+    with open(file_path, 'wb') as f:
+        f.write(struct.pack(f'>{anvil.CHUNK_COUNT}I', *locations))
+        f.write(struct.pack(f'>{anvil.CHUNK_COUNT}I', *timestamps))
+        for index in range(anvil.CHUNK_COUNT):
+            if locations[index]:
+                f.write(ChunkData(rng, locations[index] & 0xFF))
+    return sector * anvil.SECTOR_SIZE
+
+
+def GenerateWorld(world, regions=32, region_size=2 * 1024 * 1024, playerdata=500, datapacks=5,
+                  datapack_files=50, seed=0):
+    """
+    生成模拟存档
+    :param world: 存档路径
+    :param regions: 区域文件数（分布在主世界、下界与末地）
+    :param region_size: 每个区域文件的大小（字节）
+    :param playerdata: 玩家数据文件数
+    :param datapacks: 数据包数
+    :param datapack_files: 每个数据包的文件数
+    :param seed: 随机种子
+    :return: {'files': 文件数, 'bytes': 总字节数}
+    """
+    rng = random.Random(seed)
+    files = 0
+    total = 0
+
+    def Write(rel, data):
+        nonlocal files, total
+        file_path = os.path.join(world, rel)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        files += 1
+        total += len(data)
+
+    Write('level.dat', gzip.compress(NbtBytes('Data', RandomBytes(rng, 2048))))
+    Write('session.lock', b'')
+    dimensions = ['region', 'DIM-1/region', 'DIM1/region']
+    for i in range(regions):
+        folder = os.path.join(world, dimensions[i % len(dimensions)])
+        os.makedirs(folder, exist_ok=True)
+        total += WriteRegion(os.path.join(folder, f'r.{i // len(dimensions)}.{i % 7}.mca'), rng, region_size, 1000)
+        files += 1
+    for i in range(playerdata):
+        uuid = f'{rng.getrandbits(128):032x}'
+        Write(f'playerdata/{uuid}.dat', RandomBytes(rng, rng.randint(1024, 8192)))
+        Write(f'stats/{uuid}.json', json.dumps({'stats': {'minecraft:custom': {'minecraft:play_time': i}}}).encode())
+    for i in range(datapacks):
+        Write(f'datapacks/pack{i}/pack.mcmeta', b'{"pack": {"pack_format": 26, "description": ""}}')
+        for j in range(datapack_files):
+            Write(f'datapacks/pack{i}/data/bench/functions/f{j}.mcfunction', f'say {i} {j}\n'.encode() * 20)
+    return {'files': files, 'bytes': total}
+
+
+def MutateWorld(world, fraction=0.05, seed=1):
+    """
+    模拟主服运行一段时间后的变化：原地重写部分区块并更新时间戳，改写部分玩家数据
+    :param world: 存档路径
+    :param fraction: 被修改的区块与玩家数据的比例
+    :param seed: 随机种子
+    :return: 被修改的区块数
+    """
+    rng = random.Random(seed)
+    changed = 0
+    for root, _, names in os.walk(world):
+        for name in names:
+            file_path = os.path.join(root, name)
+            if name.endswith('.mca'):
+                header = anvil.ReadHeader(file_path)
+                if header is None:
+                    continue
+                locations, timestamps = header
+                with open(file_path, 'r+b') as f:
+                    for index, (offset, count) in enumerate(locations):
+                        if offset == 0 or rng.random() >= fraction:
+                            continue
+                        f.seek(offset * anvil.SECTOR_SIZE)
+                        f.write(ChunkData(rng, count))
+                        f.seek(anvil.SECTOR_SIZE + index * 4)
+                        f.write(struct.pack('>I', timestamps[index] + 1))
+                        changed += 1
+            elif name.endswith('.dat') and root.endswith('playerdata') and rng.random() < fraction:
+                with open(file_path, 'wb') as f:
+                    f.write(RandomBytes(rng, rng.randint(1024, 8192)))
+    return changed
@@ -1,6 +1,7 @@
 from mcdreforged.api.all import *
 
 from . import my_lib
+from .my_lib import GetAllStatus, GetStatus, RconExecute, RconExecuteBatch
 
 
 def on_load(server: PluginServerInterface, old):
@@ -11,6 +12,8 @@ def on_load(server: PluginServerInterface, old):
     :return:
     """
     server.logger.info('[MSC]插件已加载')
+    if old is not None:
+        my_lib.AdoptProcesses(old.my_lib)
     my_lib.register(server)
 
 
@@ -20,6 +23,13 @@ def on_unload(server: PluginServerInterface):
     :param server: 本次实例
     :return:
     """
+    my_lib.StopConfigWatch()
+    my_lib.StopCommandPool()
+    my_lib.StopReceiver()
+    my_lib.StopMetrics()
+    my_lib.StopAutoSync()
+    my_lib.WorldWatchers.Close()
+    my_lib.RconConnections.Close()
     server.logger.info('[MSC]插件已被卸载')
 
 
@@ -32,6 +42,7 @@ def on_info(server: PluginServerInterface, info: Info):
     """
     # if not info.is_user and re.fullmatch(r'Starting Minecraft server on \S*', info.content):
     #     server.logger.info('Minecraft is starting at address {}'.format(info.content.rsplit(' ', 1)[1]))
+    my_lib.OnInfo(server, info)
 
 
 def on_user_info(server: PluginServerInterface, info: Info):
@@ -0,0 +1,124 @@
+import os
+import shutil
+import struct
+
+"""
+Anvil 区域文件（.mca）工具
+文件头由 4KiB 的区块位置表与 4KiB 的区块时间戳表组成，之后按 4KiB 扇区存放区块数据
+"""
+
+# 扇区大小
+SECTOR_SIZE = 4096
+# 每个区域文件包含的区块数（32 * 32）
+CHUNK_COUNT = 1024
+# 文件头大小（位置表 + 时间戳表）
+HEADER_SIZE = SECTOR_SIZE * 2
+# 需要重写的数据超过文件大小的该比例时，直接整文件复制更划算
+DELTA_MAX_RATIO = 0.5
+
+
+def ParseHeader(header):
+    """
+    解析区域文件头
+    :param header: 文件开头的 8KiB 数据
+    :return: (位置表 [(起始扇区, 扇区数)], 时间戳表 [时间戳])，格式不正确时返回 None
+    """
+    if len(header) < HEADER_SIZE:
+        return None
+    raw_locations = struct.unpack(f'>{CHUNK_COUNT}I', header[:SECTOR_SIZE])
+    timestamps = list(struct.unpack(f'>{CHUNK_COUNT}I', header[SECTOR_SIZE:HEADER_SIZE]))
+    locations = [(loc >> 8, loc & 0xFF) for loc in raw_locations]
+    return locations, timestamps
+
+
+def ReadHeader(file_path):
+    """
+    读取区域文件头
+    :param file_path: 区域文件路径
+    :return: 同 ParseHeader，文件不存在或格式不正确时返回 None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            return ParseHeader(f.read(HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def ChunkRanges(src_header, dst_header, file_size, dst_size):
+    """
+    计算需要从源文件重写到目标文件的扇区范围
+    位置与时间戳都一致的区块认为没有变化，其余存在于源文件中的区块都需要重写
+    :param src_header: 源文件头（ParseHeader 的结果）
+    :param dst_header: 目标文件头（ParseHeader 的结果）
+    :param file_size: 源文件大小
+    :param dst_size: 目标文件大小
+    :return: 合并后的字节范围 [(起始, 结束)]，源文件位置表越界时返回 None
+    """
+    src_locations, src_timestamps = src_header
+    dst_locations, dst_timestamps = dst_header
+    ranges = []
+    for i in range(CHUNK_COUNT):
+        offset, count = src_locations[i]
+        if offset == 0 or count == 0:
+            continue
+        start, end = offset * SECTOR_SIZE, (offset + count) * SECTOR_SIZE
+        if offset < 2 or start >= file_size:
+            return None
+        if src_locations[i] == dst_locations[i] and src_timestamps[i] == dst_timestamps[i] and end <= dst_size:
+            continue
+        ranges.append((start, min(end, file_size)))
+
+    # 合并相邻的范围，减少读写次数
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def DeltaCopy(src, dst, limiter=None, check=None):
+    """
+    区块级增量同步：只重写时间戳发生变化（或位置变化）的区块所在扇区，再写入源文件头
+    目标文件需要已存在，且不能与其他文件共享数据（硬链接），否则返回 None 交给调用方整文件复制
+    :param src: 源区域文件
+    :param dst: 目标区域文件
+    :param limiter: throttle.IoLimiter，每个连续的扇区范围计一次读写
+    :param check: 等待限速期间调用的检查函数
+    :return: 实际写入的字节数，无法增量同步时返回 None
+    """
+    try:
+        src_stat = os.stat(src)
+        dst_stat = os.stat(dst)
+    except OSError:
+        return None
+    if dst_stat.st_nlink > 1 or src_stat.st_size < HEADER_SIZE or dst_stat.st_size < HEADER_SIZE:
+        return None
+
+    with open(src, 'rb') as fsrc:
+        src_raw = fsrc.read(HEADER_SIZE)
+        src_header = ParseHeader(src_raw)
+        dst_header = ReadHeader(dst)
+        if src_header is None or dst_header is None:
+            return None
+        ranges = ChunkRanges(src_header, dst_header, src_stat.st_size, dst_stat.st_size)
+        if ranges is None:
+            return None
+        written = sum(end - start for start, end in ranges) + HEADER_SIZE
+        if written > src_stat.st_size * DELTA_MAX_RATIO:
+            return None
+
+        with open(dst, 'r+b') as fdst:
+            for start, end in ranges:
+                if limiter is not None:
+                    limiter.Consume(end - start, 1, check)
+                fsrc.seek(start)
+                fdst.seek(start)
+                fdst.write(fsrc.read(end - start))
+            fdst.seek(0)
+            fdst.write(src_raw)
+            fdst.truncate(src_stat.st_size)
+    shutil.copystat(src, dst)
+    return written
@@ -0,0 +1,154 @@
+import threading
+import time
+
+"""
+自动同步
+按每台服务器配置的间隔定时触发同步，或在主服保存后触发（去抖动：连续保存只在最后一次保存后等待一段时间再同步）；
+同步前比较主服存档的签名，与上一次自动同步后相同则跳过
+"""
+
+# 检查是否到期的间隔（秒）
+TICK = 1
+# 保存后触发时的默认等待时间（秒）
+DEBOUNCE = 60
+
+
+class AutoSync:
+    """
+    自动同步调度：只负责决定什么时候触发，实际的同步由 submit 提交为任务
+    """
+
+    def __init__(self, submit, tick=TICK, logger=None):
+        """
+        :param submit: 触发同步的函数，参数为 (服务器名字, 触发原因)
+        :param tick: 检查间隔（秒）
+        :param logger: 日志，记录提交同步时出现的异常
+        """
+        self.submit = submit
+        self.tick = tick
+        self.logger = logger
+        self.lock = threading.Lock()
+        # {服务器名字: {'interval': 定时间隔, 'on_save': 是否保存后触发, 'debounce': 保存后等待时间}}
+        self.settings = {}
+        # 定时同步的下一次时间 {服务器名字: monotonic}
+        self.next_run = {}
+        # 保存后等待中的同步 {服务器名字: monotonic}
+        self.pending = {}
+        # 上一次自动同步后主服存档的签名
+        self.signatures = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def Configure(self, settings):
+        """
+        更新配置，间隔没有改变的服务器保留原来的下一次同步时间
+        :param settings: {服务器名字: {'interval', 'on_save', 'debounce'}}
+        :return: None
+        """
+        now = time.monotonic()
+        with self.lock:
+            for server_name, setting in settings.items():
+                old = self.settings.get(server_name)
+                if setting['interval'] <= 0:
+                    self.next_run.pop(server_name, None)
+                elif old is None or old['interval'] != setting['interval'] or server_name not in self.next_run:
+                    self.next_run[server_name] = now + setting['interval']
+                if not setting['on_save']:
+                    self.pending.pop(server_name, None)
+            for server_name in set(self.settings) - set(settings):
+                self.next_run.pop(server_name, None)
+                self.pending.pop(server_name, None)
+            self.settings = settings
+
+    def Enabled(self):
+        """
+        是否有服务器开启了自动同步
+        :return: 是否开启
+        """
+        with self.lock:
+            return any(setting['interval'] > 0 or setting['on_save'] for setting in self.settings.values())
+
+    def OnSave(self):
+        """
+        主服保存完毕，重新开始等待
+        :return: None
+        """
+        now = time.monotonic()
+        with self.lock:
+            for server_name, setting in self.settings.items():
+                if setting['on_save']:
+                    self.pending[server_name] = now + setting['debounce']
+
+    def Due(self, now=None):
+        """
+        取出已到期的同步
+        :param now: 当前时间（monotonic）
+        :return: [(服务器名字, 触发原因)]
+        """
+        now = time.monotonic() if now is None else now
+        due = {}
+        with self.lock:
+            for server_name, when in list(self.pending.items()):
+                if when <= now:
+                    del self.pending[server_name]
+                    due[server_name] = 'save'
+            for server_name, when in self.next_run.items():
+                if when <= now:
+                    # 错过的多次定时同步只补一次
+                    interval = self.settings[server_name]['interval']
+                    self.next_run[server_name] = max(when + interval, now)
+                    due.setdefault(server_name, 'schedule')
+        return list(due.items())
+
+    def Changed(self, server_name, signature):
+        """
+        主服存档是否在上一次自动同步之后发生了变化
+        :param server_name: 服务器名字
+        :param signature: 当前签名
+        :return: 是否变化（没有记录时视为变化）
+        """
+        with self.lock:
+            return self.signatures.get(server_name) != signature
+
+    def Synced(self, server_name, signature):
+        """
+        记录同步完成后主服存档的签名
+        :param server_name: 服务器名字
+        :param signature: 签名
+        :return: None
+        """
+        with self.lock:
+            self.signatures[server_name] = signature
+
+    def Run(self):
+        """
+        调度线程
+        :return: None
+        """
+        while not self.stop_event.wait(self.tick):
+            for server_name, reason in self.Due():
+                try:
+                    self.submit(server_name, reason)
+                except Exception:
+                    # 单次提交失败不影响调度线程，记录下来以便排查
+                    if self.logger is not None:
+                        self.logger.exception(f'[MSC] 提交{server_name}的自动同步时出现异常')
+
+    def Start(self):
+        """
+        启动调度线程
+        :return: None
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.Run, name='MSC-AutoSync', daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        """
+        停止调度线程
+        :return: None
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
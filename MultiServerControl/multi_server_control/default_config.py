@@ -14,11 +14,73 @@ DEFAULT_CONFIG = \
             "stop": 2,
             "show": 1,
             "status": 1,
+            "verify": 1,
+            "verify_world": 1,
+            "versions": 1,
+            "rollback": 2,
+            "jobs": 1,
+            "cancel": 2,
+            "exec": 3,
+            "log": 2,
+            "top": 1,
+            "create": 3,
+        },
+        "max_disk_jobs": 2,
+        "command_workers": 4,
+        "config_watch_interval": 2,
+        "status_ttl": 5,
+        "groups": {
+            "sub": ["mirror", "create"]
+        },
+        "group_parallelism": 4,
+        "log_lines": 500,
+        "metrics_enable": True,
+        "metrics_interval": 5,
+        "metrics_samples": 720,
+        "progress_interval": 10,
+        "sync_log": "./logs/MultiServerControl_sync.jsonl",
+        "auto_sync_save_pattern": "Saved the (game|world)",
+        "lag_pattern": "Can't keep up! Is the server overloaded\\? Running (\\d+)ms or (\\d+) ticks behind",
+        "world_watch": {
+            "enable": False,
+            "mode": "auto",
+            "poll_interval": 30,
+            "max_dirty": 100000
+        },
+        "receiver": {
+            "enable": False,
+            "host": "0.0.0.0",
+            "port": 25590,
+            "token": "change_me",
+            "targets": {
+                "mirror": "./Mirror/server"
+            }
+        },
+        "templates": {
+            "test": {
+                "dir": "./Templates/test",
+                "root": ".",
+                "link": ["*.jar", "server/libraries/", "server/versions/", "server/cache/", "server/.paper-remapped/"],
+                "ignore": ["session.lock", "logs", "crash-reports"],
+                "port_min": 25600,
+                "port_max": 25699,
+                "server": {
+                    "description": "测试服务器",
+                    "can_sync": True,
+                    "ready_probe": "rcon",
+                    "sync_mode": "full",
+                    "sync_strategy": "reflink"
+                }
+            }
         },
         "mirror": {
             "can_sync": True,
             "description": "镜像服务器",
             "port": 25566,
+            "ready_probe": "slp",
+            "start_timeout": 180,
+            "stop_timeout": 60,
+            "auto_restart": False,
             "rcon": {
                 "enable": True,
                 "host": "127.0.0.1",
@@ -27,15 +89,58 @@ DEFAULT_CONFIG = \
             },
             "source": "./server",
             "target": "./Mirror/server",
+            "remote": {
+                "enable": False,
+                "host": "127.0.0.1",
+                "port": 25590,
+                "token": "change_me"
+            },
+            "sync_workers": 1,
+            "sync_strategy": "copy",
+            "io_limit": {
+                "mb_per_sec": 0,
+                "iops": 0,
+                "adaptive": False,
+                "fadvise": False
+            },
+            "two_phase_sync": False,
+            "save_wait_timeout": 60,
+            "sync_mode": "full",
+            "hash_check": False,
+            "region_delta": False,
             "ignore_files": [
                 "pca.conf",
                 "carpet.conf"
-            ]
+            ],
+            "worlds": ["world"],
+            "include": [],
+            "exclude": [],
+            "region_bbox": None,
+            "versions": {
+                "keep": 0,
+                "max_size_mb": 0
+            },
+            "auto_sync": {
+                "interval": 0,
+                "on_save": False,
+                "debounce": 60
+            },
+            "verify": {
+                "before_sync": False,
+                "after_sync": False,
+                "sample": 2,
+                "workers": 0,
+                "processes": False
+            }
         },
         "create": {
             "can_sync": False,
             "description": "创造服务器",
             "port": 25567,
+            "ready_probe": "slp",
+            "start_timeout": 180,
+            "stop_timeout": 60,
+            "auto_restart": False,
             "rcon": {
                 "enable": False,
                 "host": "127.0.0.1",
@@ -44,16 +149,63 @@ DEFAULT_CONFIG = \
             },
             "source": "./server",
             "target": "./Create/server",
+            "remote": {
+                "enable": False,
+                "host": "127.0.0.1",
+                "port": 25590,
+                "token": "change_me"
+            },
+            "sync_workers": 1,
+            "sync_strategy": "copy",
+            "io_limit": {
+                "mb_per_sec": 0,
+                "iops": 0,
+                "adaptive": False,
+                "fadvise": False
+            },
+            "two_phase_sync": False,
+            "save_wait_timeout": 60,
+            "sync_mode": "full",
+            "hash_check": False,
+            "region_delta": False,
             "ignore_files": [
                 "pca.conf",
                 "carpet.conf"
-            ]
+            ],
+            "worlds": ["world"],
+            "include": [],
+            "exclude": [
+                "stats/",
+                "advancements/",
+                "playerdata/"
+            ],
+            "region_bbox": None,
+            "versions": {
+                "keep": 0,
+                "max_size_mb": 0
+            },
+            "auto_sync": {
+                "interval": 0,
+                "on_save": False,
+                "debounce": 60
+            }
         }
     }
 
 PLUGIN_METADATA = "1.0.1"
 
-START_WAIT_TIME = 10
+# 配置文件路径
+CONFIG_PATH = "./config/MultiServerControl.json"
+
+# 等待子服启动完毕/完全关闭的默认最长时间（秒）
+START_TIMEOUT = 180
+STOP_TIMEOUT = 60
+
+# 主服保存完毕时输出的内容（save-all 之后）
+SAVE_COMPLETE_PATTERN = r'Saved the (game|world)'
+
+# 主服卡顿时输出的内容
+LAG_PATTERN = r"Can't keep up! Is the server overloaded\? Running (\d+)ms or (\d+) ticks behind"
 
 # 默认帮助信息
 HELP_MSG = '''{:=^50}
@@ -65,9 +217,21 @@ HELP_MSG = '''{:=^50}
 §b!!msc restart §e<server_name> §bsync  §f-- §6对目标服务器进行同步并重启
 §b!!msc sync §e<server_name>  §f-- §6对目标服务器进行同步
 §b!!msc start §e<server_name>  §f-- §6启动目标服务器
-§b!!msc stop §e<server_name>  §f-- §6关闭目标服务器（需要开启Rcon）
+§b!!msc stop §e<server_name>  §f-- §6关闭目标服务器（需要开启Rcon或由插件启动）
 §b!!msc show §e<server_name>  §f-- §6查看目标服务器信息
-§b!!msc status §e<server_name>  §f-- §6查询目标服务器的状态
+§b!!msc status  §f-- §6同时查询所有服务器的状态
+§b!!msc status §e<server_name>  §f-- §6查询目标服务器的状态（在线人数/版本/延迟）
+§b!!msc verify §e<server_name>  §f-- §6检查目标服务器存档与上次同步时是否一致
+§b!!msc verify-world §e<server_name>  §f-- §6检查目标服务器存档的完整性（level.dat与区域文件）
+§b!!msc versions §e<server_name>  §f-- §6查看目标服务器存档的历史版本
+§b!!msc rollback §e<server_name> §7[n]  §f-- §6把目标服务器存档回滚到n次同步之前（默认1）
+§b!!msc exec §e<server_name> <command>  §f-- §6通过Rcon在目标服务器执行命令并显示返回内容
+§7start/stop/restart/sync/exec 的 §e<server_name> §7可以是 §eall §7或配置中的服务器组名
+§b!!msc log §e<server_name> §7[lines]  §f-- §6查看由插件启动的目标服务器最近的控制台输出
+§b!!msc top  §f-- §6查看由插件启动的服务器的CPU、内存、线程与磁盘读写
+§b!!msc jobs  §f-- §6查看任务队列
+§b!!msc cancel §e<job_id>  §f-- §6取消排队中或正在执行的任务
+§b!!msc create §e<name> §bfrom §e<template>  §f-- §6用模板创建新的子服（自动分配端口与Rcon）
 {:=^50}
 §lBy：§6§lMorning_Maple
 ''' \
@@ -0,0 +1,48 @@
+"""
+任务的消息出口
+由命令触发的任务把进度与结果回复给执行命令的玩家或控制台，不再在游戏内广播；
+自动同步等没有命令源的任务仍通过 say 广播
+execute 与 logger 与插件实例相同，任务函数照常通过它在主服执行 save-off 等命令
+"""
+
+
+class Feedback:
+    """
+    包装插件实例与命令源，供任务函数代替插件实例使用
+    """
+
+    def __init__(self, interface, source=None):
+        """
+        :param interface: 插件实例
+        :param source: 执行命令的命令源，None 表示没有命令源（自动任务）
+        """
+        self.interface = interface
+        self.source = source
+
+    @property
+    def logger(self):
+        return self.interface.logger
+
+    def execute(self, command):
+        """
+        在主服执行命令
+        :param command: 命令
+        :return: None
+        """
+        self.interface.execute(command)
+
+    def Reply(self, message, broadcast=True):
+        """
+        回复消息：有命令源时只回复给命令源，否则在游戏内广播
+        回复失败（例如玩家已下线）时只记录日志，不影响任务
+        :param message: 消息
+        :param broadcast: 没有命令源时是否广播，为 False 时不输出
+        :return: None
+        """
+        try:
+            if self.source is not None:
+                self.source.reply(message)
+            elif broadcast:
+                self.interface.execute(f'say {message}')
+        except Exception as e:
+            self.interface.logger.warning(f'[MSC] 回复消息失败：{e}')
@@ -0,0 +1,219 @@
+import collections
+import itertools
+import threading
+import time
+
+"""
+任务调度
+同一台服务器上的任务按提交顺序依次执行，不同服务器的任务可以并行；
+同步等读写大量磁盘的任务另外受全局并发数限制
+"""
+
+# 等待执行时检查取消标志的间隔（秒）
+WAIT_INTERVAL = 0.5
+# 保留的已结束任务数量
+HISTORY_SIZE = 20
+
+STATE_NAMES = {
+    'queued': '§e排队中',
+    'running': '§a执行中',
+    'done': '§2已完成',
+    'failed': '§c失败',
+    'cancelled': '§7已取消',
+}
+
+
+class JobCancelled(Exception):
+    """
+    任务在执行过程中被取消
+    """
+    pass
+
+
+class Job:
+    """
+    一个排队执行的任务
+    """
+
+    def __init__(self, job_id, server_name, kind, disk):
+        self.id = job_id
+        self.server_name = server_name
+        self.kind = kind
+        self.disk = disk
+        self.state = 'queued'
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        # 开始执行时的配置快照，执行期间重载配置不影响该任务
+        self.config = None
+        self.cancel_event = threading.Event()
+        self.done_event = threading.Event()
+
+    def CheckCancelled(self):
+        """
+        任务已被取消时抛出 JobCancelled，供长时间运行的任务在适当的位置调用
+        :return: None
+        """
+        if self.cancel_event.is_set():
+            raise JobCancelled()
+
+    def Wait(self, timeout=None):
+        """
+        等待任务结束
+        :param timeout: 超时（秒）
+        :return: 任务是否已结束
+        """
+        return self.done_event.wait(timeout)
+
+    def Describe(self):
+        """
+        生成可以直接输出到游戏内的任务描述
+        :return: 描述文本
+        """
+        if self.started is None:
+            elapsed = ''
+        else:
+            elapsed = f' §7{(self.finished or time.time()) - self.started:.1f}秒'
+        text = f'§b#{self.id} §6{self.server_name} §f{self.kind} {STATE_NAMES[self.state]}{elapsed}'
+        if self.error:
+            text += f' §c{self.error}'
+        return text
+
+
+class Scheduler:
+    """
+    按服务器串行、全局限制磁盘并发的任务调度器
+    """
+
+    def __init__(self, max_disk_jobs=2, snapshot=None):
+        """
+        :param max_disk_jobs: 同时执行的磁盘任务（同步等）上限
+        :param snapshot: 任务开始执行时调用，返回值保存在 job.config
+        """
+        self.max_disk_jobs = max(1, max_disk_jobs)
+        self.snapshot = snapshot
+        self.cond = threading.Condition()
+        self.ids = itertools.count(1)
+        self.jobs = collections.OrderedDict()
+        self.queues = collections.defaultdict(collections.deque)
+        self.disk_running = 0
+
+    def Submit(self, server_name, kind, func, *args, disk=False):
+        """
+        提交任务，任务在独立线程中等待轮到自己后执行 func(job, *args)，返回值保存在 job.result
+        :param server_name: 任务所属的服务器
+        :param kind: 任务类型（sync/start/stop/restart 等）
+        :param func: 任务函数，第一个参数为 Job
+        :param args: 任务函数的其余参数
+        :param disk: 是否为磁盘任务
+        :return: Job
+        """
+        with self.cond:
+            job = Job(next(self.ids), server_name, kind, disk)
+            self.jobs[job.id] = job
+            self.queues[server_name].append(job)
+            self.Prune()
+        threading.Thread(target=self.Run, args=(job, func, args), name=f'MSC-Job-{job.id}', daemon=True).start()
+        return job
+
+    def Run(self, job, func, args):
+        """
+        任务线程：排队、执行并记录结果
+        :param job: 任务
+        :param func: 任务函数
+        :param args: 任务函数的其余参数
+        :return: None
+        """
+        with self.cond:
+            while not self.Ready(job):
+                if job.cancel_event.is_set():
+                    self.queues[job.server_name].remove(job)
+                    self.Finish(job, 'cancelled')
+                    return
+                self.cond.wait(WAIT_INTERVAL)
+            if job.disk:
+                self.disk_running += 1
+            job.state = 'running'
+            job.started = time.time()
+            if self.snapshot is not None:
+                job.config = self.snapshot()
+
+        state = 'done'
+        try:
+            job.result = func(job, *args)
+        except JobCancelled:
+            state = 'cancelled'
+        except Exception as e:
+            state = 'cancelled' if job.cancel_event.is_set() else 'failed'
+            job.error = str(e)
+        finally:
+            with self.cond:
+                self.queues[job.server_name].popleft()
+                if job.disk:
+                    self.disk_running -= 1
+                self.Finish(job, state)
+
+    def Ready(self, job):
+        """
+        任务是否可以开始执行：排在该服务器队首，磁盘任务还需要有空闲的名额
+        :param job: 任务
+        :return: 是否可以执行
+        """
+        if self.queues[job.server_name][0] is not job:
+            return False
+        return not job.disk or self.disk_running < self.max_disk_jobs
+
+    def Finish(self, job, state):
+        """
+        标记任务结束并唤醒其他等待中的任务（调用时需持有 cond）
+        :param job: 任务
+        :param state: 结束状态
+        :return: None
+        """
+        job.state = state
+        job.finished = time.time()
+        job.done_event.set()
+        self.cond.notify_all()
+
+    def Prune(self):
+        """
+        只保留最近的若干个已结束任务（调用时需持有 cond）
+        :return: None
+        """
+        finished = [job_id for job_id, job in self.jobs.items() if job.done_event.is_set()]
+        for job_id in finished[:max(0, len(finished) - HISTORY_SIZE)]:
+            del self.jobs[job_id]
+
+    def Cancel(self, job_id):
+        """
+        取消任务：排队中的任务直接取消，执行中的任务在下一个检查点停止
+        :param job_id: 任务ID
+        :return: 被取消的任务，不存在或已结束时返回 None
+        """
+        with self.cond:
+            job = self.jobs.get(job_id)
+            if job is None or job.done_event.is_set():
+                return None
+            job.cancel_event.set()
+            self.cond.notify_all()
+            return job
+
+    def List(self):
+        """
+        列出未结束的任务与最近结束的任务
+        :return: [Job]
+        """
+        with self.cond:
+            return list(self.jobs.values())
+
+    def Busy(self, server_name, kind=None):
+        """
+        该服务器是否有未结束的任务
+        :param server_name: 服务器名字
+        :param kind: 只统计该类型的任务，None 表示全部
+        :return: 是否有未结束的任务
+        """
+        with self.cond:
+            return any(kind is None or job.kind == kind for job in self.queues[server_name])
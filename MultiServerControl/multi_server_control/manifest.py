@@ -0,0 +1,164 @@
+import base64
+import json
+import os
+
+from . import anvil, world_sync
+
+"""
+镜像服存档清单
+记录上一次成功同步后目标存档中每个文件的大小、修改时间、哈希与区块时间戳，
+下一次同步时直接与清单比较，而不需要重新扫描目标存档
+"""
+
+# 清单文件名（位于目标服务器文件夹下，与 world 同级），其他存档（例如 world_nether）为 .msc_manifest.<存档名>.json
+MANIFEST_NAME = '.msc_manifest.json'
+MANIFEST_VERSION = 1
+
+
+def ManifestPath(target, world='world'):
+    """
+    获取清单文件路径
+    :param target: 目标服务器文件夹
+    :param world: 存档文件夹名
+    :return: 清单文件路径
+    """
+    if world == 'world':
+        return os.path.join(target, MANIFEST_NAME)
+    return os.path.join(target, f'.msc_manifest.{world}.json')
+
+
+def LoadManifest(target, allow_dirty=False, world='world'):
+    """
+    读取清单，清单不存在、损坏或已被标记为失效时返回 None
+    :param target: 目标服务器文件夹
+    :param allow_dirty: 是否允许读取已被标记为失效的清单
+    :param world: 存档文件夹名
+    :return: 清单内容
+    """
+    try:
+        with open(ManifestPath(target, world), 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if data.get('version') != MANIFEST_VERSION or (data.get('dirty') and not allow_dirty):
+        return None
+    return data
+
+
+def SaveManifest(target, data, world='world'):
+    """
+    原子地写入清单（先写临时文件再替换）
+    :param target: 目标服务器文件夹
+    :param data: 清单内容
+    :param world: 存档文件夹名
+    :return: None
+    """
+    file_path = ManifestPath(target, world)
+    temp = file_path + world_sync.TEMP_SUFFIX
+    with open(temp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp, file_path)
+
+
+def MarkDirty(target, worlds=('world',)):
+    """
+    把清单标记为失效（例如子服启动后会修改存档），下一次同步会重新扫描目标存档
+    :param target: 目标服务器文件夹
+    :param worlds: 存档文件夹名列表
+    :return: None
+    """
+    for world in worlds:
+        try:
+            with open(ManifestPath(target, world), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if not data.get('dirty'):
+            data['dirty'] = True
+            SaveManifest(target, data, world)
+
+
+def KnownState(data):
+    """
+    把清单转换成与 world_sync.ScanTree 相同格式的目标存档状态
+    :param data: 清单内容
+    :return: (文件字典, 目录集合)
+    """
+    files = {rel: (entry['size'], entry['mtime']) for rel, entry in data['files'].items()}
+    return files, set(data['dirs'])
+
+
+def BuildManifest(world, files, dirs, previous=None, hash_check=False):
+    """
+    根据同步后的目标存档生成清单
+    大小与修改时间没变的文件沿用上一份清单中的哈希与区块时间戳，其余文件只在开启 hash_check 时计算哈希
+    :param world: 目标存档路径
+    :param files: 文件字典 {相对路径: (大小, 修改时间ns)}
+    :param dirs: 目录集合
+    :param previous: 上一份清单
+    :param hash_check: 是否计算文件哈希
+    :return: 清单内容
+    """
+    old_files = previous['files'] if previous else {}
+    entries = {}
+    for rel, (size, mtime) in files.items():
+        old = old_files.get(rel)
+        file_hash = None
+        unchanged = old is not None and old['size'] == size and old['mtime'] == mtime
+        if unchanged:
+            file_hash = old.get('hash')
+        if file_hash is None and hash_check:
+            file_hash = world_sync.FileHash(os.path.join(world, rel))
+        entry = {'size': size, 'mtime': mtime, 'hash': file_hash}
+        if rel.endswith('.mca'):
+            entry['chunks'] = old.get('chunks') if unchanged and old.get('chunks') else \
+                ChunkTimestamps(os.path.join(world, rel))
+        entries[rel] = entry
+    return {'version': MANIFEST_VERSION, 'dirty': False, 'files': entries, 'dirs': sorted(dirs)}
+
+
+def ChunkTimestamps(file_path):
+    """
+    读取区域文件的区块时间戳表
+    :param file_path: 区域文件路径
+    :return: base64 编码的 4KiB 时间戳表，文件头不完整时返回 None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            header = f.read(anvil.HEADER_SIZE)
+    except OSError:
+        return None
+    if len(header) < anvil.HEADER_SIZE:
+        return None
+    return base64.b64encode(header[anvil.SECTOR_SIZE:anvil.HEADER_SIZE]).decode('ascii')
+
+
+def Verify(target, world, ignore, scope=None):
+    """
+    检查目标存档与清单是否一致
+    修改时间不同但大小一致且清单中有哈希的文件，会再比较一次哈希
+    :param target: 目标服务器文件夹
+    :param world: 存档文件夹名
+    :param ignore: 忽略列表
+    :param scope: SyncScope，范围外的文件不检查
+    :return: (缺失文件列表, 多出文件列表, 被修改文件列表)，没有清单时返回 None
+    """
+    data = LoadManifest(target, True, world)
+    if data is None:
+        return None
+    world = os.path.join(target, world)
+    files, _ = world_sync.ScanTree(world, ignore, scope)
+    missing = sorted(rel for rel in data['files'] if rel not in files)
+    extra = sorted(rel for rel in files if rel not in data['files'])
+    changed = []
+    for rel, (size, mtime) in files.items():
+        entry = data['files'].get(rel)
+        if entry is None or (entry['size'], entry['mtime']) == (size, mtime):
+            continue
+        if entry['size'] == size and entry.get('hash') and \
+                world_sync.FileHash(os.path.join(world, rel)) == entry['hash']:
+            continue
+        changed.append(rel)
+    return missing, extra, sorted(changed)
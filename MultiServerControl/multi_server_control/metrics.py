@@ -0,0 +1,255 @@
+import array
+import os
+import threading
+import time
+
+"""
+子服资源占用采样
+在独立线程中定期读取 /proc/<pid>/stat 与 /proc/<pid>/io，统计子服进程及其所有子进程
+（子服的 MCDR 与其启动的 Minecraft 服务端）的 CPU、内存、线程数与磁盘读写，
+保存在固定大小、以 array 为底层的环形缓冲区中；仅支持 Linux
+"""
+
+# 默认采样间隔（秒）与每个子服保留的采样数
+SAMPLE_INTERVAL = 5
+SAMPLE_COUNT = 720
+# 记录的指标
+FIELDS = ('time', 'cpu', 'rss', 'threads', 'read_bps', 'write_bps')
+
+try:
+    CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+    PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+except (AttributeError, ValueError, OSError):
+    CLOCK_TICKS = PAGE_SIZE = None
+
+
+def Supported():
+    """
+    当前系统是否支持采样
+    :return: 是否支持
+    """
+    return CLOCK_TICKS is not None and os.path.isdir('/proc/self')
+
+
+def ReadStat(pid):
+    """
+    读取 /proc/<pid>/stat
+    :param pid: 进程ID
+    :return: (父进程ID, CPU 时间（时钟周期）, 线程数, 常驻内存（字节）)
+    """
+    with open(f'/proc/{pid}/stat', 'rb') as f:
+        data = f.read()
+    # 进程名可能包含空格与括号，从最后一个右括号之后开始解析
+    fields = data[data.rindex(b')') + 2:].split()
+    return int(fields[1]), int(fields[11]) + int(fields[12]), int(fields[17]), int(fields[21]) * PAGE_SIZE
+
+
+def ReadIO(pid):
+    """
+    读取 /proc/<pid>/io 中实际读写磁盘的字节数
+    :param pid: 进程ID
+    :return: (读取字节数, 写入字节数)，无权限读取时返回 (0, 0)
+    """
+    read_bytes = write_bytes = 0
+    try:
+        with open(f'/proc/{pid}/io', 'rb') as f:
+            for line in f:
+                if line.startswith(b'read_bytes:'):
+                    read_bytes = int(line.split()[1])
+                elif line.startswith(b'write_bytes:'):
+                    write_bytes = int(line.split()[1])
+    except PermissionError:
+        pass
+    return read_bytes, write_bytes
+
+
+def Children(pid):
+    """
+    读取进程的直接子进程
+    :param pid: 进程ID
+    :return: 子进程ID列表
+    """
+    children = []
+    try:
+        for tid in os.listdir(f'/proc/{pid}/task'):
+            with open(f'/proc/{pid}/task/{tid}/children', 'rb') as f:
+                children.extend(int(child) for child in f.read().split())
+    except OSError:
+        pass
+    return children
+
+
+def ProcessTree(pid):
+    """
+    获取进程及其所有子孙进程
+    :param pid: 进程ID
+    :return: 进程ID列表
+    """
+    tree = [pid]
+    index = 0
+    while index < len(tree):
+        tree.extend(Children(tree[index]))
+        index += 1
+    return tree
+
+
+def ReadTree(pid):
+    """
+    汇总进程树的累计资源占用
+    :param pid: 进程ID
+    :return: (CPU 时间（时钟周期）, 线程数, 常驻内存（字节）, 读取字节数, 写入字节数)，进程不存在时返回 None
+    """
+    ticks = threads = rss = read_bytes = write_bytes = 0
+    found = False
+    for child in ProcessTree(pid):
+        try:
+            _, cpu, count, memory = ReadStat(child)
+            io_read, io_write = ReadIO(child)
+        except (OSError, ValueError, IndexError):
+            continue
+        found = True
+        ticks += cpu
+        threads += count
+        rss += memory
+        read_bytes += io_read
+        write_bytes += io_write
+    return (ticks, threads, rss, read_bytes, write_bytes) if found else None
+
+
+class Series:
+    """
+    一个子服的采样序列，每个指标一个定长 array，写满后覆盖最旧的采样
+    """
+
+    def __init__(self, capacity=SAMPLE_COUNT):
+        self.capacity = capacity
+        self.columns = {field: array.array('d', bytes(8 * capacity)) for field in FIELDS}
+        self.next = 0
+        self.count = 0
+
+    def Append(self, sample):
+        """
+        写入一次采样
+        :param sample: {指标: 值}
+        :return: None
+        """
+        for field in FIELDS:
+            self.columns[field][self.next] = sample[field]
+        self.next = (self.next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def Latest(self):
+        """
+        最近一次采样
+        :return: {指标: 值}，没有采样时返回 None
+        """
+        if not self.count:
+            return None
+        index = (self.next - 1) % self.capacity
+        return {field: column[index] for field, column in self.columns.items()}
+
+    def Values(self, field):
+        """
+        按时间顺序获取某个指标的全部采样
+        :param field: 指标
+        :return: 值列表
+        """
+        column = self.columns[field]
+        if self.count < self.capacity:
+            return column[:self.count].tolist()
+        return column[self.next:].tolist() + column[:self.next].tolist()
+
+
+class Sampler:
+    """
+    在独立线程中定期采样的采样器
+    """
+
+    def __init__(self, targets, interval=SAMPLE_INTERVAL, capacity=SAMPLE_COUNT):
+        """
+        :param targets: 返回 {服务器名字: PID} 的函数
+        :param interval: 采样间隔（秒）
+        :param capacity: 每个子服保留的采样数
+        """
+        self.targets = targets
+        self.interval = interval
+        self.capacity = capacity
+        self.series = {}
+        # 上一次采样的 (时间, 累计值)，用于计算 CPU 占用与读写速率
+        self.previous = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def Sample(self):
+        """
+        对所有子服采样一次
+        :return: None
+        """
+        now = time.monotonic()
+        targets = self.targets()
+        for server_name, pid in targets.items():
+            totals = ReadTree(pid)
+            if totals is None:
+                continue
+            ticks, threads, rss, read_bytes, write_bytes = totals
+            last = self.previous.get(server_name)
+            self.previous[server_name] = (pid, now, totals)
+            # 第一次采样或进程已被重启时只记录累计值
+            if last is None or last[0] != pid:
+                continue
+            elapsed = now - last[1]
+            if elapsed <= 0:
+                continue
+            series = self.series.get(server_name)
+            if series is None:
+                series = self.series[server_name] = Series(self.capacity)
+            series.Append({
+                'time': time.time(),
+                'cpu': max(0, ticks - last[2][0]) / CLOCK_TICKS / elapsed * 100,
+                'rss': rss,
+                'threads': threads,
+                'read_bps': max(0, read_bytes - last[2][3]) / elapsed,
+                'write_bps': max(0, write_bytes - last[2][4]) / elapsed,
+            })
+        for server_name in list(self.previous):
+            if server_name not in targets:
+                del self.previous[server_name]
+
+    def Run(self):
+        """
+        采样线程
+        :return: None
+        """
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.Sample()
+            except Exception:
+                pass
+
+    def Start(self):
+        """
+        启动采样线程
+        :return: None
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.Run, name='MSC-Metrics', daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        """
+        停止采样线程
+        :return: None
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def Latest(self, server_name):
+        """
+        子服最近一次采样
+        :param server_name: 服务器名字
+        :return: {指标: 值}，没有采样时返回 None
+        """
+        series = self.series.get(server_name)
+        return series.Latest() if series is not None else None
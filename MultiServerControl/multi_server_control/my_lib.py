@@ -1,14 +1,17 @@
 import datetime
 import json
 import os
+import re
 import shutil
 import socket
-import subprocess
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from mcdreforged.api.all import *
-from . import default_config
+from . import auto_sync, default_config, feedback, jobs, manifest, metrics, rcon_pool, remote_sync, server_probe, \
+    settings, supervisor, templates, throttle, versions, world_check, world_sync, world_watch
 
 """
 !!msc                               - 命令前缀
@@ -21,45 +24,78 @@ from . import default_config
 !!msc start <server_name>           - 启动目标服务器
 !!msc stop <server_name>            - 关闭目标服务器
 !!msc show <server_name>            - 查看目标服务器信息
-!!msc status <server_name>          - 查看目标服务器状态（正在运行/已关闭）
+!!msc status                        - 同时查看所有服务器的状态
+!!msc status <server_name>          - 查看目标服务器状态（在线人数/版本/延迟）
+!!msc verify <server_name>          - 检查目标服务器存档与上次同步的清单是否一致
+!!msc verify-world <server_name>    - 检查目标服务器存档的完整性（level.dat与区域文件）
+!!msc versions <server_name>        - 查看目标服务器存档的历史版本
+!!msc rollback <server_name> [n]    - 把目标服务器存档回滚到n次同步之前（默认1，0为最近一次同步后的状态）
+!!msc exec <server_name> <command>  - 通过Rcon在目标服务器执行命令
+!!msc log <server_name> [lines]     - 查看由插件启动的目标服务器最近的控制台输出
+!!msc create <name> from <template> - 用模板创建新的子服（自动分配端口与Rcon，立即加入配置）
+（start/stop/restart/sync/exec 的 <server_name> 也可以是 all 或配置中的服务器组名，对组内服务器并行执行）
+!!msc top                           - 查看由插件启动的服务器的资源占用
+!!msc jobs                          - 查看任务队列
+!!msc cancel <job_id>               - 取消任务
 """
 
 # 控制台实例
 InterFace = None
-# 同步标志
-syncFlag = False
-# 重启标志
-restartFlag = False
-# 配置文件内容
+# 任务调度器（同一服务器的任务串行，同步等磁盘任务受全局并发数限制）
+JobScheduler = None
+# 命令处理线程池（命令处理函数都在这里执行，不占用 MCDR 的任务执行线程）
+CommandPool = None
+# 替换命令处理线程池时，避免把命令提交到已关闭的线程池
+CommandPoolLock = threading.Lock()
+# 配置（settings.Config），重载时整体替换为新的对象
 config = None
-# 服务器已配置列表
-server_list = []
-# 插件权限等级
-plugin_level = {}
+# 配置文件修改后自动重载
+ConfigWatch = None
+# 同一时间只进行一次重载
+ReloadLock = threading.Lock()
+# 同一时间只创建一个子服（分配端口与修改配置文件）
+CreateLock = threading.Lock()
 # 插件所在路径与环境
 path = os.getcwd()
 platform = sys.platform
-# 镜像线程
-MirrorProcess = None
-
-# 启动命令
-if platform == "win32":
-    MCDR_Command = "python -m mcdreforged"
-else:
-    MCDR_Command = 'python3 -m mcdreforged'
+# 子服进程管理（记录每个子服的进程与输出）
+Processes = supervisor.Supervisor()
+# 会改写子服存档的任务，这些任务执行或排队期间子服崩溃后不自动重启
+WORLD_JOBS = ("sync", "rollback", "restart")
+# 子服资源占用采样器
+MetricsSampler = None
+# 主服完成保存（输出 Saved the game）时触发
+SavedEvent = threading.Event()
+# 多个同步任务并行时，同一时间只允许一个任务关闭主服保存
+SaveLock = threading.Lock()
+# 远程同步接收端
+Receiver = None
+# 服务器状态缓存（有效期内的重复查询不再探测）
+ServerStatus = server_probe.StatusCache()
+# Rcon 连接池（每台服务器保持一条已登录的连接）
+RconConnections = rcon_pool.RconPool()
+# 自动同步（定时/主服保存后）
+AutoSyncs = None
+# 主服存档变化监视（记录两次同步之间变化的路径）
+WorldWatchers = world_watch.WatchManager()
+# 根据主服卡顿输出调整同步限速
+ServerLag = throttle.LagMonitor()
+
+# 启动命令（使用与主服相同的 Python 解释器）
+MCDR_Command = [sys.executable, "-m", "mcdreforged"]
 
 
 def LoadConfig():
     """
-    配置文件加载函数
+    配置文件加载函数，检查通过后才替换当前配置
     :return:
     """
     print('[MSC] 加载配置文件......')
-    global config, server_list, plugin_level
-    with open("./config/MultiServerControl.json", "r", encoding="utf-8") as file:
-        config = json.load(file)
-    server_list = config.get("server_list", [])
-    plugin_level = config.get("perm", {})
+    global config
+    loaded = settings.Load(default_config.CONFIG_PATH)
+    for warning in loaded.warnings:
+        print(f'[MSC] 配置文件：{warning}')
+    config = loaded
     print('[MSC] 加载完毕')
 
 
@@ -69,7 +105,7 @@ def CreateConfig():
     :return:
     """
     print('[MSC] 创建配置文件中......')
-    with open("./config/MultiServerControl.json", "w", encoding="utf-8") as ff:
+    with open(default_config.CONFIG_PATH, "w", encoding="utf-8") as ff:
         json.dump(default_config.DEFAULT_CONFIG, ff, indent=4, ensure_ascii=False)
     print('[MSC] 成功创建配置文件!')
     LoadConfig()
@@ -80,7 +116,7 @@ def ConfigToDo():
     初始化配置文件
     :return: None
     """
-    if os.path.exists('./config/MultiServerControl.json'):
+    if os.path.exists(default_config.CONFIG_PATH):
         LoadConfig()
     else:
         CreateConfig()
@@ -91,12 +127,29 @@ def ServerNameCheck(server: PluginServerInterface, server_name):
     检查服务器名字是否在配置单中
     :param server:
     :param server_name: 服务器名字
-    :return:
+    :return: 该服务器的配置（settings.ServerConfig），不在配置单中时为 None
     """
-    if server_name not in server_list:
-        server.reply(f"§c{server_name}§f不在已配置的服务器中，已配置的服务器有：§6{'，'.join(server_list)}")
-        return False
-    return True
+    setting = config.servers.get(server_name)
+    if setting is None:
+        server.reply(f"§c{server_name}§f不在已配置的服务器中，已配置的服务器有：§6{'，'.join(config.servers)}")
+    return setting
+
+
+def GroupMembers(name):
+    """
+    获取服务器组的成员，all 表示所有已配置的服务器；同名时服务器优先于组
+    :param name: 组名
+    :return: 服务器名字列表，不是组时返回 None
+    """
+    current = config
+    if name in current.servers:
+        return None
+    if name == "all":
+        return list(current.servers)
+    group = current.groups.get(name)
+    if group is None:
+        return None
+    return [server_name for server_name in group if server_name in current.servers]
 
 
 def GetInterFace(*args):
@@ -110,18 +163,51 @@ def GetInterFace(*args):
     return InterFace
 
 
-def RconInit(server_name):
+def CommandFeedback(server):
+    """
+    由命令触发的任务的消息出口，进度与结果回复给执行命令的玩家或控制台
+    :param server: 命令源
+    :return: feedback.Feedback
+    """
+    return feedback.Feedback(GetInterFace(), server)
+
+
+def RconInit(setting):
     """
     创建Rcon客户端实例
-    :param server_name: 服务器名字
+    :param setting: 服务器配置
     :return:
     """
-    global config
-    rcon = config[server_name]["rcon"]
-    Rcon = RconConnection(rcon["host"], rcon["port"], rcon["password"])
+    rcon = setting.rcon
+    Rcon = RconConnection(rcon.host, rcon.port, rcon.password)
     return Rcon
 
 
+def RconExecuteBatch(server_name, commands):
+    """
+    通过连接池在目标服务器上依次执行多条命令（供其他插件调用）
+    :param server_name: 服务器名字
+    :param commands: 命令列表
+    :return: 每条命令的返回内容列表
+    """
+    setting = config.servers.get(server_name)
+    if setting is None:
+        raise rcon_pool.RconError(f'{server_name}不在已配置的服务器中')
+    if not setting.rcon.enable:
+        raise rcon_pool.RconError(f'{server_name}的Rcon未开启')
+    return RconConnections.Execute(server_name, lambda: RconInit(setting), commands)
+
+
+def RconExecute(server_name, command):
+    """
+    通过连接池在目标服务器上执行一条命令（供其他插件调用）
+    :param server_name: 服务器名字
+    :param command: 命令
+    :return: 命令的返回内容
+    """
+    return RconExecuteBatch(server_name, [command])[0]
+
+
 def DisplayHelp(server: PluginServerInterface, source: CommandContext):
     """
     显示帮助信息
@@ -140,312 +226,1818 @@ def DisplayList(server: PluginServerInterface, source: CommandContext):
     :param source: 命令源
     :return:
     """
-    global server_list
-    server.reply(f"§b[MSC] §e当前已配置的服务器有：§6§l{'，'.join(server_list)}")
+    current = config
+    server.reply(f"§b[MSC] §e当前已配置的服务器有：§6§l{'，'.join(current.servers)}")
+    for group, members in current.groups.items():
+        server.reply(f"§b[MSC] §e服务器组§b{group}§e：§6{'，'.join(members)}")
 
 
-@new_thread("MSC-Sync")
-def ServerSync(InterFace, server_name):
+def IoLimiterOf(setting):
     """
-    同步镜像服的内容
-    :param InterFace:
-    :param server_name: 目标服务器名字
-    :return:
+    按配置创建一次同步使用的读写限速器
+    :param setting: 目标服务器的配置
+    :return: throttle.IoLimiter，没有限速也不丢弃页缓存时为 None
     """
-    global syncFlag, config
+    limit = setting.io_limit
+    bytes_per_sec = int(limit.mb_per_sec * 1024 * 1024)
+    if bytes_per_sec <= 0 and limit.iops <= 0 and not limit.fadvise:
+        return None
+    return throttle.IoLimiter(
+        bytes_per_sec,
+        limit.iops,
+        ServerLag if limit.adaptive else None,
+        limit.fadvise
+    )
 
-    try:
-        syncFlag = True
 
-        port = config[server_name]["port"]
-        host = config[server_name]["rcon"]["host"]
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            try:
-                s.bind((host, port))
-            except OSError:
-                InterFace.execute(f"say §b[MSC] §2服务器§6§l{server_name}§c正在运行§2！请§c关闭后再执行同步§2！")
-                time.sleep(0.5)
-                InterFace.execute(f"say §b[MSC] §d对§6§l{server_name}§d服务器的同步操作§c已经被终止§d......")
-                return
+def SaveSyncManifest(setting, files, dirs, previous, world="world"):
+    """
+    同步成功后写入目标服务器的存档清单
+    :param setting: 目标服务器的配置
+    :param files: 同步后的文件字典
+    :param dirs: 同步后的目录集合
+    :param previous: 上一份清单
+    :param world: 存档文件夹名
+    :return: None
+    """
+    manifest.SaveManifest(
+        setting.target,
+        manifest.BuildManifest(
+            f'{setting.target}/{world}',
+            files,
+            dirs,
+            previous,
+            setting.hash_check
+        ),
+        world
+    )
 
-        start_time = datetime.datetime.now()
 
-        # 需要忽略的文件
-        ignore = config[server_name].get("ignore_files", []) + ["session.lock"]
-        world_temp = f'{config[server_name]["target"]}/world_temp'
-
-        # 检查，目标路径下有world且忽略名单不为空的时候执行
-        target = f'{config[server_name]["target"]}/world'
-        if os.path.exists(target) and ignore:
-            # 创建一个临时文件夹存储忽略文件
-            os.makedirs(world_temp, exist_ok=True)
-            # 寻找忽略文件并且挪到临时文件夹
-            for item in os.listdir(target):
-                item_path = os.path.join(target, item)
-                # 挪到临时文件夹处
-                if os.path.isfile(item_path) and item in ignore:
-                    shutil.copy2(item_path, world_temp)
-            shutil.rmtree(f'{target}/')
-
-        # 同步
-        shutil.copytree(
-            f'{config[server_name]["source"]}/world',
-            f'{config[server_name]["target"]}/world',
-            ignore=shutil.ignore_patterns(*ignore)
-        )
+def PortInUse(setting):
+    """
+    检查目标服务器的端口是否被占用（被占用即视为正在运行）
+    :param setting: 服务器配置
+    :return: 是否被占用
+    """
+    port = setting.port
+    host = setting.rcon.host
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind((host, port))
+            return False
+        except OSError:
+            return True
 
-        # 移动忽略文件返回原处，删掉临时文件夹
-        if os.path.exists(world_temp):
-            for item in os.listdir(world_temp):
-                temp_path = os.path.join(world_temp, item)
-                target_path = os.path.join(target, item)
-                shutil.copy2(temp_path, target_path)
-            shutil.rmtree(world_temp)
 
-        end_time = datetime.datetime.now()
-        InterFace.execute(f"say §b[MSC] §2已同步至§6§l{server_name}§2服务器！用时§a{end_time - start_time}")
-        syncFlag = False
-    except Exception as e:
-        return InterFace.execute(f"say §b[MSC] §c出现异常，请把内容报告给管理员：§f{e}")
-    finally:
-        syncFlag = False
+def ServerActive(setting):
+    """
+    目标服务器是否正在运行或即将运行：端口被占用、由插件启动的进程仍在运行，或崩溃后正在等待自动重启
+    同步与回滚前检查，避免改写正在使用（或即将被重新启动）的存档
+    :param setting: 服务器配置
+    :return: 是否正在运行
+    """
+    return Processes.Running(setting.name) or Processes.RestartPending(setting.name) or PortInUse(setting)
 
 
-def Sync(server: PluginServerInterface, source: CommandContext, InterFaceTemp=None, waiting=False):
+def StatusTarget(setting):
     """
-    服务器同步检查
-    :param server:
-    :param source: 命令源
-    :param InterFaceTemp: 命令源
-    :param waiting: 是否需要等待命令执行完毕（一般同步不需要阻塞）
-    :return:
+    获取探测服务器状态时使用的地址与端口
+    :param setting: 服务器配置
+    :return: (地址, 端口)
     """
-    global InterFace, syncFlag, server_list, config
+    return setting.rcon.host, setting.port
 
-    server_name = source["server_name"]
-    # 检查名字是否在配置单中
-    if not ServerNameCheck(server, server_name):
+
+def GetAllStatus(refresh=False):
+    """
+    同时查询所有已配置服务器的状态（供其他插件调用）
+    :param refresh: 是否忽略缓存重新探测
+    :return: {服务器名字: {'online', 'ready', 'version', 'players', 'max_players', 'motd', 'latency', 'time'}}
+    """
+    return ServerStatus.Fetch(
+        {server_name: StatusTarget(setting) for server_name, setting in config.servers.items()}, refresh
+    )
+
+
+def GetStatus(server_name, refresh=False):
+    """
+    查询单个服务器的状态（供其他插件调用）
+    :param server_name: 服务器名字
+    :param refresh: 是否忽略缓存重新探测
+    :return: 状态，格式同 GetAllStatus
+    """
+    return ServerStatus.Fetch({server_name: StatusTarget(config.servers[server_name])}, refresh)[server_name]
+
+
+def IsRunning(server_name):
+    """
+    服务器是否正在运行：由插件启动的子服直接使用进程状态，
+    其余（在插件外启动的或远程的）端口可以连接即视为正在运行（使用缓存）
+    :param server_name: 服务器名字
+    :return: 是否正在运行
+    """
+    if Processes.Running(server_name):
+        return True
+    return GetStatus(server_name)["online"]
+
+
+def FormatStatus(server_name, status):
+    """
+    生成可以直接输出到游戏内的状态描述
+    :param server_name: 服务器名字
+    :param status: 状态
+    :return: 描述文本
+    """
+    managed = Processes.Get(server_name)
+    process = ''
+    if managed is not None and managed.Running():
+        process = f' §7PID {managed.pid}'
+        if managed.restarts:
+            process += f'，已自动重启{managed.restarts}次'
+    if not status["online"]:
+        if process:
+            return f'§6§l{server_name}§r §e启动中{process}'
+        return f'§6§l{server_name}§r §c关闭'
+    if not status["ready"]:
+        return f'§6§l{server_name}§r §e启动中{process}'
+    return (f'§6§l{server_name}§r §a正在运行 §f{status["players"]}/{status["max_players"]}人 '
+            f'§7{status["version"]} §b{status["latency"]:.0f}ms{process}')
+
+
+def JobServer(job, server_name):
+    """
+    任务开始执行时的配置快照中该服务器的配置，执行期间重载配置不影响正在执行的任务
+    :param job: 当前任务
+    :param server_name: 服务器名字
+    :return: settings.ServerConfig，服务器已从配置中移除时抛出 RuntimeError
+    """
+    setting = job.config.servers.get(server_name)
+    if setting is None:
+        raise RuntimeError(f'{server_name}已从配置中移除')
+    return setting
+
+
+def SyncAborted(InterFace, server_name):
+    """
+    目标服务器正在运行，提示并终止同步
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :return: None
+    """
+    InterFace.Reply(f"§b[MSC] §2服务器§6§l{server_name}§c正在运行§2！请§c关闭后再执行同步§2！")
+    time.sleep(0.5)
+    InterFace.Reply(f"§b[MSC] §d对§6§l{server_name}§d服务器的同步操作§c已经被终止§d......")
+
+
+def SyncReporter(job, InterFace, server_name):
+    """
+    创建同步进度，按配置的间隔向命令源报告进度
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :return: SyncProgress
+    """
+    return world_sync.SyncProgress(
+        lambda progress: InterFace.Reply(f"§b[MSC] §d同步到§6§l{server_name}§d：{progress.Describe()}"),
+        job.config.progress_interval
+    )
+
+
+def WriteSyncLog(record):
+    """
+    把一次同步的结构化记录追加到同步日志（每行一个 JSON）
+    :param record: 记录
+    :return: None
+    """
+    log_path = config.sync_log
+    if not log_path:
         return
+    try:
+        os.makedirs(os.path.dirname(log_path) or ".", exist_ok=True)
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        GetInterFace().logger.warning(f'[MSC] 写入同步日志失败：{e}')
 
-    if InterFaceTemp is None:
-        InterFace = GetInterFace()
-    else:
-        InterFace = InterFaceTemp
-    # 检查此名字下的服务器是否被运行同步
-    can_sync = config[server_name]["can_sync"]
-    if not can_sync:
-        InterFace.execute(
-            f"say §b[MSC] §6{server_name}§f被设置为§c不允许同步§r！！"
+
+def CheckWorlds(job, setting, roots):
+    """
+    按目标服务器的配置检查存档的完整性（只检查同步范围内的文件）
+    :param job: 当前任务，检查期间可以取消
+    :param setting: 目标服务器的配置
+    :param roots: 各存档的路径 {存档文件夹名: 路径}
+    :return: world_check.WorldCheckReport
+    """
+    ignore = setting.ignore_files + ["session.lock"]
+    verify = setting.verify
+    report = world_check.WorldCheckReport()
+    for world, root in roots.items():
+        report.Merge(
+            world_check.VerifyWorld(root, ignore, setting.scope, verify.sample, verify.workers, verify.processes,
+                                    job.CheckCancelled),
+            # 检查多个存档时在路径前加上存档名
+            f'{world}/' if len(roots) > 1 else ''
         )
-        return
+    return report
 
-    if syncFlag:
-        InterFace.execute("say §b[MSC] §e同步中，请勿重复提交同步任务！")
-    else:
-        InterFace.execute(f"say §b[MSC] §d正在同步到§6§l{server_name}§d服务器中......")
-        InterFace.execute('save-off')
-        InterFace.execute('save-all')
-        if waiting:
-            ServerSync(InterFace, server_name).join()
-        else:
-            ServerSync(InterFace, server_name)
-        InterFace.execute('save-on')
+
+def ReportWorldCheck(InterFace, server_name, report, title):
+    """
+    报告存档检查发现的问题
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :param report: world_check.WorldCheckReport
+    :param title: 被检查的存档（例如 主服）
+    :return: None
+    """
+    InterFace.Reply(f"§b[MSC] §6§l{server_name}§c检查{title}存档时发现§e{len(report.problems)}§c个问题：{report.Summary()}")
+    for rel, message in report.problems[:5]:
+        InterFace.Reply(f'§7  {rel or "存档"}：§f{message}')
+    if len(report.problems) > 5:
+        InterFace.Reply(f'§7  ……以及另外{len(report.problems) - 5}个问题')
 
 
-@new_thread("MSC-Start")
-def CommandExecute(InterFace):
+def VerifyAfterSync(job, InterFace, setting, progress, record):
     """
-    服务器执行启动命令函数
+    开启 after_sync 时检查同步后的子服存档，发现问题时提示并记录到同步日志
+    :param job: 当前任务
     :param InterFace:
-    :return:
+    :param setting: 目标服务器的配置
+    :param progress: 同步进度，耗时记录为 verify_target 阶段
+    :param record: 同步记录
+    :return: 是否没有发现问题（未开启时为 True）
+    """
+    if not setting.verify.after_sync:
+        return True
+    with progress.Phase("verify_target"):
+        report = CheckWorlds(job, setting, {world: f'{setting.target}/{world}' for world in setting.worlds})
+    record["verify_target"] = report.Record()
+    if not report.problems:
+        return True
+    ReportWorldCheck(InterFace, setting.name, report, "同步后的子服")
+    if setting.versions.keep > 0:
+        InterFace.Reply(f"§b[MSC] §e本次同步后的存档没有保存为历史版本，可以使用§6!!msc rollback {setting.name} 0§e回到上一次同步后的状态")
+    return False
+
+
+def ServerSync(job, InterFace, server_name, sources=None, progress=None):
+    """
+    同步镜像服的内容（在任务线程中执行）
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :param sources: 各存档的源路径 {存档文件夹名: 路径}，默认为主服的同名存档（两段式同步时为快照路径）
+    :param progress: 同步进度，两段式同步时沿用第一阶段的进度以便一起记录
+    :return: 同步结果：done/aborted（目标服务器正在运行等）
+    """
+    setting = JobServer(job, server_name)
+    progress = progress or SyncReporter(job, InterFace, server_name)
+    remote = setting.remote
+    worlds = setting.worlds
+    scope = setting.scope
+    record = {
+        "time": datetime.datetime.now().isoformat(timespec="seconds"),
+        "server": server_name,
+        "mode": "remote" if remote.enable else setting.sync_mode,
+        "strategy": setting.sync_strategy,
+        "workers": setting.sync_workers,
+        "worlds": worlds,
+        "result": "done",
+    }
+    if scope.Active():
+        record["scope"] = scope.ToDict()
+    limiter = IoLimiterOf(setting)
+    report = None
+    # 已取出脏路径集合的监视名
+    watched = []
+    try:
+        # 远程服务器的端口无法在本机检测，由接收端在写入前检测并拒绝
+        if not remote.enable and ServerActive(setting):
+            record["result"] = "aborted"
+            SyncAborted(InterFace, server_name)
+            return record["result"]
+        # 只有同步主服存档本身时才使用脏路径集合
+        watching = sources is None
+        if sources is None:
+            sources = {world: f'{setting.source}/{world}' for world in worlds}
+
+        # 同步前检查源存档（两段式同步时为快照），主服保存到一半时复制的存档可能已经损坏
+        if setting.verify.before_sync:
+            with progress.Phase("verify_source"):
+                checked = CheckWorlds(job, setting, sources)
+            record["verify_source"] = checked.Record()
+            if checked.problems:
+                record["result"] = "aborted"
+                ReportWorldCheck(InterFace, server_name, checked, "主服")
+                InterFace.Reply(f"§b[MSC] §d对§6§l{server_name}§d服务器的同步操作§c已经被终止§d......")
+                return record["result"]
+
+        start_time = datetime.datetime.now()
+
+        # 需要忽略的文件
+        ignore = setting.ignore_files + ["session.lock"]
+        # 并行复制的线程数，1 为单线程顺序复制
+        workers = setting.sync_workers
+        # 同步策略：copy/reflink/hardlink-readonly，文件系统不支持时自动退回 copy
+        strategy = setting.sync_strategy
+
+        # 远程同步：把变化的文件压缩后发送给目标主机上的接收端
+        if remote.enable:
+            report = world_sync.SyncReport()
+            for world in worlds:
+                report.Merge(remote_sync.RemoteSync(
+                    remote.host,
+                    remote.port,
+                    remote.token,
+                    server_name,
+                    sources[world],
+                    ignore,
+                    check=job.CheckCancelled,
+                    progress=progress,
+                    world=world,
+                    scope=scope,
+                    limiter=limiter
+                ))
+            end_time = datetime.datetime.now()
+            InterFace.Reply(f"§b[MSC] §2已远程同步至§6§l{server_name}§2服务器！用时§a{end_time - start_time}")
+            InterFace.Reply(f"§b[MSC] {report.Summary()}§7，压缩后传输§f{world_sync.FormatSize(report.sent_bytes)}")
+            return record["result"]
+
+        # 增量同步：只复制变化的文件，忽略文件原地保留
+        if setting.sync_mode == "incremental":
+            report = world_sync.SyncReport()
+            dirty_paths = 0
+            for world in worlds:
+                # 上一次同步留下的清单，子服启动过则清单失效
+                previous = manifest.LoadManifest(setting.target, world=world)
+                # 监视主服存档时，在上一次同步的清单上应用期间变化的路径，不再遍历主服存档
+                source_state = None
+                dirty = None
+                if watching:
+                    dirty = WorldWatchers.Take(WatchName(server_name, world))
+                    watched.append(WatchName(server_name, world))
+                if dirty is not None and previous:
+                    with progress.Phase("dirty"):
+                        source_state = world_watch.ApplyChanges(
+                            sources[world], manifest.KnownState(previous), dirty, ignore, scope
+                        )
+                    dirty_paths += len(dirty)
+                    record["dirty_paths"] = dirty_paths
+                world_report = world_sync.IncrementalSync(
+                    sources[world],
+                    f'{setting.target}/{world}',
+                    ignore,
+                    setting.hash_check,
+                    workers,
+                    setting.region_delta,
+                    manifest.KnownState(previous) if previous else None,
+                    strategy,
+                    job.CheckCancelled,
+                    progress,
+                    source_state,
+                    scope,
+                    limiter
+                )
+                with progress.Phase("manifest"):
+                    SaveSyncManifest(setting, world_report.files, world_report.dirs, previous, world)
+                report.Merge(world_report)
+            if VerifyAfterSync(job, InterFace, setting, progress, record):
+                record["version"] = SaveVersion(InterFace, setting, progress, limiter)
+            end_time = datetime.datetime.now()
+            InterFace.Reply(f"§b[MSC] §2已增量同步至§6§l{server_name}§2服务器！用时§a{end_time - start_time}")
+            InterFace.Reply(f"§b[MSC] {report.Summary()}")
+            return record["result"]
+
+        # 使用 shutil.copytree 时没有复制统计
+        parallel = workers > 1 or strategy != "copy" or scope.Active() or limiter is not None
+        if parallel:
+            report = world_sync.SyncReport()
+        for world in worlds:
+            previous = manifest.LoadManifest(setting.target, world=world)
+            target = f'{setting.target}/{world}'
+            world_temp = f'{target}_temp'
+
+            if os.path.exists(target) and scope.Active():
+                # 限制了范围时只清理范围内的文件，范围外的文件与忽略文件一样原地保留
+                with progress.Phase("delete"):
+                    world_sync.ClearTree(target, ignore, scope)
+            # 检查，目标路径下有world且忽略名单不为空的时候执行
+            elif os.path.exists(target) and ignore:
+                with progress.Phase("stash"):
+                    # 创建一个临时文件夹存储忽略文件
+                    os.makedirs(world_temp, exist_ok=True)
+                    # 寻找忽略文件并且挪到临时文件夹
+                    for item in os.listdir(target):
+                        item_path = os.path.join(target, item)
+                        # 挪到临时文件夹处
+                        if os.path.isfile(item_path) and item in ignore:
+                            shutil.copy2(item_path, world_temp)
+                with progress.Phase("delete"):
+                    shutil.rmtree(f'{target}/')
+
+            # 同步
+            if parallel:
+                report.Merge(world_sync.FullCopy(
+                    sources[world],
+                    target,
+                    ignore,
+                    workers,
+                    strategy,
+                    job.CheckCancelled,
+                    progress,
+                    scope,
+                    limiter
+                ))
+            else:
+                with progress.Phase("scan"):
+                    files, _ = world_sync.ScanTree(sources[world], ignore)
+                    progress.AddTotal(len(files), sum(size for size, _ in files.values()))
+
+                def CopyWithProgress(src, dst):
+                    shutil.copy2(src, dst)
+                    progress.Add(os.path.getsize(dst))
+
+                with progress.Phase("copy"):
+                    shutil.copytree(
+                        sources[world],
+                        target,
+                        ignore=shutil.ignore_patterns(*ignore),
+                        copy_function=CopyWithProgress
+                    )
+
+            # 移动忽略文件返回原处，删掉临时文件夹
+            if os.path.exists(world_temp):
+                with progress.Phase("restore"):
+                    for item in os.listdir(world_temp):
+                        temp_path = os.path.join(world_temp, item)
+                        target_path = os.path.join(target, item)
+                        shutil.copy2(temp_path, target_path)
+                    shutil.rmtree(world_temp)
+
+            with progress.Phase("manifest"):
+                files, dirs = world_sync.ScanTree(target, ignore, scope)
+                SaveSyncManifest(setting, files, dirs, previous, world)
+
+        if VerifyAfterSync(job, InterFace, setting, progress, record):
+            record["version"] = SaveVersion(InterFace, setting, progress, limiter)
+        end_time = datetime.datetime.now()
+        InterFace.Reply(f"§b[MSC] §2已同步至§6§l{server_name}§2服务器！用时§a{end_time - start_time}")
+        return record["result"]
+    except jobs.JobCancelled:
+        record["result"] = "cancelled"
+        InterFace.Reply(f"§b[MSC] §d对§6§l{server_name}§d服务器的同步操作§c已被取消")
+        raise
+    except remote_sync.TargetRunning as e:
+        record["result"] = "aborted"
+        record["error"] = str(e)
+        SyncAborted(InterFace, server_name)
+        return record["result"]
+    except Exception as e:
+        record["result"] = "failed"
+        record["error"] = str(e)
+        InterFace.Reply(f"§b[MSC] §c出现异常，请把内容报告给管理员：§f{e}")
+        raise
+    finally:
+        if limiter is not None and limiter.waited:
+            record["throttle_wait"] = round(limiter.waited, 3)
+        if record["result"] != "done":
+            # 同步没有完成时已取出的脏路径集合不再可信
+            for name in watched:
+                WorldWatchers.Invalidate(name)
+        if report is not None:
+            record.update({
+                "copied_files": report.copied_files,
+                "copied_bytes": report.copied_bytes,
+                "skipped_files": report.skipped_files,
+                "skipped_bytes": report.skipped_bytes,
+                "deleted_files": report.deleted_files,
+                "deleted_bytes": report.deleted_bytes,
+                "delta_files": report.delta_files,
+                "delta_bytes": report.delta_bytes,
+                "sent_bytes": report.sent_bytes,
+            })
+        WriteSyncLog(progress.Record(**record))
+
+
+def VersionsDir(setting):
+    """
+    目标服务器存档历史版本的存放路径（需要与子服存档位于同一文件系统）
+    :param setting: 目标服务器的配置
+    :return: 路径
+    """
+    return setting.versions.dir or f'{setting.target}/msc_versions'
+
+
+def SaveVersion(InterFace, setting, progress, limiter=None):
+    """
+    同步成功后把子服存档保存为历史版本，并按保留数量与空间上限清理旧版本
+    保存失败不影响本次同步的结果
+    :param InterFace:
+    :param setting: 目标服务器的配置
+    :param progress: 同步进度，耗时记录为 version 阶段
+    :param limiter: throttle.IoLimiter，与本次同步共用
+    :return: 版本号，未开启或保存失败时为 None
     """
-    global MirrorProcess, path
+    server_name = setting.name
+    if setting.versions.keep <= 0:
+        return None
+    root = VersionsDir(setting)
     try:
-        if platform == 'win32':
-            MirrorProcess = subprocess.Popen(MCDR_Command, creationflags=subprocess.CREATE_NEW_CONSOLE)
-        else:
-            MirrorProcess = subprocess.Popen(MCDR_Command, shell=True)
+        with progress.Phase("version"):
+            info = versions.CreateVersion(
+                root,
+                setting.target,
+                setting.worlds,
+                setting.sync_workers,
+                limiter=limiter
+            )
+            removed = versions.PruneVersions(root, setting.versions.keep, setting.versions.max_size_mb * 1024 * 1024)
     except Exception as e:
-        InterFace.execute(f'say §b[MSC] §4执行启动命令启动失败！原因为：§c{e}')
-    os.chdir(path)
+        InterFace.logger.warning(f'[MSC] 保存{server_name}的历史版本失败：{e}')
+        InterFace.Reply(f"§b[MSC] §c保存§6§l{server_name}§c的历史版本失败：§f{e}")
+        return None
+    InterFace.logger.info(
+        f'[MSC] 已保存{server_name}的历史版本{info["id"]}：复制{info["copied_files"]}个文件'
+        f'（{world_sync.FormatSize(info["copied_bytes"])}），与上一版本共享{info["linked_files"]}个文件，'
+        f'清理旧版本{len(removed)}个'
+    )
+    return info["id"]
+
 
+def SnapshotPath(setting, world="world"):
+    """
+    两段式同步时主服存档快照的存放路径（与主服存档位于同一文件系统，便于 reflink）
+    :param setting: 目标服务器的配置
+    :param world: 存档文件夹名，world 以外的存档在快照路径后加上存档名
+    :return: 快照路径
+    """
+    snapshot = setting.snapshot_dir or f'{setting.source}/msc_snapshot_{setting.name}'
+    return snapshot if world == "world" else f'{snapshot}_{world}'
 
-@new_thread("MSC-Main")
-def ServerStart(InterFace, server_name):
+
+def TwoPhaseSync(job, InterFace, server_name, fixed=None):
     """
-    文件夹跳转函数
+    两段式同步：关闭保存并等待主服保存完毕后，先在本地生成一份存档快照，立即恢复保存，
+    再在后台把快照同步到目标服务器，尽量缩短主服关闭保存的时间
+    快照在多次同步之间保留，每次只更新变化的文件；可以使用 reflink 时几乎不占用时间与空间
+    （不使用硬链接：主服会原地改写区域文件，硬链接的快照会跟着被修改）
+    :param job: 当前任务
     :param InterFace:
     :param server_name: 目标服务器名字
-    :return:
+    :param fixed: 主服保存完毕、开始生成快照之前调用的函数
+    :return: 同步结果，同 ServerSync
     """
-    global path, config
-    server_path_name = os.path.basename(os.path.dirname(config[server_name]["target"]))
+    setting = JobServer(job, server_name)
+    if ServerActive(setting):
+        SyncAborted(InterFace, server_name)
+        return "aborted"
+
+    save_off = False
+    snapshots = {world: SnapshotPath(setting, world) for world in setting.worlds}
+    # 生成快照时主服已关闭保存，限速会延长关闭保存的时间，只丢弃页缓存
+    limiter = IoLimiterOf(setting)
+    if limiter is not None:
+        limiter = throttle.IoLimiter(fadvise=limiter.fadvise)
+    # 等待保存与生成快照的耗时也记录在同一份同步记录中
+    progress = SyncReporter(job, InterFace, server_name)
+    SaveLock.acquire()
     try:
-        # 跳转到目标文件夹下
-        os.chdir(server_path_name)
-        CommandExecute(InterFace)
-        time.sleep(4)
-        os.chdir(path)
+        ignore = setting.ignore_files + ["session.lock"]
+
+        SavedEvent.clear()
+        off_time = time.monotonic()
+        InterFace.execute('save-off')
+        save_off = True
+        InterFace.execute('save-all')
+        with progress.Phase("save"):
+            saved = SavedEvent.wait(setting.save_wait_timeout)
+        if not saved:
+            InterFace.Reply("§b[MSC] §c等待主服保存超时，同步已终止")
+            return "aborted"
+        if fixed is not None:
+            fixed()
+
+        report = world_sync.SyncReport()
+        with progress.Phase("snapshot"):
+            # 快照只包含同步范围内的文件
+            for world, snapshot in snapshots.items():
+                report.Merge(world_sync.IncrementalSync(
+                    f'{setting.source}/{world}',
+                    snapshot,
+                    ignore,
+                    False,
+                    setting.sync_workers,
+                    setting.region_delta,
+                    None,
+                    "reflink",
+                    job.CheckCancelled,
+                    scope=setting.scope,
+                    limiter=limiter
+                ))
+        InterFace.execute('save-on')
+        save_off = False
+        window = time.monotonic() - off_time
+        InterFace.logger.info(f'[MSC] 同步{server_name}时主服关闭保存{window:.2f}秒，快照更新：{report.copied_files}个文件')
+        InterFace.Reply(f"§b[MSC] §2存档快照已完成，主服已恢复保存，关闭保存共§a{window:.2f}§2秒")
+    except jobs.JobCancelled:
+        InterFace.Reply(f"§b[MSC] §d对§6§l{server_name}§d服务器的同步操作§c已被取消")
+        raise
     except Exception as e:
-        InterFace.execute(
-            f'say §b[MSC] §4启动服务器§6§l{server_name}§4失败！原因为：§c{format(e)}'
-        )
+        InterFace.Reply(f"§b[MSC] §c生成存档快照时出现异常，请把内容报告给管理员：§f{e}")
+        raise
+    finally:
+        if save_off:
+            InterFace.execute('save-on')
+        SaveLock.release()
+
+    # 第二阶段：把快照同步到目标服务器
+    return ServerSync(job, InterFace, server_name, snapshots, progress)
 
 
-def Start(server: PluginServerInterface, source: CommandContext, InterFaceTemp=None):
+def OnInfo(server: PluginServerInterface, info: Info):
     """
-    服务器启动函数
+    处理主服输出，用于等待主服保存完毕、保存后触发自动同步与根据主服卡顿调整同步限速
     :param server:
-    :param source: 命令源
-    :param InterFaceTemp: 实例
+    :param info: 服务器输出
     :return:
     """
-    global InterFace, syncFlag
-
-    server_name = source["server_name"]
-    # 检查名字是否在配置单中
-    if not ServerNameCheck(server, server_name):
+    if info.is_user:
         return
+    # 正则表达式在加载配置时已经编译
+    current = config
+    if re.fullmatch(default_config.SAVE_COMPLETE_PATTERN, info.content):
+        SavedEvent.set()
+    if AutoSyncs is not None and current.auto_sync_save_pattern.fullmatch(info.content):
+        AutoSyncs.OnSave()
+    if current.lag_pattern.fullmatch(info.content):
+        factor = ServerLag.OnLag()
+        server.logger.info(f'[MSC] 主服出现卡顿，开启自适应限速的同步降至配置速度的{factor:.0%}')
+
+
+def SubmitJob(InterFace, server_name, kind, func, *args, disk=False, ack=True):
+    """
+    提交任务，该服务器已有任务时提示已进入队列，否则立即回复命令源任务已提交
+    :param InterFace: feedback.Feedback
+    :param server_name: 服务器名字
+    :param kind: 任务类型
+    :param func: 任务函数
+    :param args: 任务函数的其余参数
+    :param disk: 是否为磁盘任务
+    :param ack: 是否回复任务已提交（对服务器组执行时由组统一回复）
+    :return: Job
+    """
+    busy = JobScheduler.Busy(server_name)
+    job = JobScheduler.Submit(server_name, kind, func, *args, disk=disk)
+    if busy:
+        InterFace.Reply(f"§b[MSC] §6§l{server_name}§e有正在执行的任务，§b#{job.id} {kind}§e已加入队列")
+    elif ack:
+        InterFace.Reply(f"§b[MSC] §7已提交任务§b#{job.id} {kind}§7，可使用§6!!msc cancel {job.id}§7取消", False)
+    return job
 
-    if InterFaceTemp is None:
-        InterFace = GetInterFace()
-    else:
-        InterFace = InterFaceTemp
-    # 检查服务器是否已开启
-    if Status(server, source, False):
-        InterFace.execute(f'say §b[MSC] §6§l{server_name}§f服务器处于§a正在运行§f状态，无须启动')
-        return
 
-    if syncFlag:
-        InterFace.execute(f'say §b[MSC] §6§l{server_name}§a正在进行同步，请稍后再启动')
-    else:
-        InterFace.execute(f'say §b[MSC] §a正在启动§6§l{server_name}§a服务器，请稍等……')
-        ServerStart(InterFace, server_name)
-        time.sleep(default_config.START_WAIT_TIME)
-        InterFace.execute(
-            f'say §b[MSC] §6§l{server_name}§a启动命令已执行，请等待完全启动后使用§6§l/server {server_name} §a进行连接§e（需装Velocity）')
+def GroupParallelism():
+    """
+    对服务器组执行操作时的最大并发数
+    :return: 并发数
+    """
+    return config.group_parallelism
 
 
-def Stop(server: PluginServerInterface, source: CommandContext, InterFaceTemp=None):
+@new_thread("MSC-Group")
+def SubmitGroup(InterFace, group, members, kind, func, *args, disk=False):
     """
-    服务器停止函数，需要开启rcon才可使用
+    对服务器组中的每台服务器提交任务，最多同时执行 group_parallelism 个，全部结束后汇总报告
+    :param InterFace: feedback.Feedback
+    :param group: 组名
+    :param members: 组内的服务器名字
+    :param kind: 任务类型
+    :param func: 任务函数，参数为 (job, InterFace, 服务器名字, *args)
+    :param args: 任务函数的其余参数
+    :param disk: 是否为磁盘任务
+    :return: None
+    """
+    def RunMember(server_name):
+        job = SubmitJob(InterFace, server_name, kind, func, InterFace, server_name, *args, disk=disk, ack=False)
+        job.Wait()
+        return job
+
+    InterFace.Reply(f"§b[MSC] §d对服务器组§b{group}§d（{len(members)}台）执行§a{kind}§d......")
+    start_time = time.monotonic()
+    with ThreadPoolExecutor(max_workers=GroupParallelism(), thread_name_prefix="MSC-Group") as pool:
+        job_list = list(pool.map(RunMember, members))
+    done = sum(job.state == "done" for job in job_list)
+    InterFace.Reply(
+        f"§b[MSC] §f服务器组§b{group}§f的§a{kind}§f已结束：§a成功{done}§f，§c失败{len(job_list) - done}§f，"
+        f"用时§e{time.monotonic() - start_time:.1f}§f秒"
+    )
+    for job in job_list:
+        InterFace.Reply(job.Describe())
+
+
+def GroupCommand(server: PluginServerInterface, source: CommandContext, kind, func, *args, disk=False):
+    """
+    命令目标是服务器组时，对组内服务器并行提交任务
     :param server:
     :param source: 命令源
-    :param InterFaceTemp: 命令源
-    :return:
+    :param kind: 任务类型
+    :param func: 任务函数
+    :param args: 任务函数的其余参数
+    :param disk: 是否为磁盘任务
+    :return: 目标是否为服务器组（是则已处理）
     """
-    global InterFace
+    members = GroupMembers(source["server_name"])
+    if members is None:
+        return False
+    if kind == "sync" or disk:
+        current = config
+        members = [server_name for server_name in members if current.servers[server_name].can_sync]
+    if not members:
+        server.reply(f'§b[MSC] §c服务器组§b{source["server_name"]}§c中没有可以执行{kind}的服务器')
+        return True
+    SubmitGroup(CommandFeedback(server), source["server_name"], members, kind, func, *args, disk=disk)
+    return True
 
-    server_name = source["server_name"]
-    # 检查名字是否在配置单中
-    if not ServerNameCheck(server, server_name):
-        return
 
-    if InterFaceTemp is None:
-        InterFace = GetInterFace()
-    else:
-        InterFace = InterFaceTemp
-    # 检查服务器是否已关闭
-    if not Status(server, source, False):
-        InterFace.execute(f'say §b[MSC] §6§l{server_name}§f服务器处于§c关闭§f状态，无须关闭')
-        return
+def SyncAllowed(InterFace, setting):
+    """
+    检查此名字下的服务器是否允许同步
+    :param InterFace:
+    :param setting: 服务器配置
+    :return: 是否允许
+    """
+    if not setting.can_sync:
+        InterFace.Reply(
+            f"§b[MSC] §6{setting.name}§f被设置为§c不允许同步§r！！"
+        )
+        return False
+    return True
 
-    if config[server_name]['rcon']['enable']:
-        conn = RconInit(server_name)
-        try:
-            connected = conn.connect()
-            if connected:
-                conn.send_command('stop', max_retry_time=3)
-                conn.disconnect()
-                InterFace.execute(f'say §b[MSC] §6§l{server_name}§a服务器已执行关闭命令……')
-        except Exception as e:
-            InterFace.execute(f'say §b[MSC] §4无法执行命令关闭服务器：§6§l{server_name}§4，原因为：§c{format(e)}')
-    else:
-        InterFace.execute(
-            f'say §b[MSC] §4无法通过§6§lRcon§4关闭§6§l{server_name}§4服务器，因为§6§l{server_name}服务器的§6§lRcon未开启！')
+
+def RunSync(job, InterFace, server_name, waiting=False, save=True, fixed=None):
+    """
+    同步任务
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :param waiting: 是否在同步完成后才恢复主服保存（重启时使用）
+    :param save: 同步前是否让主服保存（主服刚保存完时不需要）
+    :param fixed: 主服保存之后、开始复制之前调用的函数（此时的主服存档即为本次同步复制的内容）
+    :return: 同步结果，同 ServerSync
+    """
+    InterFace.Reply(f"§b[MSC] §d正在同步到§6§l{server_name}§d服务器中......")
+    if JobServer(job, server_name).two_phase_sync:
+        return TwoPhaseSync(job, InterFace, server_name, fixed)
+    if not save:
+        if fixed is not None:
+            fixed()
+        return ServerSync(job, InterFace, server_name)
+    if waiting:
+        with SaveLock:
+            InterFace.execute('save-off')
+            InterFace.execute('save-all')
+            try:
+                if fixed is not None:
+                    fixed()
+                return ServerSync(job, InterFace, server_name)
+            finally:
+                InterFace.execute('save-on')
+    with SaveLock:
+        InterFace.execute('save-off')
+        InterFace.execute('save-all')
+        InterFace.execute('save-on')
+    if fixed is not None:
+        fixed()
+    return ServerSync(job, InterFace, server_name)
 
 
-def Status(server: PluginServerInterface, source: CommandContext, is_show=True):
+def RunRollback(job, InterFace, server_name, steps):
+    """
+    回滚任务：用历史版本替换子服存档
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :param steps: 回滚到几次同步之前，0 为最近一次同步后的状态
+    :return: 回滚结果：done/aborted
     """
-    查询服务器状态（通过检查端口是否被占用）
+    setting = JobServer(job, server_name)
+    if ServerActive(setting):
+        InterFace.Reply(f"§b[MSC] §2服务器§6§l{server_name}§c正在运行§2！请§c关闭后再回滚§2！")
+        return "aborted"
+    root = VersionsDir(setting)
+    history = versions.ListVersions(root)
+    if steps >= len(history):
+        InterFace.Reply(f"§b[MSC] §6§l{server_name}§c只有§e{len(history)}§c个历史版本，无法回滚到§e{steps}§c次同步之前")
+        return "aborted"
+    version = history[steps]
+    InterFace.Reply(f"§b[MSC] §d正在把§6§l{server_name}§d服务器回滚到版本§b{version['id']}§d......")
+    start_time = datetime.datetime.now()
+    try:
+        versions.RestoreVersion(
+            root,
+            version,
+            setting.target,
+            setting.sync_workers,
+            job.CheckCancelled
+        )
+    except jobs.JobCancelled:
+        InterFace.Reply(f"§b[MSC] §d对§6§l{server_name}§d服务器的回滚操作§c已被取消§d，存档没有改变")
+        raise
+    except Exception as e:
+        InterFace.Reply(f"§b[MSC] §c回滚时出现异常，请把内容报告给管理员：§f{e}")
+        raise
+    # 存档已不是最近一次同步后的状态，下一次同步重新扫描
+    manifest.MarkDirty(setting.target, list(version["worlds"]))
+    end_time = datetime.datetime.now()
+    InterFace.Reply(f"§b[MSC] §2已把§6§l{server_name}§2服务器回滚到§b{version['time']}§2的版本！用时§a{end_time - start_time}")
+    return "done"
+
+
+def Rollback(server: PluginServerInterface, source: CommandContext):
+    """
+    服务器回滚检查
     :param server:
     :param source: 命令源
-    :param is_show: 是否输出到游戏内（默认True）
     :return:
     """
-
     server_name = source["server_name"]
     # 检查名字是否在配置单中
-    if not ServerNameCheck(server, server_name):
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
+        return
+    if setting.remote.enable:
+        server.reply(f'§b[MSC] §6§l{server_name}§c使用远程同步，历史版本只保存在本机同步的服务器上')
         return
 
-    port = config[server_name]["port"]
-    host = config[server_name]["rcon"]["host"]
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-        try:
-            s.bind((host, port))
-            if is_show:
-                server.reply(f'§b[MSC] §f服务器§6§l{server_name}§f的状态为：§c关闭')
-            return False
-        except OSError:
-            if is_show:
-                server.reply(f'§b[MSC] §f服务器§6§l{server_name}§f的状态为：§a正在运行')
-            return True
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "rollback", RunRollback, reply, server_name, source.get("steps", 1), disk=True)
 
 
-def Show(server: PluginServerInterface, source: CommandContext):
+def ShowVersions(server: PluginServerInterface, source: CommandContext):
     """
-    展示目标服务器信息
+    展示目标服务器存档的历史版本
     :param server:
     :param source: 命令源
     :return:
     """
-
     server_name = source["server_name"]
     # 检查名字是否在配置单中
-    if not ServerNameCheck(server, server_name):
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
         return
 
-    server.reply("================")
-    server.reply(f"§6§l{server_name}服务器信息如下：")
-    server.reply(f"描述：§e{config[server_name]['description']}")
-
-    if config[server_name]['can_sync'] is True:
-        server.reply("是否允许被同步：§2是")
-    elif config[server_name]['can_sync'] is False:
-        server.reply("是否允许被同步：§c否")
-    else:
-        server.reply("是否允许被同步：§d未知")
-
-    if config[server_name]['rcon']['enable'] is True:
-        server.reply("Rcon启用情况：§2已启用")
-    elif config[server_name]['rcon']['enable'] is False:
-        server.reply("Rcon启用情况：§c未启用")
-    else:
-        server.reply("Rcon启用情况：§d未知")
-
-    Status(server, source, True)
+    root = VersionsDir(setting)
+    history = versions.ListVersions(root)
+    if not history:
+        server.reply(f'§b[MSC] §6§l{server_name}§e还没有历史版本（需要在配置中开启versions）')
+        return
+    server.reply(f'§b[MSC] §6§l{server_name}§f共有{len(history)}个历史版本，'
+                 f'实际占用§e{world_sync.FormatSize(versions.DiskUsage(root))}§f：')
+    for steps, version in enumerate(history):
+        server.reply(f'§7  [{steps}] §b{version["id"]} §f存档大小§e{world_sync.FormatSize(version["size"])}'
+                     f'§f，新增§e{world_sync.FormatSize(version["copied_bytes"])}')
 
 
-def Reload(server: PluginServerInterface, source: CommandContext):
+def Sync(server: PluginServerInterface, source: CommandContext):
     """
-    重新读取插件配置文件
+    服务器同步检查
     :param server:
     :param source: 命令源
     :return:
     """
+    if GroupCommand(server, source, "sync", RunSync, disk=True):
+        return
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
+        return
 
-    server.reply('§b[MSC] §2正在重载配置文件……')
-    ConfigToDo()
-    server.reply('§b[MSC] §a重载完成！')
+    reply = CommandFeedback(server)
+    if SyncAllowed(reply, setting):
+        SubmitJob(reply, server_name, "sync", RunSync, reply, server_name, disk=True)
 
 
-def RestartSync(server: PluginServerInterface, source: CommandContext):
+def SourceSignature(setting):
     """
-    服务器重启（同步版）
-    :param server: 服务器实例
-    :param source: 消息源
-    :return: None
+    主服存档同步范围内的签名（只读取文件元数据）
+    :param setting: 目标服务器的配置
+    :return: 签名
+    """
+    return world_sync.TreeSignature(
+        [f'{setting.source}/{world}' for world in setting.worlds],
+        setting.ignore_files + ["session.lock"],
+        setting.scope
+    )
+
+
+def WatchName(server_name, world):
+    """
+    监视主服存档时使用的名字，每台服务器的每个存档各有一份脏路径集合
+    :param server_name: 目标服务器名字
+    :param world: 存档文件夹名
+    :return: 名字
+    """
+    return f'{server_name}/{world}'
+
+
+def WatchPending(setting):
+    """
+    主服存档自上一次同步以来变化的路径数
+    :param setting: 目标服务器的配置
+    :return: 路径数，没有监视或有存档无法得知时为 None
+    """
+    total = 0
+    for world in setting.worlds:
+        pending = WorldWatchers.Pending(WatchName(setting.name, world))
+        if pending is None:
+            return None
+        total += pending
+    return total
+
+
+def RunAutoSync(job, InterFace, server_name, reason):
+    """
+    自动同步任务：主服存档与上一次同步后相比没有变化时跳过
+    监视主服存档时直接根据脏路径集合判断；否则比较存档签名，并在主服保存之后、开始复制之前重新计算签名
+    （同步开始时的 save-all 会改写存档），避免下一次因为这次保存而重复同步；
+    复制期间主服存档发生的变化不计入签名，下一次自动同步时会被同步
+    主服保存后触发的同步不再让主服保存，避免保存与同步互相触发
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :param reason: 触发原因：schedule/save
+    :return: 同步结果，同 ServerSync，跳过时为 unchanged
+    """
+    setting = JobServer(job, server_name)
+    pending = WatchPending(setting)
+    if pending == 0 or (pending is None and not AutoSyncs.Changed(server_name, SourceSignature(setting))):
+        InterFace.logger.info(f'[MSC] 主服存档没有变化，跳过对{server_name}的自动同步')
+        return "unchanged"
+    InterFace.logger.info(f'[MSC] 自动同步{server_name}（{"定时" if reason == "schedule" else "主服保存后"}）')
+    # 本次同步复制的内容对应的签名
+    signature = []
+    fixed = (lambda: signature.append(SourceSignature(setting))) if pending is None else None
+    result = RunSync(job, InterFace, server_name, save=reason != "save", fixed=fixed)
+    if result == "done" and signature:
+        AutoSyncs.Synced(server_name, signature[0])
+    return result
+
+
+def SubmitAutoSync(server_name, reason):
+    """
+    提交自动同步任务，该服务器已有同步任务在排队或执行时不再重复提交
+    :param server_name: 目标服务器名字
+    :param reason: 触发原因
+    :return: None
+    """
+    setting = config.servers.get(server_name)
+    if setting is None or not setting.can_sync:
+        return
+    if JobScheduler.Busy(server_name, "sync"):
+        return
+    # 自动同步没有命令源，进度与结果在游戏内广播
+    InterFace = feedback.Feedback(GetInterFace())
+    SubmitJob(InterFace, server_name, "sync", RunAutoSync, InterFace, server_name, reason, disk=True, ack=False)
+
+
+def AutoSyncSettings():
+    """
+    从配置文件读取每台服务器的自动同步设置
+    :return: {服务器名字: {'interval', 'on_save', 'debounce'}}
+    """
+    auto_settings = {}
+    for server_name, setting in config.servers.items():
+        if not setting.can_sync:
+            continue
+        auto_settings[server_name] = {
+            "interval": setting.auto_sync.interval,
+            "on_save": setting.auto_sync.on_save,
+            "debounce": setting.auto_sync.debounce,
+        }
+    return auto_settings
+
+
+def StartAutoSync():
+    """
+    按配置启动或更新自动同步调度线程，没有服务器开启自动同步时停止
+    :return: None
+    """
+    global AutoSyncs
+    if AutoSyncs is None:
+        AutoSyncs = auto_sync.AutoSync(SubmitAutoSync, logger=GetInterFace().logger)
+    AutoSyncs.Configure(AutoSyncSettings())
+    if not AutoSyncs.Enabled():
+        AutoSyncs.Stop()
+    elif AutoSyncs.thread is None:
+        AutoSyncs.Start()
+
+
+def StartWatchers():
+    """
+    按配置监视主服存档，只对在本机增量同步、且不使用两段式同步的服务器生效
+    :return: None
+    """
+    watch = config.world_watch
+    targets = {}
+    if watch.enable:
+        for server_name, setting in config.servers.items():
+            if setting.can_sync and setting.sync_mode == "incremental" and \
+                    not setting.remote.enable and not setting.two_phase_sync:
+                for world in setting.worlds:
+                    targets[WatchName(server_name, world)] = f'{setting.source}/{world}'
+    try:
+        modes = WorldWatchers.Configure(
+            targets,
+            watch.mode,
+            watch.poll_interval,
+            watch.max_dirty
+        )
+    except OSError as e:
+        GetInterFace().logger.error(f'[MSC] 监视主服存档失败：{e}')
+        return
+    for root, mode in modes.items():
+        GetInterFace().logger.info(f'[MSC] 正在监视{root}（{mode}）')
+
+
+def StopAutoSync():
+    """
+    停止自动同步调度线程
+    :return: None
+    """
+    if AutoSyncs is not None:
+        AutoSyncs.Stop()
+
+
+def ServerStart(InterFace, setting):
+    """
+    在子服文件夹下启动子服进程
+    :param InterFace:
+    :param setting: 目标服务器的配置
+    :return: 启动命令是否已执行
+    """
+    server_name = setting.name
+    server_path = os.path.dirname(os.path.join(path, setting.target))
+    # 硬链接的存档与主服共享文件，子服写入区域文件会直接改动主服存档
+    if setting.sync_strategy == "hardlink-readonly":
+        InterFace.Reply(
+            f'§b[MSC] §6§l{server_name}§4使用硬链接同步，存档与主服共享，为保护主服存档拒绝启动'
+        )
+        return False
+    try:
+        # 子服运行后会修改存档，上次同步的清单不再可信
+        manifest.MarkDirty(setting.target, setting.worlds)
+        managed = Processes.Start(
+            server_name,
+            MCDR_Command,
+            server_path,
+            setting.auto_restart
+        )
+        InterFace.logger.info(f'[MSC] {server_name}已启动，PID：{managed.pid}')
+        return True
+    except Exception as e:
+        InterFace.Reply(
+            f'§b[MSC] §4启动服务器§6§l{server_name}§4失败！原因为：§c{format(e)}'
+        )
+        return False
+
+
+def ServerReady(setting):
+    """
+    按配置的探测方式检查服务器是否已经启动完毕
+    :param setting: 服务器配置
+    :return: 是否启动完毕
+    """
+    rcon = setting.rcon
+    if setting.ready_probe == "rcon" and rcon.enable:
+        return server_probe.RconReady(rcon.host, rcon.port, rcon.password)
+    if setting.ready_probe == "port":
+        return server_probe.PortOpen(rcon.host, setting.port)
+    return server_probe.SlpReady(rcon.host, setting.port)
+
+
+def ServerDown(setting):
+    """
+    检查服务器是否已经完全关闭：由插件启动的子服需要进程已经退出，并且端口不再接受连接
+    :param setting: 服务器配置
+    :return: 是否已关闭
+    """
+    if Processes.Running(setting.name):
+        return False
+    return not server_probe.PortOpen(setting.rcon.host, setting.port)
+
+
+def RunStart(job, InterFace, server_name):
+    """
+    启动任务（同一服务器的同步结束后才会执行）
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :return: 启动耗时（秒），服务器已在运行时返回 None，启动失败或超时抛出 RuntimeError
+    """
+    setting = JobServer(job, server_name)
+    # 检查服务器是否已开启
+    if IsRunning(server_name):
+        InterFace.Reply(f'§b[MSC] §6§l{server_name}§f服务器处于§a正在运行§f状态，无须启动')
+        return None
+
+    InterFace.Reply(f'§b[MSC] §a正在启动§6§l{server_name}§a服务器，请稍等……')
+    start_time = time.monotonic()
+    try:
+        if not ServerStart(InterFace, setting):
+            raise RuntimeError('启动命令执行失败')
+        timeout = setting.start_timeout
+        if server_probe.WaitUntil(lambda: ServerReady(setting), timeout, job.CheckCancelled) is None:
+            InterFace.Reply(f'§b[MSC] §6§l{server_name}§e启动命令已执行，但§c{timeout}§e秒内未检测到服务器启动完毕')
+            raise RuntimeError(f'{timeout}秒内未启动完毕')
+    finally:
+        # 服务器状态已经改变，缓存作废
+        ServerStatus.Invalidate(server_name)
+    elapsed = time.monotonic() - start_time
+    InterFace.Reply(
+        f'§b[MSC] §6§l{server_name}§a已启动完毕（用时§e{elapsed:.1f}§a秒），可以使用§6§l/server {server_name} §a进行连接§e（需装Velocity）')
+    return elapsed
+
+
+def Start(server: PluginServerInterface, source: CommandContext):
+    """
+    服务器启动函数
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    if GroupCommand(server, source, "start", RunStart):
+        return
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    if not ServerNameCheck(server, server_name):
+        return
+
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "start", RunStart, reply, server_name)
+
+
+def Stop(server: PluginServerInterface, source: CommandContext):
+    """
+    服务器停止函数，需要开启rcon或由插件启动才可使用
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    if GroupCommand(server, source, "stop", RunStop):
+        return
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    if not ServerNameCheck(server, server_name):
+        return
+
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "stop", RunStop, reply, server_name)
+
+
+def RunStop(job, InterFace, server_name):
+    """
+    关闭任务
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :return: 关闭耗时（秒），服务器已关闭时返回 None，无法关闭或超时抛出 RuntimeError
+    """
+    setting = JobServer(job, server_name)
+    # 检查服务器是否已关闭
+    if not IsRunning(server_name):
+        InterFace.Reply(f'§b[MSC] §6§l{server_name}§f服务器处于§c关闭§f状态，无须关闭')
+        return None
+
+    # 主动关闭的子服退出后不自动重启
+    Processes.Stopping(server_name)
+    start_time = time.monotonic()
+    if setting.rcon.enable:
+        try:
+            RconExecute(server_name, 'stop')
+            InterFace.Reply(f'§b[MSC] §6§l{server_name}§a服务器已执行关闭命令……')
+        except Exception as e:
+            InterFace.Reply(f'§b[MSC] §4无法执行命令关闭服务器：§6§l{server_name}§4，原因为：§c{format(e)}')
+            raise RuntimeError(f'无法执行关闭命令：{e}')
+        finally:
+            # 服务器关闭后连接随之失效
+            RconConnections.Close(server_name)
+    elif Processes.SendInput(server_name, 'stop'):
+        # 由插件启动的子服可以直接在其控制台输入 stop
+        InterFace.Reply(f'§b[MSC] §6§l{server_name}§a服务器已通过控制台执行关闭命令……')
+    else:
+        InterFace.Reply(
+            f'§b[MSC] §4无法通过§6§lRcon§4关闭§6§l{server_name}§4服务器，因为§6§l{server_name}服务器的§6§lRcon未开启，且不是由插件启动的！')
+        raise RuntimeError('Rcon未开启')
+
+    timeout = setting.stop_timeout
+    try:
+        if server_probe.WaitUntil(lambda: ServerDown(setting), timeout, job.CheckCancelled) is None:
+            InterFace.Reply(f'§b[MSC] §6§l{server_name}§c在{timeout}秒内没有完全关闭')
+            raise RuntimeError(f'{timeout}秒内没有完全关闭')
+    finally:
+        # 服务器状态已经改变，缓存作废
+        ServerStatus.Invalidate(server_name)
+    elapsed = time.monotonic() - start_time
+    InterFace.Reply(f'§b[MSC] §6§l{server_name}§a已完全关闭（用时§e{elapsed:.1f}§a秒）')
+    return elapsed
+
+
+def Status(server: PluginServerInterface, source: CommandContext, is_show=True):
+    """
+    查询服务器状态（通过 Server List Ping，有效期内使用缓存）
+    :param server:
+    :param source: 命令源
+    :param is_show: 是否输出到游戏内（默认True）
+    :return:
+    """
+
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    if not ServerNameCheck(server, server_name):
+        return
+
+    status = GetStatus(server_name)
+    if is_show:
+        server.reply(f'§b[MSC] §f服务器状态：{FormatStatus(server_name, status)}')
+    return IsRunning(server_name)
+
+
+def StatusAll(server: PluginServerInterface, source: CommandContext):
+    """
+    同时查询所有服务器的状态
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    if not config.servers:
+        server.reply('§b[MSC] §e当前没有已配置的服务器')
+        return
+    status_all = GetAllStatus()
+    online = sum(status["online"] for status in status_all.values())
+    server.reply(f'§b[MSC] §f服务器状态（§a{online}§f/{len(status_all)}在线）：')
+    for server_name, status in status_all.items():
+        server.reply(FormatStatus(server_name, status))
+
+
+def Show(server: PluginServerInterface, source: CommandContext):
+    """
+    展示目标服务器信息
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
+        return
+
+    server.reply("================")
+    server.reply(f"§6§l{server_name}服务器信息如下：")
+    server.reply(f"描述：§e{setting.description}")
+
+    if setting.can_sync:
+        server.reply("是否允许被同步：§2是")
+    else:
+        server.reply("是否允许被同步：§c否")
+
+    auto = setting.auto_sync
+    if setting.can_sync and (auto.interval or auto.on_save):
+        modes = []
+        if auto.interval:
+            modes.append(f"每§e{auto.interval}§f秒")
+        if auto.on_save:
+            modes.append(f"主服保存§e{auto.debounce}§f秒后")
+        server.reply(f"自动同步：§2{'，'.join(modes)}（存档没有变化时跳过）")
+
+    if setting.versions.keep > 0:
+        server.reply(f"历史版本：§2保留最近§e{setting.versions.keep}§2次同步后的存档")
+
+    if setting.rcon.enable:
+        server.reply("Rcon启用情况：§2已启用")
+    else:
+        server.reply("Rcon启用情况：§c未启用")
+
+    Status(server, source, True)
+
+
+def Verify(server: PluginServerInterface, source: CommandContext):
+    """
+    检查目标服务器存档与上次同步时写入的清单是否一致
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
+        return
+
+    server.reply(f'§b[MSC] §d正在检查§6§l{server_name}§d服务器的存档......')
+    ignore = setting.ignore_files + ["session.lock"]
+    missing, extra, changed = [], [], []
+    worlds = setting.worlds
+    for world in worlds:
+        try:
+            result = manifest.Verify(setting.target, world, ignore, setting.scope)
+        except Exception as e:
+            server.reply(f'§b[MSC] §c检查存档时出现异常：§f{e}')
+            return
+        if result is None:
+            server.reply(f'§b[MSC] §6§l{server_name}§e的§6{world}§e还没有同步清单，请先执行一次同步')
+            return
+        # 同步多个存档时在路径前加上存档名
+        prefix = f'{world}/' if len(worlds) > 1 else ''
+        for items, found in zip((missing, extra, changed), result):
+            items.extend(prefix + rel for rel in found)
+
+    if not (missing or extra or changed):
+        server.reply(f'§b[MSC] §6§l{server_name}§a的存档与上次同步时一致')
+        return
+    server.reply(f'§b[MSC] §6§l{server_name}§e的存档与上次同步时不一致：'
+                 f'§c缺失{len(missing)}§e个，§c多出{len(extra)}§e个，§c被修改{len(changed)}§e个文件')
+    for title, items in (('缺失', missing), ('多出', extra), ('被修改', changed)):
+        for rel in items[:5]:
+            server.reply(f'§7  {title}：§f{rel}')
+        if len(items) > 5:
+            server.reply(f'§7  ……以及另外{len(items) - 5}个{title}的文件')
+
+
+def RunVerifyWorld(job, InterFace, server_name):
+    """
+    检查存档完整性的任务
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 目标服务器名字
+    :return: 检查结果：done/problems
+    """
+    setting = JobServer(job, server_name)
+    InterFace.Reply(f'§b[MSC] §d正在检查§6§l{server_name}§d服务器存档的完整性......')
+    report = CheckWorlds(job, setting, {world: f'{setting.target}/{world}' for world in setting.worlds})
+    if report.problems:
+        ReportWorldCheck(InterFace, server_name, report, "子服")
+        return "problems"
+    mode = "多进程" if report.mode == "process" else "多线程"
+    InterFace.Reply(f'§b[MSC] §6§l{server_name}§a的存档没有发现问题：{report.Summary()}§7（{mode}）')
+    return "done"
+
+
+def VerifyWorld(server: PluginServerInterface, source: CommandContext):
+    """
+    检查目标服务器存档的完整性：level.dat、区域文件的位置表与区块头，并解压抽查部分区块
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    setting = ServerNameCheck(server, server_name)
+    if setting is None:
+        return
+    if setting.remote.enable:
+        server.reply(f'§b[MSC] §6§l{server_name}§c使用远程同步，存档不在本机上，无法检查')
+        return
+
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "verify-world", RunVerifyWorld, reply, server_name, disk=True)
+
+
+def Exec(server: PluginServerInterface, source: CommandContext):
+    """
+    通过Rcon在目标服务器上执行命令，并输出返回内容
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+
+    members = GroupMembers(source["server_name"])
+    if members is not None:
+        ExecGroup(server, source["server_name"], members, source["command"])
+        return
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    if not ServerNameCheck(server, server_name):
+        return
+
+    try:
+        result = RconExecute(server_name, source["command"])
+    except Exception as e:
+        server.reply(f'§b[MSC] §4在§6§l{server_name}§4执行命令失败，原因为：§c{e}')
+        return
+    server.reply(f'§b[MSC] §6§l{server_name}§f> §7{source["command"]}')
+    for line in result.splitlines() or ['§7（无返回内容）']:
+        server.reply(line)
+
+
+def ExecGroup(server: PluginServerInterface, group, members, command):
+    """
+    通过Rcon在服务器组的每台服务器上并行执行命令，结束后汇总输出
+    :param server:
+    :param group: 组名
+    :param members: 组内的服务器名字
+    :param command: 命令
+    :return: None
+    """
+    def RunMember(server_name):
+        try:
+            return True, RconExecute(server_name, command)
+        except Exception as e:
+            return False, str(e)
+
+    current = config
+    members = [server_name for server_name in members if current.servers[server_name].rcon.enable]
+    with ThreadPoolExecutor(max_workers=GroupParallelism(), thread_name_prefix="MSC-Exec") as pool:
+        results = list(pool.map(RunMember, members))
+    done = sum(ok for ok, _ in results)
+    server.reply(f'§b[MSC] §f在服务器组§b{group}§f执行§7{command}§f：§a成功{done}§f，§c失败{len(results) - done}')
+    for server_name, (ok, output) in zip(members, results):
+        color = "§f" if ok else "§c"
+        server.reply(f'§6§l{server_name}§r> {color}{output.strip() or "§7（无返回内容）"}')
+
+
+def ShowLog(server: PluginServerInterface, source: CommandContext):
+    """
+    展示由插件启动的目标服务器最近的控制台输出
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+
+    server_name = source["server_name"]
+    # 检查名字是否在配置单中
+    if not ServerNameCheck(server, server_name):
+        return
+
+    lines = Processes.Log(server_name, source.get("lines", 20))
+    if lines is None:
+        server.reply(f'§b[MSC] §6§l{server_name}§e不是由插件启动的，没有控制台输出记录')
+        return
+    managed = Processes.Get(server_name)
+    if managed.Running():
+        state = f'§a运行中 §7PID {managed.pid}'
+    else:
+        state = f'§c已退出 §7退出码 {managed.exit_code}'
+    server.reply(f'§b[MSC] §6§l{server_name}§f最近{len(lines)}行输出（{state}§f）：')
+    for line in lines:
+        server.reply(f'§7{line}')
+
+
+def OnProcessExit(managed, restart):
+    """
+    子服进程退出时的提示
+    :param managed: 退出的进程
+    :param restart: 是否将自动重启
+    :return: None
+    """
+    ServerStatus.Invalidate(managed.server_name)
+    if managed.stopping:
+        return
+    InterFace = GetInterFace()
+    if restart:
+        InterFace.execute(
+            f'say §b[MSC] §6§l{managed.server_name}§c意外退出（退出码{managed.exit_code}），§e{managed.backoff}§f秒后自动重启'
+        )
+    else:
+        InterFace.execute(f'say §b[MSC] §6§l{managed.server_name}§c意外退出（退出码{managed.exit_code}）')
+
+
+def BeforeRestart(managed):
+    """
+    子服崩溃后自动重启前的检查：有改写存档的任务在执行或排队时放弃重启，
+    重启前标记清单失效（与手动启动一致，子服运行后上次同步的清单不再可信）
+    :param managed: 将要重启的进程
+    :return: 是否可以重启
+    """
+    server_name = managed.server_name
+    setting = config.servers.get(server_name)
+    if setting is None:
+        return False
+    if JobScheduler is not None and any(JobScheduler.Busy(server_name, kind) for kind in WORLD_JOBS):
+        GetInterFace().execute(f'say §b[MSC] §6§l{server_name}§e有同步或回滚任务正在进行，已取消自动重启')
+        return False
+    manifest.MarkDirty(setting.target, setting.worlds)
+    return True
+
+
+def Top(server: PluginServerInterface, source: CommandContext):
+    """
+    展示由插件启动的服务器的资源占用（进程及其子进程合计）
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    if MetricsSampler is None:
+        server.reply('§b[MSC] §c资源采样未开启或当前系统不支持（仅支持Linux）')
+        return
+    pids = Processes.Pids()
+    if not pids:
+        server.reply('§b[MSC] §e当前没有由插件启动的服务器')
+        return
+    server.reply(f'§b[MSC] §f资源占用（每{MetricsSampler.interval}秒采样）：')
+    for server_name, pid in pids.items():
+        latest = MetricsSampler.Latest(server_name)
+        if latest is None:
+            server.reply(f'§6§l{server_name}§r §7PID {pid} 等待采样……')
+            continue
+        cpu = MetricsSampler.series[server_name].Values('cpu')
+        server.reply(
+            f'§6§l{server_name}§r §7PID {pid} '
+            f'§fCPU §a{latest["cpu"]:.1f}%§7（平均{sum(cpu) / len(cpu):.1f}%，峰值{max(cpu):.1f}%） '
+            f'§f内存 §a{world_sync.FormatSize(latest["rss"])} '
+            f'§f线程 §a{latest["threads"]:.0f} '
+            f'§f读 §a{world_sync.FormatSize(latest["read_bps"])}/s §f写 §a{world_sync.FormatSize(latest["write_bps"])}/s'
+        )
+
+
+def StartMetrics():
+    """
+    按配置启动资源采样线程（采样在独立线程中进行，不占用 MCDR 主线程）
+    :return: None
+    """
+    global MetricsSampler
+    StopMetrics()
+    if not metrics.Supported() or not config.metrics_enable:
+        return
+    MetricsSampler = metrics.Sampler(
+        Processes.Pids,
+        config.metrics_interval,
+        config.metrics_samples
+    )
+    MetricsSampler.Start()
+
+
+def StopMetrics():
+    """
+    停止资源采样线程
+    :return: None
+    """
+    global MetricsSampler
+    if MetricsSampler is not None:
+        MetricsSampler.Stop()
+        MetricsSampler = None
+
+
+def AdoptProcesses(old_lib):
+    """
+    插件重载时接管上一次实例启动的子服进程，并沿用自动同步记录的存档签名
+    :param old_lib: 上一次实例的 my_lib 模块
+    :return: None
+    """
+    global Processes, AutoSyncs
+    old = getattr(old_lib, "Processes", None)
+    if old is not None:
+        Processes = old
+    old_auto = getattr(old_lib, "AutoSyncs", None)
+    if old_auto is not None:
+        AutoSyncs = auto_sync.AutoSync(SubmitAutoSync, logger=GetInterFace().logger)
+        AutoSyncs.signatures = dict(old_auto.signatures)
+
+
+def Reload(server: PluginServerInterface, source: CommandContext):
+    """
+    重新读取插件配置文件
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+
+    server.reply('§b[MSC] §2正在重载配置文件……')
+    try:
+        ReloadConfig()
+    except (OSError, settings.ConfigError) as e:
+        server.reply(f'§b[MSC] §c配置文件有误，继续使用原来的配置：§f{e}')
+        return
+    for warning in config.warnings:
+        server.reply(f'§b[MSC] §e{warning}')
+    server.reply('§b[MSC] §a重载完成！')
+
+
+def ReloadConfig():
+    """
+    重新读取配置文件并让新的配置生效，配置文件有误时抛出异常并继续使用原来的配置
+    正在执行的任务持有开始时的配置，重载不会等待任务，也不会影响任务
+    :return: None
+    """
+    with ReloadLock:
+        old = config
+        ConfigToDo()
+        ApplyConfig(old)
+
+
+def ApplyConfig(old):
+    """
+    让新加载的配置生效，命令处理线程池、接收端、资源采样与 Rcon 连接只在相关配置改变时重新创建
+    :param old: 原来的配置，首次加载时为 None
+    :return: None
+    """
+    Processes.log_lines = config.log_lines
+    JobScheduler.max_disk_jobs = config.max_disk_jobs
+    ServerStatus.ttl = config.status_ttl
+    ServerStatus.Invalidate()
+    if old is None or old.command_workers != config.command_workers:
+        StartCommandPool()
+    if old is not None:
+        # Rcon 配置改变的连接在下次使用时重新建立
+        for server_name, setting in old.servers.items():
+            new = config.servers.get(server_name)
+            if new is None or new.rcon != setting.rcon:
+                RconConnections.Close(server_name)
+    if old is None or old.receiver != config.receiver:
+        StartReceiver(GetInterFace())
+    if old is None or (old.metrics_enable, old.metrics_interval, old.metrics_samples) != \
+            (config.metrics_enable, config.metrics_interval, config.metrics_samples):
+        StartMetrics()
+    StartWatchers()
+    StartAutoSync()
+    StartConfigWatch()
+
+
+def OnConfigChanged():
+    """
+    配置文件被修改后自动重载（在配置文件检查线程中执行）
+    :return: None
+    """
+    logger = GetInterFace().logger
+    try:
+        ReloadConfig()
+    except (OSError, settings.ConfigError) as e:
+        logger.error(f'[MSC] 配置文件已修改但有误，继续使用原来的配置：{e}')
+        return
+    for warning in config.warnings:
+        logger.warning(f'[MSC] 配置文件：{warning}')
+    logger.info('[MSC] 配置文件已修改，已自动重载')
+
+
+def StartConfigWatch():
+    """
+    按配置启动或更新配置文件检查线程，config_watch_interval 为 0 时停止
+    :return: None
+    """
+    global ConfigWatch
+    if config.config_watch_interval <= 0:
+        StopConfigWatch()
+        return
+    if ConfigWatch is None:
+        ConfigWatch = settings.ConfigWatcher(
+            default_config.CONFIG_PATH, config.config_watch_interval, OnConfigChanged, config.stamp
+        )
+        ConfigWatch.Start()
+        return
+    ConfigWatch.interval = config.config_watch_interval
+    # 通过命令重载过的文件不再自动重载
+    ConfigWatch.stamp = config.stamp
+
+
+def StopConfigWatch():
+    """
+    停止配置文件检查线程
+    :return: None
+    """
+    global ConfigWatch
+    if ConfigWatch is not None:
+        ConfigWatch.Stop()
+        ConfigWatch = None
+
+
+def RegisterServer(server_name, block):
+    """
+    把新的子服写入配置文件（加入 server_list）并立即让新的配置生效，不需要重载插件
+    调用方需要持有 CreateLock
+    :param server_name: 服务器名字
+    :param block: 子服的配置
+    :return: None，加入后配置不合法时抛出 settings.ConfigError，配置文件保持不变
+    """
+    config_path = default_config.CONFIG_PATH
+    with open(config_path, "r", encoding="utf-8") as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise settings.ConfigError(f'不是合法的JSON：{e}')
+    if server_name in data:
+        raise settings.ConfigError(f'{server_name}：配置文件中已有同名的配置项')
+    data[server_name] = block
+    data["server_list"] = list(data.get("server_list", [])) + [server_name]
+    settings.Config.Parse(data, '', [])
+    temp = config_path + world_sync.TEMP_SUFFIX
+    with open(temp, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    os.replace(temp, config_path)
+    # 重载时同时更新自动重载记录的修改时间，不会再重载一次
+    ReloadConfig()
+
+
+def UsedPorts(current):
+    """
+    配置中已经使用的本机端口
+    :param current: settings.Config
+    :return: 端口集合
+    """
+    used = set()
+    for setting in current.servers.values():
+        used.update((setting.port, setting.rcon.port))
+    if current.receiver.enable:
+        used.add(current.receiver.port)
+    return used
+
+
+def RunCreate(job, InterFace, server_name, template_name):
+    """
+    用模板创建子服的任务：复制模板文件夹，分配端口与 Rcon，写入配置文件并立即生效
+    :param job: 当前任务
+    :param InterFace:
+    :param server_name: 新的服务器名字
+    :param template_name: 模板名字
+    :return: 创建结果：done/aborted
+    """
+    template = job.config.templates.get(template_name)
+    if template is None:
+        raise RuntimeError(f'模板{template_name}已从配置中移除')
+    folder = f'{template.root}/{templates.FolderName(server_name)}'
+    if not os.path.isdir(os.path.join(template.dir, "server")):
+        InterFace.Reply(f"§b[MSC] §c模板文件夹§f{template.dir}§c下没有server文件夹")
+        return "aborted"
+    with CreateLock:
+        current = config
+        if server_name in current.servers:
+            InterFace.Reply(f"§b[MSC] §6§l{server_name}§c已经在配置中")
+            return "aborted"
+        if os.path.exists(folder):
+            InterFace.Reply(f"§b[MSC] §c文件夹§f{folder}§c已存在，请换一个名字或先删除该文件夹")
+            return "aborted"
+        ports = templates.FreePorts(2, template.port_min, template.port_max, UsedPorts(current))
+        if ports is None:
+            InterFace.Reply(f"§b[MSC] §c端口§e{template.port_min}~{template.port_max}§c中没有足够的空闲端口")
+            return "aborted"
+        port, rcon_port = ports
+
+        InterFace.Reply(f"§b[MSC] §d正在从模板§b{template_name}§d创建服务器§6§l{server_name}§d......")
+        start_time = time.monotonic()
+        info = templates.CloneTemplate(
+            template.dir, folder, template.link, template.ignore, templates.CLONE_WORKERS, job.CheckCancelled
+        )
+        password = templates.RconPassword()
+        block = dict(template.server)
+        block.setdefault("description", f"由模板{template_name}创建")
+        block.update({
+            "port": port,
+            "rcon": {"enable": True, "host": "127.0.0.1", "port": rcon_port, "password": password},
+            "target": f"{folder}/server",
+        })
+        try:
+            templates.UpdateProperties(f"{folder}/server/server.properties", {
+                "server-port": port,
+                "query.port": port,
+                "enable-rcon": "true",
+                "rcon.port": rcon_port,
+                "rcon.password": password,
+            })
+            RegisterServer(server_name, block)
+        except (OSError, settings.ConfigError) as e:
+            shutil.rmtree(folder, ignore_errors=True)
+            InterFace.Reply(f"§b[MSC] §c创建服务器§6§l{server_name}§c失败，已删除复制的文件夹：§f{e}")
+            raise
+    elapsed = time.monotonic() - start_time
+    InterFace.Reply(f"§b[MSC] §2已从模板§b{template_name}§2创建服务器§6§l{server_name}§2！用时§a{elapsed:.2f}§2秒，"
+                    f"端口§e{port}§2，Rcon端口§e{rcon_port}")
+    InterFace.Reply(f"§b[MSC] §7复制§f{info['files']}§7个文件（§f{world_sync.FormatSize(info['bytes'])}§7），"
+                    f"其中§f{info['linked_files']}§7个硬链接到模板，可以使用§6!!msc start {server_name}§7启动")
+    return "done"
+
+
+def Create(server: PluginServerInterface, source: CommandContext):
+    """
+    用模板创建子服检查
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    server_name = source["server_name"]
+    template_name = source["template"]
+    current = config
+    if not templates.NAME_PATTERN.fullmatch(server_name):
+        server.reply(f'§b[MSC] §c服务器名字只能以小写字母开头，后面只能是小写字母或数字：§f{server_name}')
+        return
+    if server_name in current.servers or server_name in current.groups or server_name == "all" or \
+            server_name in settings.Names(settings.Config.FIELDS):
+        server.reply(f'§b[MSC] §6§l{server_name}§c已被使用（服务器、服务器组或配置项），请换一个名字')
+        return
+    if template_name not in current.templates:
+        server.reply(f'§b[MSC] §c没有名为§b{template_name}§c的模板，已配置的模板有：§6{"，".join(current.templates) or "无"}')
+        return
+
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "create", RunCreate, reply, server_name, template_name, disk=True)
+
+
+def RestartSync(server: PluginServerInterface, source: CommandContext):
+    """
+    服务器重启（同步版）
+    :param server: 服务器实例
+    :param source: 消息源
+    :return: None
     """
     Restart(server, source, True)
 
@@ -458,53 +2050,179 @@ def Restart(server: PluginServerInterface, source: CommandContext, can_sync=Fals
     :param can_sync: 是否一并执行同步
     :return: None
     """
-    global InterFace, restartFlag
-
+    if GroupCommand(server, source, "restart", ServerRestart, can_sync, disk=can_sync):
+        return
     server_name = source["server_name"]
     # 检查名字是否在配置单中
     if not ServerNameCheck(server, server_name):
         return
 
-    InterFace = GetInterFace()
-
-    if restartFlag:
-        InterFace.execute(f'say §b[MSC] §6§l{server_name}§e服务器§a正在重启中§e，请勿重复提交重启任务！')
-    else:
-        InterFace.execute(f'say §b[MSC] §6§l{server_name}§f服务器开始执行§a重启......')
-        ServerRestart(InterFace, server, source, can_sync)
+    reply = CommandFeedback(server)
+    SubmitJob(reply, server_name, "restart", ServerRestart, reply, server_name, can_sync, disk=can_sync)
 
 
-@new_thread("MSC-Restart")
-def ServerRestart(InterFace, server: PluginServerInterface, source: CommandContext, can_sync=False):
+def ServerRestart(job, InterFace, server_name, can_sync=False):
     """
-    服务器重启操作
+    服务器重启操作（在任务线程中执行，关闭、同步、启动之间不会插入该服务器的其他任务）
+    :param job: 当前任务
     :param InterFace: 当前插件实例
-    :param server: 服务器实例
-    :param source: 消息源
+    :param server_name: 目标服务器名字
     :param can_sync: 是否一并执行同步
     :return: None
     """
-    global restartFlag
-    server_name = source["server_name"]
+    InterFace.Reply(f'§b[MSC] §6§l{server_name}§f服务器开始执行§a重启......')
     try:
-        # 检查服务器是否已关闭，如果没关闭，先执行关闭
-        if Status(server, source, False) is True:
-            Stop(server, source, InterFace)
-            time.sleep(4)
+        # 检查服务器是否已关闭，如果没关闭，先执行关闭并等待完全关闭
+        shutdown = None
+        if IsRunning(server_name):
+            shutdown = RunStop(job, InterFace, server_name)
+            if shutdown is None:
+                raise RuntimeError('服务器未能完全关闭')
+        job.CheckCancelled()
         # 同步,需要阻塞到同步完成
-        if can_sync:
-            Sync(server, source, InterFace, True)
-        # 启动
-        Start(server, source, InterFace)
-        InterFace.execute(
-            f'say §b[MSC] §6§l{server_name}§a已重启完毕，请等待服务器完全启动！'
+        if can_sync and SyncAllowed(InterFace, JobServer(job, server_name)):
+            RunSync(job, InterFace, server_name, True)
+        job.CheckCancelled()
+        # 启动并等待启动完毕
+        startup = RunStart(job, InterFace, server_name)
+        if startup is None:
+            raise RuntimeError('服务器未能启动完毕')
+        InterFace.Reply(
+            f'§b[MSC] §6§l{server_name}§a已重启完毕！关闭用时§e{shutdown or 0:.1f}§a秒，启动用时§e{startup:.1f}§a秒'
         )
+    except jobs.JobCancelled:
+        InterFace.Reply(f'§b[MSC] §6§l{server_name}§e的重启任务已被取消')
+        raise
     except Exception as e:
-        InterFace.execute(
-            f'say §b[MSC] §4重启服务器§6§l{server_name}§4失败，原因为：§c{format(e)}'
+        InterFace.Reply(
+            f'§b[MSC] §4重启服务器§6§l{server_name}§4失败，原因为：§c{format(e)}'
         )
-    finally:
-        restartFlag = False
+        raise
+
+
+def ListJobs(server: PluginServerInterface, source: CommandContext):
+    """
+    展示任务队列（未结束的任务与最近结束的任务）
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    job_list = JobScheduler.List()
+    if not job_list:
+        server.reply('§b[MSC] §f当前没有任务')
+        return
+    server.reply('§b[MSC] §f任务列表：')
+    for job in job_list:
+        server.reply(job.Describe())
+
+
+def CancelJob(server: PluginServerInterface, source: CommandContext):
+    """
+    取消任务
+    :param server:
+    :param source: 命令源
+    :return:
+    """
+    job = JobScheduler.Cancel(source["job_id"])
+    if job is None:
+        server.reply(f'§b[MSC] §c任务§b#{source["job_id"]}§c不存在或已结束')
+    elif job.state == 'queued':
+        server.reply(f'§b[MSC] §a已取消任务§b#{job.id}')
+    else:
+        server.reply(f'§b[MSC] §e任务§b#{job.id}§e正在执行，将在当前文件处理完后停止')
+
+
+def StartReceiver(server: PluginServerInterface):
+    """
+    按配置启动远程同步接收端（在子服所在的主机上使用）
+    :param server:
+    :return: None
+    """
+    global Receiver
+    StopReceiver()
+    receiver = config.receiver
+    if not receiver.enable:
+        return
+    try:
+        Receiver = remote_sync.Receiver(
+            receiver.host,
+            receiver.port,
+            receiver.token,
+            receiver.targets,
+            server.logger,
+            receiver.ports
+        )
+        Receiver.Start()
+        server.logger.info(f'[MSC] 远程同步接收端已在{receiver.host}:{receiver.port}上启动')
+    except Exception as e:
+        Receiver = None
+        server.logger.error(f'[MSC] 远程同步接收端启动失败：{e}')
+
+
+def StopReceiver():
+    """
+    停止远程同步接收端
+    :return: None
+    """
+    global Receiver
+    if Receiver is not None:
+        Receiver.Stop()
+        Receiver = None
+
+
+def Async(handler):
+    """
+    包装命令处理函数：MCDR 调用时只把处理函数提交到命令处理线程池，立即返回
+    :param handler: 命令处理函数 (命令源, 命令上下文)
+    :return: 包装后的函数
+    """
+    def Submit(server, source):
+        with CommandPoolLock:
+            CommandPool.submit(RunCommand, handler, server, source)
+
+    Submit.__name__ = handler.__name__
+    return Submit
+
+
+def RunCommand(handler, server, source):
+    """
+    在命令处理线程中执行命令处理函数，出现异常时回复命令源
+    :param handler: 命令处理函数
+    :param server: 命令源
+    :param source: 命令上下文
+    :return: None
+    """
+    try:
+        handler(server, source)
+    except Exception as e:
+        GetInterFace().logger.exception(f'[MSC] 执行命令{handler.__name__}时出现异常')
+        server.reply(f'§b[MSC] §c执行命令时出现异常，请把内容报告给管理员：§f{e}')
+
+
+def StartCommandPool():
+    """
+    按配置的线程数创建命令处理线程池，已有线程池时替换：之后的命令交给新的线程池，
+    旧的线程池执行完已提交的命令（包括正在执行重载的这条命令）后退出
+    :return: None
+    """
+    global CommandPool
+    pool = ThreadPoolExecutor(max_workers=config.command_workers, thread_name_prefix="MSC-Command")
+    with CommandPoolLock:
+        old, CommandPool = CommandPool, pool
+    if old is not None:
+        old.shutdown(wait=False)
+
+
+def StopCommandPool():
+    """
+    关闭命令处理线程池，已提交的命令仍会执行完
+    :return: None
+    """
+    global CommandPool
+    with CommandPoolLock:
+        old, CommandPool = CommandPool, None
+    if old is not None:
+        old.shutdown(wait=False)
 
 
 def register(server: PluginServerInterface):
@@ -513,58 +2231,132 @@ def register(server: PluginServerInterface):
     :param server: 服务器插件实例
     :return: None
     """
-    global plugin_level
+    global JobScheduler
     ConfigToDo()
+    Processes.on_exit = OnProcessExit
+    Processes.before_restart = BeforeRestart
+    # 任务开始执行时取得当时的配置
+    JobScheduler = jobs.Scheduler(config.max_disk_jobs, lambda: config)
+    ApplyConfig(None)
     server.register_help_message("!!msc", "MultiServerControl 帮助")
 
     server.register_command(
-        Literal("!!msc").requires(lambda src: src.has_permission(plugin_level.get("help"))).runs(DisplayHelp).
+        Literal("!!msc").requires(lambda src: src.has_permission(config.perm.get("help"))).runs(Async(DisplayHelp)).
         then(
-            Literal("help").requires(lambda src: src.has_permission(plugin_level.get("help"))).runs(DisplayHelp)
+            Literal("help").requires(lambda src: src.has_permission(config.perm.get("help"))).runs(Async(DisplayHelp))
         ).
         then(
-            Literal("list").requires(lambda src: src.has_permission(plugin_level.get("list"))).runs(DisplayList)
+            Literal("list").requires(lambda src: src.has_permission(config.perm.get("list"))).runs(Async(DisplayList))
         ).
         then(
-            Literal("reload").requires(lambda src: src.has_permission(plugin_level.get("reload"))).runs(Reload)
+            Literal("reload").requires(lambda src: src.has_permission(config.perm.get("reload"))).runs(Async(Reload))
         ).
         then(
             Literal("restart").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("restart"))).runs(Restart).
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("restart"))).runs(Async(Restart)).
                 then(
-                    Literal("sync").requires(lambda src: src.has_permission(plugin_level.get("sync"))).runs(RestartSync)
+                    Literal("sync").requires(lambda src: src.has_permission(config.perm.get("sync"))).runs(Async(RestartSync))
                 )
             )
         ).
         then(
             Literal("sync").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("sync"))).runs(Sync)
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("sync"))).runs(Async(Sync))
             )
         ).
         then(
             Literal("start").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("start"))).runs(Start)
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("start"))).runs(Async(Start))
             )
         ).
         then(
             Literal("stop").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("stop"))).runs(Stop)
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("stop"))).runs(Async(Stop))
             )
         ).
         then(
             Literal("show").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("show"))).runs(Show)
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("show"))).runs(Async(Show))
+            )
+        ).
+        then(
+            Literal("status").requires(lambda src: src.has_permission(config.perm.get("status"))).runs(Async(StatusAll)).
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("status"))).runs(Async(Status))
+            )
+        ).
+        then(
+            Literal("verify").
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("verify", 1))).runs(Async(Verify))
+            )
+        ).
+        then(
+            Literal("verify-world").
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("verify_world", 1))).runs(Async(VerifyWorld))
+            )
+        ).
+        then(
+            Literal("versions").
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("versions", 1))).runs(Async(ShowVersions))
+            )
+        ).
+        then(
+            Literal("rollback").
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("rollback", 2))).runs(Async(Rollback)).
+                then(
+                    Integer("steps").at_min(0).runs(Async(Rollback))
+                )
             )
         ).
         then(
-            Literal("status").
+            Literal("exec").
             then(
-                Text("server_name").requires(lambda src: src.has_permission(plugin_level.get("status"))).runs(Status)
+                Text("server_name").
+                then(
+                    GreedyText("command").requires(lambda src: src.has_permission(config.perm.get("exec", 3))).runs(Async(Exec))
+                )
+            )
+        ).
+        then(
+            Literal("log").
+            then(
+                Text("server_name").requires(lambda src: src.has_permission(config.perm.get("log", 2))).runs(Async(ShowLog)).
+                then(
+                    Integer("lines").at_min(1).runs(Async(ShowLog))
+                )
+            )
+        ).
+        then(
+            Literal("top").requires(lambda src: src.has_permission(config.perm.get("top", 1))).runs(Async(Top))
+        ).
+        then(
+            Literal("jobs").requires(lambda src: src.has_permission(config.perm.get("jobs", 1))).runs(Async(ListJobs))
+        ).
+        then(
+            Literal("cancel").
+            then(
+                Integer("job_id").requires(lambda src: src.has_permission(config.perm.get("cancel", 2))).runs(Async(CancelJob))
+            )
+        ).
+        then(
+            Literal("create").
+            then(
+                Text("server_name").
+                then(
+                    Literal("from").
+                    then(
+                        Text("template").requires(lambda src: src.has_permission(config.perm.get("create", 3))).runs(Async(Create))
+                    )
+                )
             )
         )
     )
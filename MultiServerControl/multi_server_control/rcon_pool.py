@@ -0,0 +1,168 @@
+import socket
+import threading
+import time
+
+"""
+Rcon 连接池
+每台服务器保持一条已登录的 Rcon 连接，使用前检查连接是否仍然可用，断开时自动重连，
+避免每条命令都重新建立 TCP 连接与登录
+"""
+
+# 空闲超过该时间（秒）的连接会被关闭
+IDLE_TIMEOUT = 300
+# 单条命令的重试次数（包含断线重连）
+MAX_RETRY = 3
+# 等待同一台服务器的连接空闲的最长时间（秒），超时说明前面的命令卡住了
+ACQUIRE_TIMEOUT = 60
+
+
+class RconError(Exception):
+    """
+    Rcon 无法连接、登录失败或命令没有返回
+    """
+    pass
+
+
+class PooledConnection:
+    """
+    连接池中的一条连接
+    """
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+
+
+class RconPool:
+    """
+    按服务器名字保存的 Rcon 连接池
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, acquire_timeout=ACQUIRE_TIMEOUT):
+        """
+        :param idle_timeout: 空闲连接的保留时间（秒）
+        :param acquire_timeout: 等待连接空闲的最长时间（秒）
+        """
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def Entry(self, server_name, factory):
+        """
+        获取服务器的连接，没有时用 factory 创建（尚未连接）
+        :param server_name: 服务器名字
+        :param factory: 创建 RconConnection 的函数
+        :return: PooledConnection
+        """
+        with self.lock:
+            entry = self.entries.get(server_name)
+            if entry is None:
+                entry = self.entries[server_name] = PooledConnection(factory())
+            return entry
+
+    @staticmethod
+    def Healthy(conn):
+        """
+        检查连接是否仍然可用：非阻塞地窥探套接字，对端已关闭或有未读取的残留数据都视为不可用
+        :param conn: RconConnection
+        :return: 是否可用
+        """
+        sock = conn.socket
+        if sock is None:
+            return False
+        try:
+            sock.setblocking(False)
+            # 读到 EOF（对端已关闭）或残留数据都不可用，只有暂无数据可读时连接才是好的
+            sock.recv(1, socket.MSG_PEEK)
+            return False
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        finally:
+            try:
+                sock.settimeout(conn.READ_WRITE_TIMEOUT_SEC)
+            except OSError:
+                pass
+
+    @staticmethod
+    def Connect(entry):
+        """
+        确保连接可用，不可用时重新连接并登录（调用时需持有 entry.lock）
+        :param entry: PooledConnection
+        :return: None
+        """
+        if RconPool.Healthy(entry.conn):
+            return
+        try:
+            connected = entry.conn.connect()
+        except OSError as e:
+            entry.conn.disconnect()
+            raise RconError(f'无法连接：{e}')
+        if not connected:
+            raise RconError('登录失败，请检查密码')
+
+    def Execute(self, server_name, factory, commands):
+        """
+        在同一条连接上依次执行多条命令
+        Minecraft 的 Rcon 实现要求每次读取恰好是一个完整的数据包，不能把多条命令一次性发出（流水线），
+        因此批量命令仍是逐条往返，只是省去了每条命令的连接与登录
+        每台服务器只有一条连接，其他线程正在使用时等待，超过 acquire_timeout 仍未空闲时放弃
+        :param server_name: 服务器名字
+        :param factory: 创建 RconConnection 的函数
+        :param commands: 命令列表
+        :return: 每条命令的返回内容列表
+        """
+        self.Prune()
+        entry = self.Entry(server_name, factory)
+        results = []
+        if not entry.lock.acquire(timeout=self.acquire_timeout):
+            raise RconError(f'连接正忙：等待{self.acquire_timeout}秒后仍有命令在执行')
+        try:
+            self.Connect(entry)
+            for command in commands:
+                result = entry.conn.send_command(command, max_retry_time=MAX_RETRY)
+                if result is None:
+                    entry.conn.disconnect()
+                    raise RconError(f'命令没有返回：{command}')
+                results.append(result)
+            entry.last_used = time.monotonic()
+        finally:
+            entry.lock.release()
+        return results
+
+    def Close(self, server_name=None):
+        """
+        关闭连接（服务器关闭或配置重载时调用）
+        :param server_name: 服务器名字，None 表示全部
+        :return: None
+        """
+        with self.lock:
+            if server_name is None:
+                closing = list(self.entries.values())
+                self.entries.clear()
+            else:
+                closing = [self.entries.pop(server_name)] if server_name in self.entries else []
+        for entry in closing:
+            with entry.lock:
+                entry.conn.disconnect()
+
+    def Prune(self):
+        """
+        关闭空闲过久的连接
+        :return: None
+        """
+        now = time.monotonic()
+        with self.lock:
+            idle = [name for name, entry in self.entries.items() if now - entry.last_used > self.idle_timeout]
+        for name in idle:
+            entry = self.entries.get(name)
+            # 正在使用的连接不关闭
+            if entry is not None and entry.lock.acquire(blocking=False):
+                try:
+                    if now - entry.last_used > self.idle_timeout:
+                        entry.conn.disconnect()
+                finally:
+                    entry.lock.release()
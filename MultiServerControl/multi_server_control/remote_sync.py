@@ -0,0 +1,482 @@
+import hashlib
+import hmac
+import json
+import os
+import shutil
+import socket
+import socketserver
+import struct
+import threading
+import zlib
+
+from . import templates, world_sync
+
+"""
+远程同步
+主控端（发送端）把变化的存档文件压缩后按块通过 TCP 发送给目标主机上的接收端，
+接收端同样是运行在 MCDR 下的本插件。每个数据块带 CRC32 校验，每个文件传输完成后再比较整体哈希；
+连接中断时已接收的部分会保留下来，下一次同步从断点继续传输
+
+帧格式：1 字节类型 + 4 字节长度 + 内容
+    J：JSON 控制消息
+    D：数据块，内容为 4 字节原始数据 CRC32 + zlib 压缩后的数据
+"""
+
+PROTOCOL_VERSION = 2
+# 每个数据块的原始大小
+CHUNK_SIZE = 1024 * 1024
+# zlib 压缩等级，存档数据以速度优先
+COMPRESS_LEVEL = 1
+# 单帧最大长度，防止异常数据导致一次申请过多内存
+MAX_FRAME_SIZE = CHUNK_SIZE * 2 + 64
+# 未传输完成的文件与其元数据的后缀（均以 TEMP_SUFFIX 结尾，扫描存档时会被跳过）
+PART_SUFFIX = '.part' + world_sync.TEMP_SUFFIX
+META_SUFFIX = '.meta' + world_sync.TEMP_SUFFIX
+# 连接超时（秒）
+SOCKET_TIMEOUT = 60
+# 目标服务器 server.properties 中没有 server-port 时使用的端口（与 Minecraft 一致）
+DEFAULT_SERVER_PORT = 25565
+
+
+class RemoteSyncError(Exception):
+    """
+    远程同步协议错误
+    """
+    pass
+
+
+class TargetRunning(RemoteSyncError):
+    """
+    接收端的目标服务器正在运行，拒绝同步
+    """
+    pass
+
+
+def SendFrame(sock, kind, payload):
+    """
+    发送一帧
+    :param sock: 套接字
+    :param kind: 帧类型（b'J' 或 b'D'）
+    :param payload: 帧内容
+    :return: None
+    """
+    sock.sendall(struct.pack('>cI', kind, len(payload)) + payload)
+
+
+def RecvFrame(stream):
+    """
+    接收一帧
+    :param stream: 套接字的读取流（socket.makefile('rb')）
+    :return: (帧类型, 帧内容)
+    """
+    header = stream.read(5)
+    if len(header) < 5:
+        raise RemoteSyncError('连接已断开')
+    kind, length = struct.unpack('>cI', header)
+    if length > MAX_FRAME_SIZE:
+        raise RemoteSyncError(f'帧长度异常：{length}')
+    payload = stream.read(length)
+    if len(payload) < length:
+        raise RemoteSyncError('连接已断开')
+    return kind, payload
+
+
+def SendJson(sock, data):
+    """
+    发送 JSON 控制消息
+    :param sock: 套接字
+    :param data: 消息内容
+    :return: None
+    """
+    SendFrame(sock, b'J', json.dumps(data, separators=(',', ':')).encode('utf-8'))
+
+
+def RecvJson(stream):
+    """
+    接收 JSON 控制消息，对方返回错误时抛出异常
+    :param stream: 套接字的读取流
+    :return: 消息内容
+    """
+    kind, payload = RecvFrame(stream)
+    if kind != b'J':
+        raise RemoteSyncError(f'期望控制消息，收到：{kind}')
+    data = json.loads(payload.decode('utf-8'))
+    if data.get('error'):
+        raise (TargetRunning if data.get('running') else RemoteSyncError)(data['error'])
+    return data
+
+
+def SafeJoin(root, rel):
+    """
+    拼接接收端路径，拒绝跳出目标存档的路径
+    :param root: 目标存档路径
+    :param rel: 相对路径
+    :return: 完整路径
+    """
+    if not rel or rel.startswith('/') or '\\' in rel or any(part in ('', '.', '..') for part in rel.split('/')):
+        raise RemoteSyncError(f'非法路径：{rel}')
+    return os.path.join(root, rel)
+
+
+def ServerPort(server_path):
+    """
+    读取目标服务器的游戏端口
+    :param server_path: 服务器文件夹路径
+    :return: server.properties 中的 server-port，没有时为默认端口
+    """
+    try:
+        with open(os.path.join(server_path, 'server.properties'), 'r', encoding='utf-8') as f:
+            for line in f:
+                key, _, value = line.partition('=')
+                if key.strip() == 'server-port' and value.strip().isdigit():
+                    return int(value.strip())
+    except OSError:
+        pass
+    return DEFAULT_SERVER_PORT
+
+
+def RemoteSync(host, port, token, server_name, source, ignore, timeout=SOCKET_TIMEOUT, check=None, progress=None,
+               world='world', scope=None, limiter=None):
+    """
+    把本地存档同步到远程接收端
+    :param host: 接收端地址
+    :param port: 接收端端口
+    :param token: 接收端令牌
+    :param server_name: 目标服务器名字（接收端按名字找到本地路径）
+    :param source: 本地源存档路径
+    :param ignore: 忽略列表
+    :param timeout: 连接超时
+    :param check: 每个文件开始前调用的检查函数（抛出异常即中断，接收端保留已传输的部分）
+    :param progress: SyncProgress，记录 scan/plan/copy/finish 阶段的耗时与发送进度
+    :param world: 存档文件夹名（接收端写入目标服务器下的同名文件夹）
+    :param scope: SyncScope，范围外的文件不发送，接收端也不会删除
+    :param limiter: throttle.IoLimiter，限制读取本地文件的速度，为 None 时不限速
+    :return: SyncReport，sent_bytes 为压缩后实际发送的字节数
+    """
+    progress = progress or world_sync.SyncProgress()
+    report = world_sync.SyncReport()
+    with progress.Phase('scan'):
+        files, dirs = world_sync.ScanTree(source, ignore, scope)
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        stream = sock.makefile('rb')
+        SendJson(sock, {'op': 'hello', 'version': PROTOCOL_VERSION, 'token': token, 'server': server_name,
+                        'world': world})
+        RecvJson(stream)
+
+        # 接收端比较差异并删除多余的文件
+        with progress.Phase('plan'):
+            SendJson(sock, {
+                'op': 'index',
+                'files': {rel: list(stat) for rel, stat in files.items()},
+                'dirs': sorted(dirs),
+                'ignore': ignore,
+                'scope': scope.ToDict() if scope is not None else None
+            })
+            plan = RecvJson(stream)
+        report.deleted_files = plan['deleted_files']
+        report.deleted_bytes = plan['deleted_bytes']
+        need = dict((rel, offset) for rel, offset in plan['need'])
+        report.skipped_files = len(files) - len(need)
+        report.skipped_bytes = sum(size for rel, (size, _) in files.items() if rel not in need)
+
+        with progress.Phase('copy'):
+            progress.AddTotal(len(need), sum(files[rel][0] for rel in need))
+            for rel, offset in need.items():
+                if check is not None:
+                    check()
+                size, mtime = files[rel]
+                report.sent_bytes += SendFile(sock, os.path.join(source, rel), rel, offset, mtime, limiter, check)
+                report.copied_files += 1
+                report.copied_bytes += size
+                progress.Add(size)
+
+        # 接收端校验并落盘
+        with progress.Phase('finish'):
+            SendJson(sock, {'op': 'finish'})
+            result = RecvJson(stream)
+        if result['failed']:
+            raise RemoteSyncError(f'{len(result["failed"])}个文件校验失败：{"，".join(result["failed"][:5])}')
+    return report
+
+
+def SendFile(sock, file_path, rel, offset, mtime, limiter=None, check=None):
+    """
+    发送单个文件，offset 大于 0 时跳过接收端已有的部分（仍参与哈希计算）
+    :param sock: 套接字
+    :param file_path: 本地文件路径
+    :param rel: 相对路径
+    :param offset: 接收端已有的字节数
+    :param mtime: 修改时间（ns）
+    :param limiter: throttle.IoLimiter，每读取一块之前申请令牌
+    :param check: 等待限速期间调用的检查函数
+    :return: 实际发送的字节数
+    """
+    sent = 0
+    digest = hashlib.blake2b(digest_size=16)
+    SendJson(sock, {'op': 'file', 'path': rel, 'offset': offset, 'mtime': mtime})
+    with open(file_path, 'rb') as f:
+        remain = offset
+        while remain > 0:
+            block = f.read(min(CHUNK_SIZE, remain))
+            if not block:
+                break
+            if limiter is not None:
+                limiter.Consume(len(block), 1, check)
+            digest.update(block)
+            remain -= len(block)
+        while True:
+            block = f.read(CHUNK_SIZE)
+            if not block:
+                break
+            if limiter is not None:
+                limiter.Consume(len(block), 1, check)
+            digest.update(block)
+            payload = struct.pack('>I', zlib.crc32(block)) + zlib.compress(block, COMPRESS_LEVEL)
+            SendFrame(sock, b'D', payload)
+            sent += len(payload)
+        if limiter is not None:
+            limiter.Drop(f.fileno(), True, mtime / 1e9)
+    SendJson(sock, {'op': 'end', 'hash': digest.hexdigest()})
+    return sent
+
+
+class Receiver:
+    """
+    接收端：在目标主机上监听端口，把收到的存档写入对应服务器的 world
+    """
+
+    def __init__(self, host, port, token, targets, logger=None, ports=None):
+        """
+        :param host: 监听地址
+        :param port: 监听端口
+        :param token: 令牌
+        :param targets: {服务器名字: 服务器文件夹路径}
+        :param logger: 日志
+        :param ports: {服务器名字: 游戏端口}，没有配置的服务器读取 server.properties
+        """
+        self.token = token
+        self.targets = targets
+        self.ports = ports or {}
+        self.logger = logger
+        self.locks = {name: threading.Lock() for name in targets}
+        receiver = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                receiver.Handle(self.request, self.rfile)
+
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler, bind_and_activate=False)
+        self.server.daemon_threads = True
+        self.server.allow_reuse_address = True
+        self.server.server_bind()
+        self.server.server_activate()
+        self.thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def Start(self):
+        """
+        在后台线程中开始监听
+        :return: None
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name='MSC-Receiver', daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        """
+        停止监听
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def Handle(self, sock, stream):
+        """
+        处理一次同步连接
+        :param sock: 套接字
+        :param stream: 读取流
+        :return: None
+        """
+        sock.settimeout(SOCKET_TIMEOUT)
+        try:
+            hello = RecvJson(stream)
+            if hello.get('version') != PROTOCOL_VERSION:
+                raise RemoteSyncError(f'协议版本不一致：{hello.get("version")}')
+            if not hmac.compare_digest(str(hello.get('token', '')), str(self.token)):
+                raise RemoteSyncError('令牌错误')
+            name = hello.get('server')
+            if name not in self.targets:
+                raise RemoteSyncError(f'接收端没有配置服务器：{name}')
+            world = hello.get('world', 'world')
+            # 只接受目标服务器文件夹下的一级文件夹
+            SafeJoin(self.targets[name], world)
+            if '/' in world:
+                raise RemoteSyncError(f'非法存档名：{world}')
+            lock = self.locks[name]
+            if not lock.acquire(blocking=False):
+                raise RemoteSyncError(f'{name}正在同步中')
+        except Exception as e:
+            self.Reply(sock, {'error': str(e)})
+            return
+
+        # 目标服务器正在运行时不能改写它的存档（发送端无法检测远程服务器的端口）
+        port = self.Port(name)
+        if not templates.PortFree(port):
+            lock.release()
+            self.Reply(sock, {'error': f'{name}服务器正在运行（端口{port}已被占用），请关闭后再同步', 'running': True})
+            return
+
+        try:
+            SendJson(sock, {'ok': True})
+            result = self.Receive(sock, stream, os.path.join(self.targets[name], world))
+            if self.logger is not None:
+                self.logger.info(f'[MSC] 已接收{name}服务器的远程同步')
+        except Exception as e:
+            if self.logger is not None:
+                self.logger.warning(f'[MSC] 接收{name}服务器的远程同步失败：{e}')
+            result = {'error': str(e)}
+        finally:
+            lock.release()
+        # 释放锁之后再发送最终回复：发送端收到回复后会立即连接同步下一个存档
+        self.Reply(sock, result)
+
+    def Port(self, name):
+        """
+        :param name: 服务器名字
+        :return: 目标服务器的游戏端口
+        """
+        port = self.ports.get(name)
+        return port if port is not None else ServerPort(self.targets[name])
+
+    @staticmethod
+    def Reply(sock, data):
+        try:
+            SendJson(sock, data)
+        except OSError:
+            pass
+
+    def Receive(self, sock, stream, world):
+        """
+        接收存档：比较索引、接收需要的文件，全部接收成功后再删除多余的文件
+        :param sock: 套接字
+        :param stream: 读取流
+        :param world: 目标存档路径
+        :return: 最终回复 {'failed': 校验失败的文件}，由调用方在释放锁之后发送
+        """
+        index = RecvJson(stream)
+        files = {rel: tuple(stat) for rel, stat in index['files'].items()}
+        scope = world_sync.SyncScope.FromDict(index.get('scope'))
+        dst_files, dst_dirs = world_sync.ScanTree(world, index['ignore'], scope)
+        os.makedirs(world, exist_ok=True)
+
+        # 多余的文件等全部文件接收成功后再删除，中途失败时子服存档不会缺文件；
+        # 占用了源存档文件夹位置的文件只能先删除
+        dirs = set(index['dirs'])
+        extra = [rel for rel in dst_files if rel not in files]
+        for rel in extra:
+            if rel in dirs:
+                os.remove(SafeJoin(world, rel))
+        for rel in index['dirs']:
+            os.makedirs(SafeJoin(world, rel), exist_ok=True)
+
+        need = {}
+        for rel, stat in files.items():
+            if dst_files.get(rel) == stat:
+                continue
+            need[rel] = self.ResumeOffset(SafeJoin(world, rel), stat)
+        SendJson(sock, {
+            'need': [[rel, offset] for rel, offset in need.items()],
+            'deleted_files': len(extra),
+            'deleted_bytes': sum(dst_files[rel][0] for rel in extra)
+        })
+
+        failed = []
+        while True:
+            message = RecvJson(stream)
+            if message.get('op') == 'finish':
+                break
+            if message.get('op') != 'file':
+                raise RemoteSyncError(f'期望文件消息，收到：{message.get("op")}')
+            rel = message.get('path')
+            if rel not in need or not isinstance(message.get('offset'), int) or \
+                    not 0 <= message['offset'] <= files[rel][0]:
+                raise RemoteSyncError(f'非法文件消息：{rel}')
+            if not self.ReceiveFile(stream, SafeJoin(world, rel), message, files[rel]):
+                failed.append(rel)
+        if not failed:
+            for rel in extra:
+                file_path = SafeJoin(world, rel)
+                if rel not in dirs and os.path.lexists(file_path):
+                    os.remove(file_path)
+            for rel in sorted(dst_dirs - dirs, key=lambda d: d.count('/'), reverse=True):
+                dir_path = SafeJoin(world, rel)
+                # 文件夹可能已被同名的源文件替换
+                if os.path.isdir(dir_path) and not os.listdir(dir_path):
+                    os.rmdir(dir_path)
+        return {'failed': failed}
+
+    @staticmethod
+    def ResumeOffset(dst, stat):
+        """
+        计算可以续传的位置：上次未传完的文件对应同一个源文件（大小与修改时间一致）时从断点继续
+        :param dst: 目标文件
+        :param stat: 源文件 (大小, 修改时间)
+        :return: 已有的字节数
+        """
+        try:
+            with open(dst + META_SUFFIX, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            if tuple(meta) == stat:
+                return min(os.path.getsize(dst + PART_SUFFIX), stat[0])
+        except (OSError, ValueError, TypeError):
+            pass
+        return 0
+
+    @staticmethod
+    def ReceiveFile(stream, dst, message, stat):
+        """
+        接收单个文件，先写入 .part 文件，哈希一致后再替换目标文件
+        :param stream: 读取流
+        :param dst: 目标文件
+        :param message: 文件头消息
+        :param stat: 源文件 (大小, 修改时间)
+        :return: 是否接收成功
+        """
+        part, meta = dst + PART_SUFFIX, dst + META_SUFFIX
+        offset = message['offset']
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        with open(meta, 'w', encoding='utf-8') as f:
+            json.dump(list(stat) if stat else None, f)
+        ok = True
+        with open(part, 'r+b' if offset and os.path.exists(part) else 'wb') as f:
+            f.truncate(offset)
+            f.seek(offset)
+            while True:
+                kind, payload = RecvFrame(stream)
+                if kind == b'J':
+                    end = json.loads(payload.decode('utf-8'))
+                    if end.get('op') != 'end':
+                        raise RemoteSyncError(f'期望文件结束消息，收到：{end.get("op")}')
+                    break
+                # 限制解压后的大小，异常数据不能让接收端一次申请过多内存
+                decompressor = zlib.decompressobj()
+                block = decompressor.decompress(payload[4:], CHUNK_SIZE)
+                if decompressor.unconsumed_tail or not decompressor.eof:
+                    raise RemoteSyncError(f'数据块解压后超过{CHUNK_SIZE}字节或不完整')
+                if zlib.crc32(block) != struct.unpack('>I', payload[:4])[0]:
+                    ok = False
+                f.write(block)
+        if ok and world_sync.FileHash(part) == end.get('hash'):
+            if os.path.isdir(dst) and not os.path.islink(dst):
+                shutil.rmtree(dst)
+            os.replace(part, dst)
+            os.utime(dst, ns=(message['mtime'], message['mtime']))
+            os.remove(meta)
+            return True
+        for file_path in (part, meta):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+        return False
@@ -0,0 +1,342 @@
+import json
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mcdreforged.api.all import RconConnection
+from mcdreforged.minecraft.rcon.rcon_connection import RconException
+
+"""
+服务器探测
+通过端口连接、Minecraft Server List Ping（SLP）或 Rcon 握手判断服务器是否已经启动完毕/完全关闭
+"""
+
+# 单次探测的超时（秒）
+PROBE_TIMEOUT = 2
+# 退避等待的初始间隔、最大间隔与倍数
+BACKOFF_INITIAL = 0.25
+BACKOFF_MAX = 4
+BACKOFF_FACTOR = 2
+# SLP 握手使用的协议版本（-1 表示仅查询状态，任意版本的服务器都会响应）
+SLP_PROTOCOL = -1
+# 数据包的最大长度（协议规定长度最多为 3 字节的 VarInt）
+MAX_PACKET_SIZE = (1 << 21) - 1
+# 可选的就绪探测方式
+PROBES = ('slp', 'rcon', 'port')
+
+
+def PortOpen(host, port, timeout=PROBE_TIMEOUT):
+    """
+    检查端口是否可以连接
+    :param host: 地址
+    :param port: 端口
+    :param timeout: 超时
+    :return: 是否可以连接
+    """
+    try:
+        with socket.create_connection((host, port), timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+def PackVarInt(value):
+    """
+    编码 VarInt
+    :param value: 整数
+    :return: 字节
+    """
+    value &= 0xFFFFFFFF
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def ReadVarInt(stream):
+    """
+    从读取流中解码 VarInt
+    :param stream: 读取流
+    :return: 整数
+    """
+    value = 0
+    for i in range(5):
+        byte = stream.read(1)
+        if not byte:
+            raise ConnectionError('连接已断开')
+        value |= (byte[0] & 0x7F) << (7 * i)
+        if not byte[0] & 0x80:
+            return value - (1 << 32) if value & 0x80000000 else value
+    raise ValueError('VarInt 过长')
+
+
+def PackPacket(packet_id, payload=b''):
+    """
+    打包数据包（长度 + 包ID + 内容）
+    :param packet_id: 包ID
+    :param payload: 内容
+    :return: 字节
+    """
+    data = PackVarInt(packet_id) + payload
+    return PackVarInt(len(data)) + data
+
+
+def ReadPacket(stream):
+    """
+    读取一个数据包
+    :param stream: 读取流
+    :return: (包ID, 内容)
+    """
+    length = ReadVarInt(stream)
+    # 数据包至少包含包ID
+    if not 0 < length <= MAX_PACKET_SIZE:
+        raise ValueError(f'数据包长度错误：{length}')
+    data = stream.read(length)
+    if len(data) < length:
+        raise ConnectionError('连接已断开')
+    packet_id = data[0]
+    return packet_id, data[1:]
+
+
+def ServerListPing(host, port, timeout=PROBE_TIMEOUT):
+    """
+    使用 Server List Ping 查询服务器状态，服务器启动完毕后才会响应
+    :param host: 地址
+    :param port: 端口
+    :param timeout: 超时
+    :return: {'version': 版本, 'players': 在线人数, 'max_players': 最大人数, 'motd': 描述, 'latency': 延迟毫秒}
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.settimeout(timeout)
+        stream = sock.makefile('rb')
+        address = host.encode('utf-8')
+        handshake = PackVarInt(SLP_PROTOCOL) + PackVarInt(len(address)) + address + struct.pack('>H', port) + PackVarInt(1)
+        sock.sendall(PackPacket(0x00, handshake) + PackPacket(0x00))
+
+        packet_id, data = ReadPacket(stream)
+        if packet_id != 0x00:
+            raise ValueError(f'意外的数据包：{packet_id}')
+        reader = _BytesReader(data)
+        length = ReadVarInt(reader)
+        text = reader.read(length)
+        if length < 0 or len(text) < length:
+            raise ValueError('状态数据包不完整')
+        status = ParseStatus(json.loads(text.decode('utf-8')))
+
+        start = time.perf_counter()
+        sock.sendall(PackPacket(0x01, struct.pack('>q', 0)))
+        ReadPacket(stream)
+        latency = (time.perf_counter() - start) * 1000
+
+    return dict(status, latency=latency)
+
+
+def ParseStatus(status):
+    """
+    检查并提取 Server List Ping 返回的状态
+    :param status: 解析后的 JSON
+    :return: {'version': 版本, 'players': 在线人数, 'max_players': 最大人数, 'motd': 描述}
+    """
+    if not isinstance(status, dict):
+        raise ValueError('状态格式错误')
+    version = status.get('version', {})
+    players = status.get('players', {})
+    if not isinstance(version, dict) or not isinstance(players, dict):
+        raise ValueError('状态格式错误：version/players 不是对象')
+    name = version.get('name', '')
+    online = players.get('online', 0)
+    max_players = players.get('max', 0)
+    description = status.get('description', '')
+    if isinstance(description, dict):
+        description = description.get('text', '')
+    # 描述可能是其他形式的聊天组件（例如数组），只显示纯文本的描述
+    if not isinstance(description, str):
+        description = ''
+    if not isinstance(name, str):
+        raise ValueError('状态格式错误：版本不是字符串')
+    # bool 也是 int 的子类，同样视为格式错误
+    if any(not isinstance(value, int) or isinstance(value, bool) for value in (online, max_players)):
+        raise ValueError('状态格式错误：人数不是整数')
+    return {
+        'version': name,
+        'players': online,
+        'max_players': max_players,
+        'motd': description,
+    }
+
+
+class _BytesReader:
+    """
+    让 bytes 可以像读取流一样使用 ReadVarInt
+    """
+
+    def __init__(self, data):
+        self.data = data
+        self.pos = 0
+
+    def read(self, n):
+        chunk = self.data[self.pos:self.pos + n]
+        self.pos += n
+        return chunk
+
+
+def RconReady(host, port, password):
+    """
+    检查 Rcon 是否可以登录
+    :param host: 地址
+    :param port: Rcon 端口
+    :param password: Rcon 密码
+    :return: 是否登录成功，连接失败、连接中途断开或回复不完整时返回 False
+    """
+    conn = RconConnection(host, port, password)
+    conn.CONNECT_TIMEOUT_SEC = PROBE_TIMEOUT
+    conn.READ_WRITE_TIMEOUT_SEC = PROBE_TIMEOUT
+    try:
+        return conn.connect()
+    except (OSError, RconException, struct.error, UnicodeDecodeError):
+        return False
+    finally:
+        conn.disconnect()
+
+
+def SlpReady(host, port):
+    """
+    检查服务器是否响应 Server List Ping
+    :param host: 地址
+    :param port: 端口
+    :return: 是否响应
+    """
+    try:
+        ServerListPing(host, port)
+        return True
+    except (OSError, ValueError):
+        return False
+
+
+def WaitUntil(predicate, timeout, check=None):
+    """
+    以指数退避的间隔反复检查，直到条件成立或超时
+    :param predicate: 检查函数，返回 True 表示条件成立
+    :param timeout: 超时（秒）
+    :param check: 每次等待前调用的检查函数（例如任务被取消时抛出异常）
+    :return: 条件成立时返回耗时（秒），超时返回 None
+    """
+    start = time.monotonic()
+    interval = BACKOFF_INITIAL
+    while True:
+        if predicate():
+            return time.monotonic() - start
+        remain = timeout - (time.monotonic() - start)
+        if remain <= 0:
+            return None
+        if check is not None:
+            check()
+        time.sleep(min(interval, remain))
+        interval = min(interval * BACKOFF_FACTOR, BACKOFF_MAX)
+
+
+def ProbeServer(host, port):
+    """
+    查询单个服务器的状态：能响应 SLP 视为在线并附带详细信息；
+    只能连接端口视为正在启动（ready 为 False）；都不行视为离线
+    :param host: 地址
+    :param port: 端口
+    :return: {'online': 是否在线, 'ready': 是否响应 SLP, 以及 ServerListPing 的各项信息, 'time': 探测时间}
+    """
+    status = {'online': False, 'ready': False, 'version': '', 'players': 0, 'max_players': 0,
+              'motd': '', 'latency': None, 'time': time.time()}
+    try:
+        status.update(ServerListPing(host, port))
+        status['online'] = status['ready'] = True
+    except (OSError, ValueError):
+        status['online'] = PortOpen(host, port)
+    return status
+
+
+def ProbeAll(targets, max_workers=16):
+    """
+    同时探测多个服务器
+    :param targets: {服务器名字: (地址, 端口)}
+    :param max_workers: 最大并发数
+    :return: {服务器名字: ProbeServer 的结果}
+    """
+    if not targets:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(targets)), thread_name_prefix='MSC-Probe') as pool:
+        futures = {name: pool.submit(ProbeServer, host, port) for name, (host, port) in targets.items()}
+        return {name: future.result() for name, future in futures.items()}
+
+
+class StatusCache:
+    """
+    服务器状态缓存，在有效期内重复查询不会再次探测
+    """
+
+    def __init__(self, ttl=5):
+        """
+        :param ttl: 有效期（秒）
+        """
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def Get(self, name):
+        """
+        获取未过期的状态
+        :param name: 服务器名字
+        :return: 状态，没有或已过期时返回 None
+        """
+        with self.lock:
+            status = self.entries.get(name)
+        if status is None or time.time() - status['time'] > self.ttl:
+            return None
+        return status
+
+    def Put(self, name, status):
+        """
+        写入状态
+        :param name: 服务器名字
+        :param status: 状态
+        :return: None
+        """
+        with self.lock:
+            self.entries[name] = status
+
+    def Invalidate(self, name=None):
+        """
+        使状态失效（服务器启动或关闭后调用）
+        :param name: 服务器名字，None 表示全部
+        :return: None
+        """
+        with self.lock:
+            if name is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(name, None)
+
+    def Fetch(self, targets, refresh=False):
+        """
+        获取多个服务器的状态，只探测没有缓存或缓存已过期的服务器（并发探测）
+        :param targets: {服务器名字: (地址, 端口)}
+        :param refresh: 是否忽略缓存重新探测
+        :return: {服务器名字: 状态}
+        """
+        result = {}
+        missing = {}
+        for name, address in targets.items():
+            status = None if refresh else self.Get(name)
+            if status is None:
+                missing[name] = address
+            else:
+                result[name] = status
+        for name, status in ProbeAll(missing).items():
+            self.Put(name, status)
+            result[name] = status
+        return result
@@ -0,0 +1,550 @@
+import json
+import os
+import re
+import threading
+
+from . import auto_sync, default_config, metrics, supervisor, templates, world_check, world_sync, world_watch
+
+"""
+插件配置
+配置文件只在加载时解析一次：按模式检查每一项的类型与取值、补全默认值，生成带 __slots__ 的配置对象，
+之后直接读取属性，不再在同步途中因为拼错的键抛出 KeyError；出错时给出出错项的路径（例如 mirror.rcon.port）
+每次加载都生成一份新的 Config 并整体替换旧的对象，加载失败时旧的配置继续生效；
+任务开始时取得当时的 Config，执行期间不受重载影响
+"""
+
+# 必填项的默认值
+REQUIRED = object()
+
+TYPE_NAMES = {
+    bool: '布尔值',
+    int: '整数',
+    float: '数字',
+    str: '字符串',
+    list: '列表',
+    dict: '对象',
+    type(None): 'null',
+}
+
+
+class ConfigError(Exception):
+    """
+    配置文件不合法，消息中包含出错项的路径
+    """
+    pass
+
+
+def Describe(value):
+    """
+    生成错误信息中对取值的描述
+    :param value: 取值
+    :return: 描述文本
+    """
+    text = json.dumps(value, ensure_ascii=False)
+    if len(text) > 40:
+        text = text[:37] + '...'
+    return f'{TYPE_NAMES.get(type(value), type(value).__name__)} {text}'
+
+
+def Join(path, name):
+    """
+    :param path: 上一级的路径
+    :param name: 配置项名字
+    :return: 配置项的路径
+    """
+    return f'{path}.{name}' if path else str(name)
+
+
+def Bool(value, path, warnings):
+    if not isinstance(value, bool):
+        raise ConfigError(f'{path}：应为 true/false，实际为{Describe(value)}')
+    return value
+
+
+def Int(value, path, warnings):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ConfigError(f'{path}：应为整数，实际为{Describe(value)}')
+    return value
+
+
+def Number(value, path, warnings):
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ConfigError(f'{path}：应为数字，实际为{Describe(value)}')
+    return value
+
+
+def Str(value, path, warnings):
+    if not isinstance(value, str):
+        raise ConfigError(f'{path}：应为字符串，实际为{Describe(value)}')
+    return value
+
+
+def Regex(value, path, warnings):
+    """
+    正则表达式，加载时编译
+    """
+    try:
+        return re.compile(Str(value, path, warnings))
+    except re.error as e:
+        raise ConfigError(f'{path}：不是合法的正则表达式：{e}')
+
+
+def Object(value, path, warnings):
+    """
+    原样保留的对象（由使用方自行检查）
+    """
+    if not isinstance(value, dict):
+        raise ConfigError(f'{path}：应为对象，实际为{Describe(value)}')
+    return dict(value)
+
+
+def ListOf(kind):
+    """
+    :param kind: 列表元素的类型
+    :return: 列表类型
+    """
+    def Convert(value, path, warnings):
+        if not isinstance(value, list):
+            raise ConfigError(f'{path}：应为列表，实际为{Describe(value)}')
+        return [kind(item, f'{path}[{index}]', warnings) for index, item in enumerate(value)]
+    return Convert
+
+
+def DictOf(kind):
+    """
+    :param kind: 值的类型（键总是字符串）
+    :return: 字典类型
+    """
+    def Convert(value, path, warnings):
+        if not isinstance(value, dict):
+            raise ConfigError(f'{path}：应为对象，实际为{Describe(value)}')
+        return {key: kind(item, Join(path, key), warnings) for key, item in value.items()}
+    return Convert
+
+
+def Optional(kind):
+    """
+    :param kind: 不为 null 时的类型
+    :return: 可以为 null 的类型
+    """
+    def Convert(value, path, warnings):
+        return None if value is None else kind(value, path, warnings)
+    return Convert
+
+
+def AtLeast(low):
+    return lambda value: None if value >= low else f'不能小于{low}，实际为{value}'
+
+
+def Positive(value):
+    return None if value > 0 else f'必须大于0，实际为{value}'
+
+
+def Port(value):
+    return None if 0 < value < 65536 else f'不是合法的端口号：{value}'
+
+
+def OneOf(*options):
+    return lambda value: None if value in options else f'只能是{"/".join(options)}，实际为{value}'
+
+
+def WorldNames(worlds):
+    invalid = [world for world in worlds if not WorldNameValid(world)]
+    return f'存档文件夹名只能是服务器文件夹下的一级文件夹：{"，".join(invalid)}' if invalid else None
+
+
+def WorldNameValid(world):
+    """
+    存档文件夹名只能是服务器文件夹下的一级文件夹
+    :param world: 存档文件夹名
+    :return: 是否合法
+    """
+    return isinstance(world, str) and world not in ("", ".", "..") and "/" not in world and "\\" not in world
+
+
+def Names(fields):
+    """
+    :param fields: 配置项的模式
+    :return: 配置项名字，用作 __slots__
+    """
+    return tuple(field[0] for field in fields)
+
+
+class Section:
+    """
+    配置中的一节
+    FIELDS 列出每一项的 (名字, 类型, 默认值[, 检查函数])：类型负责检查与转换取值，
+    默认值是未填写时使用的原始取值（同样经过类型转换），为 REQUIRED 时必须填写；
+    检查函数返回错误信息，没有问题时返回 None
+    """
+    __slots__ = ()
+    FIELDS = ()
+
+    @classmethod
+    def Parse(cls, data, path, warnings):
+        """
+        解析并检查一节配置
+        :param data: 配置文件中的对象
+        :param path: 该节的路径
+        :param warnings: 收集警告的列表
+        :return: 该节的实例
+        """
+        if not isinstance(data, dict):
+            raise ConfigError(f'{path or "配置文件"}：应为对象，实际为{Describe(data)}')
+        section = cls.__new__(cls)
+        for field in cls.FIELDS:
+            name, kind, default = field[:3]
+            item_path = Join(path, name)
+            if name in data:
+                value = data[name]
+            elif default is REQUIRED:
+                raise ConfigError(f'{item_path}：缺少必填项')
+            else:
+                value = default
+            value = kind(value, item_path, warnings)
+            if len(field) > 3 and value is not None:
+                error = field[3](value)
+                if error:
+                    raise ConfigError(f'{item_path}：{error}')
+            setattr(section, name, value)
+        known = Names(cls.FIELDS)
+        section.Finish(data, path, warnings, [name for name in data if name not in known])
+        return section
+
+    def Finish(self, data, path, warnings, unknown):
+        """
+        所有配置项解析完后的检查，默认把未知的配置项记为警告（多半是拼错的键）
+        :param data: 配置文件中的对象
+        :param path: 该节的路径
+        :param warnings: 收集警告的列表
+        :param unknown: 未知的配置项名字
+        :return: None
+        """
+        for name in unknown:
+            warnings.append(f'{Join(path, name)}：未知的配置项，已忽略')
+
+    def __eq__(self, other):
+        return type(self) is type(other) and \
+            all(getattr(self, name) == getattr(other, name) for name in Names(self.FIELDS))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+
+class RconConfig(Section):
+    FIELDS = (
+        ('enable', Bool, False),
+        ('host', Str, '127.0.0.1'),
+        ('port', Int, 25575, Port),
+        ('password', Str, ''),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class RemoteConfig(Section):
+    FIELDS = (
+        ('enable', Bool, False),
+        ('host', Str, '127.0.0.1'),
+        ('port', Int, 25590, Port),
+        ('token', Str, ''),
+    )
+    __slots__ = Names(FIELDS)
+
+    def Finish(self, data, path, warnings, unknown):
+        super().Finish(data, path, warnings, unknown)
+        if self.enable and not self.token:
+            raise ConfigError(f'{Join(path, "token")}：开启远程同步时必须填写')
+
+
+class IoLimitConfig(Section):
+    FIELDS = (
+        ('mb_per_sec', Number, 0, AtLeast(0)),
+        ('iops', Int, 0, AtLeast(0)),
+        ('adaptive', Bool, False),
+        ('fadvise', Bool, False),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class VersionsConfig(Section):
+    FIELDS = (
+        ('keep', Int, 0, AtLeast(0)),
+        ('max_size_mb', Number, 0, AtLeast(0)),
+        ('dir', Optional(Str), None),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class AutoSyncConfig(Section):
+    FIELDS = (
+        ('interval', Number, 0, AtLeast(0)),
+        ('on_save', Bool, False),
+        ('debounce', Number, auto_sync.DEBOUNCE, AtLeast(0)),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class VerifyConfig(Section):
+    FIELDS = (
+        ('before_sync', Bool, False),
+        ('after_sync', Bool, False),
+        ('sample', Int, world_check.SAMPLE_CHUNKS, AtLeast(0)),
+        ('workers', Int, 0, AtLeast(0)),
+        ('processes', Bool, False),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class RegionBBox(Section):
+    FIELDS = (
+        ('min_x', Int, REQUIRED),
+        ('min_z', Int, REQUIRED),
+        ('max_x', Int, REQUIRED),
+        ('max_z', Int, REQUIRED),
+    )
+    __slots__ = Names(FIELDS)
+
+    def Finish(self, data, path, warnings, unknown):
+        super().Finish(data, path, warnings, unknown)
+        if self.min_x > self.max_x or self.min_z > self.max_z:
+            raise ConfigError(f'{path}：最小坐标不能大于最大坐标')
+
+    def ToDict(self):
+        return {name: getattr(self, name) for name in Names(self.FIELDS)}
+
+
+class ServerConfig(Section):
+    """
+    一台子服的配置；scope 为加载时生成的同步范围
+    """
+    FIELDS = (
+        ('description', Str, ''),
+        ('can_sync', Bool, False),
+        ('port', Int, REQUIRED, Port),
+        ('ready_probe', Str, 'slp', OneOf('slp', 'port', 'rcon')),
+        ('start_timeout', Number, default_config.START_TIMEOUT, Positive),
+        ('stop_timeout', Number, default_config.STOP_TIMEOUT, Positive),
+        ('auto_restart', Bool, False),
+        ('rcon', RconConfig.Parse, {}),
+        ('source', Str, './server'),
+        ('target', Str, REQUIRED),
+        ('remote', RemoteConfig.Parse, {}),
+        ('sync_workers', Int, 1, AtLeast(1)),
+        ('sync_strategy', Str, 'copy', OneOf(*world_sync.STRATEGIES)),
+        ('io_limit', IoLimitConfig.Parse, {}),
+        ('two_phase_sync', Bool, False),
+        ('snapshot_dir', Optional(Str), None),
+        ('save_wait_timeout', Number, 60, Positive),
+        ('sync_mode', Str, 'full', OneOf('full', 'incremental')),
+        ('hash_check', Bool, False),
+        ('region_delta', Bool, False),
+        ('ignore_files', ListOf(Str), []),
+        ('worlds', ListOf(Str), ['world'], WorldNames),
+        ('include', ListOf(Str), []),
+        ('exclude', ListOf(Str), []),
+        ('region_bbox', Optional(RegionBBox.Parse), None),
+        ('versions', VersionsConfig.Parse, {}),
+        ('auto_sync', AutoSyncConfig.Parse, {}),
+        ('verify', VerifyConfig.Parse, {}),
+    )
+    __slots__ = Names(FIELDS) + ('name', 'scope')
+
+    def Finish(self, data, path, warnings, unknown):
+        super().Finish(data, path, warnings, unknown)
+        self.name = path
+        if not self.worlds:
+            self.worlds = ['world']
+        self.scope = world_sync.SyncScope(
+            self.include,
+            self.exclude,
+            self.region_bbox.ToDict() if self.region_bbox is not None else None
+        )
+
+
+class TemplateConfig(Section):
+    """
+    创建子服用的模板；server 为新子服的配置（端口、Rcon 与 target 由插件生成），加载时按子服配置检查
+    """
+    FIELDS = (
+        ('dir', Str, REQUIRED),
+        ('root', Str, '.'),
+        ('link', ListOf(Str), templates.LINK_PATTERNS),
+        ('ignore', ListOf(Str), templates.IGNORE),
+        ('port_min', Int, templates.PORT_MIN, Port),
+        ('port_max', Int, templates.PORT_MAX, Port),
+        ('server', Object, {}),
+    )
+    __slots__ = Names(FIELDS)
+
+    def Finish(self, data, path, warnings, unknown):
+        super().Finish(data, path, warnings, unknown)
+        if self.port_min > self.port_max:
+            raise ConfigError(f'{path}：port_min不能大于port_max')
+        ServerConfig.Parse(dict(self.server, port=self.port_min, target=self.dir), Join(path, 'server'), warnings)
+
+
+class WorldWatchConfig(Section):
+    FIELDS = (
+        ('enable', Bool, False),
+        ('mode', Str, 'auto', OneOf('auto', 'inotify', 'poll')),
+        ('poll_interval', Number, world_watch.POLL_INTERVAL, Positive),
+        ('max_dirty', Int, world_watch.MAX_DIRTY, AtLeast(1)),
+    )
+    __slots__ = Names(FIELDS)
+
+
+class ReceiverConfig(Section):
+    FIELDS = (
+        ('enable', Bool, False),
+        ('host', Str, '0.0.0.0'),
+        ('port', Int, 25590, Port),
+        ('token', Str, ''),
+        ('targets', DictOf(Str), {}),
+        ('ports', DictOf(Int), {}),
+    )
+    __slots__ = Names(FIELDS)
+
+    def Finish(self, data, path, warnings, unknown):
+        super().Finish(data, path, warnings, unknown)
+        if self.enable and not self.token:
+            raise ConfigError(f'{Join(path, "token")}：开启接收端时必须填写')
+
+
+class Config(Section):
+    """
+    整个配置文件；servers 为 {服务器名字: ServerConfig}，按 server_list 的顺序排列
+    """
+    FIELDS = (
+        ('server_list', ListOf(Str), []),
+        ('perm', DictOf(Int), {}),
+        ('max_disk_jobs', Int, 2, AtLeast(1)),
+        ('command_workers', Int, 4, AtLeast(1)),
+        ('status_ttl', Number, 5, AtLeast(0)),
+        ('groups', DictOf(ListOf(Str)), {}),
+        ('group_parallelism', Int, 4, AtLeast(1)),
+        ('log_lines', Int, supervisor.LOG_LINES, AtLeast(1)),
+        ('metrics_enable', Bool, True),
+        ('metrics_interval', Number, metrics.SAMPLE_INTERVAL, Positive),
+        ('metrics_samples', Int, metrics.SAMPLE_COUNT, AtLeast(1)),
+        ('progress_interval', Number, 10, AtLeast(0)),
+        ('sync_log', Optional(Str), './logs/MultiServerControl_sync.jsonl'),
+        ('auto_sync_save_pattern', Regex, default_config.SAVE_COMPLETE_PATTERN),
+        ('lag_pattern', Regex, default_config.LAG_PATTERN),
+        ('config_watch_interval', Number, 2, AtLeast(0)),
+        ('world_watch', WorldWatchConfig.Parse, {}),
+        ('receiver', ReceiverConfig.Parse, {}),
+        ('templates', DictOf(TemplateConfig.Parse), {}),
+    )
+    __slots__ = Names(FIELDS) + ('servers', 'warnings', 'stamp')
+
+    def Finish(self, data, path, warnings, unknown):
+        # 其余的键是各子服的配置
+        self.servers = {}
+        for server_name in self.server_list:
+            if server_name in self.servers:
+                raise ConfigError(f'server_list：{server_name}重复')
+            if server_name not in data:
+                raise ConfigError(f'{server_name}：在server_list中，但没有该服务器的配置')
+            self.servers[server_name] = ServerConfig.Parse(data[server_name], server_name, warnings)
+        for name in unknown:
+            if name in self.servers:
+                continue
+            if isinstance(data[name], dict) and 'target' in data[name]:
+                warnings.append(f'{name}：不在server_list中，该服务器的配置没有生效')
+            else:
+                warnings.append(f'{name}：未知的配置项，已忽略')
+        for group, members in self.groups.items():
+            if group in self.servers:
+                warnings.append(f'groups.{group}：与服务器同名，命令中按服务器处理')
+            missing = [server_name for server_name in members if server_name not in self.servers]
+            if missing:
+                warnings.append(f'groups.{group}：{"，".join(missing)}不在server_list中，已忽略')
+        if 'all' in self.servers:
+            warnings.append('server_list：名为all的服务器会使命令无法对所有服务器执行')
+        self.warnings = warnings
+        self.stamp = None
+
+
+def FileStamp(path):
+    """
+    文件的修改时间与大小，用于判断配置文件是否被修改
+    :param path: 文件路径
+    :return: (修改时间, 大小)，文件不存在时为 None
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def Load(path):
+    """
+    读取并检查配置文件
+    :param path: 配置文件路径
+    :return: Config，不合法时抛出 ConfigError
+    """
+    stamp = FileStamp(path)
+    with open(path, 'r', encoding='utf-8') as f:
+        try:
+            data = json.load(f)
+        except ValueError as e:
+            raise ConfigError(f'不是合法的JSON：{e}')
+    config = Config.Parse(data, '', [])
+    config.stamp = stamp
+    return config
+
+
+class ConfigWatcher:
+    """
+    定期检查配置文件，修改后（且修改时间与大小在一次检查间隔内不再变化，避免读到写了一半的文件）调用 on_change
+    """
+
+    def __init__(self, path, interval, on_change, stamp=None):
+        """
+        :param path: 配置文件路径
+        :param interval: 检查间隔（秒）
+        :param on_change: 配置文件被修改时调用，无参数
+        :param stamp: 已加载的配置文件的 FileStamp
+        """
+        self.path = path
+        self.interval = interval
+        self.on_change = on_change
+        # 已处理过的文件状态，加载失败的文件不会重复加载
+        self.stamp = stamp
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def Start(self):
+        """
+        启动检查线程
+        :return: None
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.Run, name='MSC-Config', daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        """
+        停止检查线程
+        :return: None
+        """
+        self.stop_event.set()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def Run(self):
+        """
+        检查线程
+        :return: None
+        """
+        seen = self.stamp
+        while not self.stop_event.wait(self.interval):
+            stamp = FileStamp(self.path)
+            if stamp is not None and stamp != self.stamp and stamp == seen:
+                self.stamp = stamp
+                self.on_change()
+            seen = stamp
@@ -0,0 +1,243 @@
+import collections
+import subprocess
+import sys
+import threading
+import time
+
+"""
+子服进程管理
+每个子服作为独立的子进程启动（指定工作目录，不经过 shell），记录 PID，
+由读取线程持续读取输出并在进程退出时回收；可选在子服崩溃后按退避间隔自动重启
+"""
+
+# 保留的输出行数
+LOG_LINES = 500
+# 自动重启的初始间隔、最大间隔（秒）
+RESTART_BACKOFF_INITIAL = 5
+RESTART_BACKOFF_MAX = 300
+# 进程运行超过该时间（秒）后退出，重启间隔重新从初始值开始
+STABLE_TIME = 600
+
+
+class ManagedProcess:
+    """
+    一个被管理的子服进程
+    """
+
+    def __init__(self, server_name, command, cwd, auto_restart, log_lines):
+        self.server_name = server_name
+        self.command = command
+        self.cwd = cwd
+        self.auto_restart = auto_restart
+        self.output = collections.deque(maxlen=log_lines)
+        self.process = None
+        self.started = None
+        self.exit_code = None
+        # 主动关闭时置位，退出后不自动重启
+        self.stopping = False
+        self.restarts = 0
+        self.backoff = RESTART_BACKOFF_INITIAL
+        # 崩溃后等待自动重启期间置位，直到重新启动或放弃重启
+        self.restart_pending = False
+        self.exited = threading.Event()
+
+    @property
+    def pid(self):
+        return self.process.pid if self.process is not None else None
+
+    def Running(self):
+        """
+        进程是否仍在运行
+        :return: 是否在运行
+        """
+        return self.process is not None and not self.exited.is_set()
+
+
+class Supervisor:
+    """
+    按服务器名字管理子服进程
+    """
+
+    def __init__(self, log_lines=LOG_LINES, on_exit=None, before_restart=None):
+        """
+        :param log_lines: 每个子服保留的输出行数
+        :param on_exit: 进程退出时的回调 on_exit(ManagedProcess, 是否将自动重启)
+        :param before_restart: 自动重启前的回调 before_restart(ManagedProcess)，返回 False 时放弃这次重启
+        """
+        self.log_lines = log_lines
+        self.on_exit = on_exit
+        self.before_restart = before_restart
+        self.lock = threading.Lock()
+        self.processes = {}
+
+    def Start(self, server_name, command, cwd, auto_restart=False):
+        """
+        启动子服进程
+        :param server_name: 服务器名字
+        :param command: 启动命令（参数列表）
+        :param cwd: 工作目录
+        :param auto_restart: 崩溃后是否自动重启
+        :return: ManagedProcess
+        """
+        with self.lock:
+            managed = self.processes.get(server_name)
+            if managed is not None and managed.Running():
+                raise RuntimeError(f'已在运行（PID {managed.pid}）')
+            managed = ManagedProcess(server_name, command, cwd, auto_restart, self.log_lines)
+            self.processes[server_name] = managed
+        self.Launch(managed)
+        self.Watch(managed)
+        return managed
+
+    @staticmethod
+    def Launch(managed):
+        """
+        创建进程（自动重启时复用同一个 ManagedProcess）
+        :param managed: ManagedProcess
+        :return: None
+        """
+        kwargs = {}
+        if sys.platform == 'win32':
+            kwargs['creationflags'] = subprocess.CREATE_NEW_PROCESS_GROUP
+        else:
+            # 不与主服处于同一进程组，主服控制台的 Ctrl+C 不会波及子服
+            kwargs['start_new_session'] = True
+        managed.exited.clear()
+        managed.exit_code = None
+        managed.process = subprocess.Popen(
+            managed.command,
+            cwd=managed.cwd,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            encoding='utf-8',
+            errors='replace',
+            bufsize=1,
+            **kwargs
+        )
+        managed.started = time.monotonic()
+
+    def Reader(self, managed):
+        """
+        读取线程：持续读取输出直到进程退出，回收进程后按需自动重启
+        :param managed: ManagedProcess
+        :return: None
+        """
+        while True:
+            process = managed.process
+            for line in process.stdout:
+                managed.output.append(line.rstrip('\r\n'))
+            managed.exit_code = process.wait()
+            restart = managed.auto_restart and not managed.stopping
+            # 先置位再标记退出，Running 与 RestartPending 之间不会出现两者都为假的间隙
+            managed.restart_pending = restart
+            managed.exited.set()
+
+            if self.on_exit is not None:
+                self.on_exit(managed, restart)
+            if not restart:
+                return
+
+            try:
+                if time.monotonic() - managed.started > STABLE_TIME:
+                    managed.backoff = RESTART_BACKOFF_INITIAL
+                time.sleep(managed.backoff)
+                managed.backoff = min(managed.backoff * 2, RESTART_BACKOFF_MAX)
+                if managed.stopping or self.processes.get(managed.server_name) is not managed:
+                    return
+                # 由调用方确认可以重启（例如没有正在改写存档的任务）
+                if self.before_restart is not None and not self.before_restart(managed):
+                    managed.output.append('[MSC] 自动重启已取消')
+                    return
+                self.Launch(managed)
+            except OSError as e:
+                managed.output.append(f'[MSC] 自动重启失败：{e}')
+                return
+            finally:
+                # 进程已重新启动（Running 为真）之后才清除，期间检查 RestartPending 的任务不会漏掉
+                managed.restart_pending = False
+            managed.restarts += 1
+
+    def Watch(self, managed):
+        """
+        为进程启动读取线程
+        :param managed: ManagedProcess
+        :return: None
+        """
+        threading.Thread(
+            target=self.Reader, args=(managed,), name=f'MSC-Process-{managed.server_name}', daemon=True
+        ).start()
+
+    def Get(self, server_name):
+        """
+        获取子服进程
+        :param server_name: 服务器名字
+        :return: ManagedProcess，没有时返回 None
+        """
+        with self.lock:
+            return self.processes.get(server_name)
+
+    def Running(self, server_name):
+        """
+        子服进程是否正在运行
+        :param server_name: 服务器名字
+        :return: 是否在运行，不是由插件启动的返回 False
+        """
+        managed = self.Get(server_name)
+        return managed is not None and managed.Running()
+
+    def RestartPending(self, server_name):
+        """
+        子服是否已崩溃并正在等待自动重启
+        :param server_name: 服务器名字
+        :return: 是否等待自动重启
+        """
+        managed = self.Get(server_name)
+        return managed is not None and managed.restart_pending
+
+    def Pids(self):
+        """
+        获取所有正在运行的子服进程
+        :return: {服务器名字: PID}
+        """
+        with self.lock:
+            return {name: managed.pid for name, managed in self.processes.items() if managed.Running()}
+
+    def SendInput(self, server_name, line):
+        """
+        向子服进程的控制台输入一行
+        :param server_name: 服务器名字
+        :param line: 输入内容
+        :return: 是否已发送
+        """
+        managed = self.Get(server_name)
+        if managed is None or not managed.Running():
+            return False
+        try:
+            managed.process.stdin.write(line + '\n')
+            managed.process.stdin.flush()
+            return True
+        except OSError:
+            return False
+
+    def Stopping(self, server_name):
+        """
+        标记子服正在被主动关闭，退出后不自动重启
+        :param server_name: 服务器名字
+        :return: None
+        """
+        managed = self.Get(server_name)
+        if managed is not None:
+            managed.stopping = True
+
+    def Log(self, server_name, lines):
+        """
+        获取子服最近的输出
+        :param server_name: 服务器名字
+        :param lines: 行数
+        :return: 输出行列表，没有由插件启动的进程时返回 None
+        """
+        managed = self.Get(server_name)
+        if managed is None:
+            return None
+        return list(managed.output)[-lines:]
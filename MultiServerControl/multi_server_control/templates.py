@@ -0,0 +1,143 @@
+import errno
+import os
+import re
+import secrets
+import shutil
+import socket
+
+from . import world_sync
+
+"""
+用模板创建子服
+模板是一个准备好的子服文件夹（MCDR 配置 + server 文件夹，最好已经启动过一次：依赖库已下载、服务端已完成重映射、存档已生成），
+创建时整个复制为新的子服文件夹：jar 与依赖库这类服务端只读不写的文件硬链接到模板，其余文件使用 reflink（不支持时复制），
+新子服第一次启动时不需要再下载依赖、生成存档；复制到临时文件夹后再重命名，中途失败不会留下半个子服
+"""
+
+# 默认硬链接到模板的文件（规则同同步范围：通配符，以 / 结尾表示整个文件夹）
+LINK_PATTERNS = ['*.jar', 'server/libraries/', 'server/versions/', 'server/cache/', 'server/.paper-remapped/']
+# 默认不复制的文件
+IGNORE = ['session.lock', 'logs', 'crash-reports']
+# 自动分配端口的默认范围
+PORT_MIN = 25600
+PORT_MAX = 25699
+# 复制模板时并行复制的线程数
+CLONE_WORKERS = 4
+# 新子服的名字（同时用作配置项与文件夹名）：小写字母开头，后面只能是小写字母或数字
+NAME_PATTERN = re.compile(r'[a-z][a-z0-9]*')
+# 正在创建的子服文件夹
+BUILDING_SUFFIX = '.msc_building'
+# 硬链接失败时退回复制
+LINK_FALLBACK_ERRNO = {errno.EMLINK, errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def FolderName(server_name):
+    """
+    子服文件夹名：服务器名字首字母大写（与 Mirror、Create 的习惯一致）
+    :param server_name: 服务器名字
+    :return: 文件夹名
+    """
+    return server_name[:1].upper() + server_name[1:]
+
+
+def CloneTemplate(template, dest, link=(), ignore=(), workers=1, check=None):
+    """
+    从模板复制出新的子服文件夹
+    :param template: 模板文件夹
+    :param dest: 新的子服文件夹，不能已存在
+    :param link: 硬链接到模板的文件（通配符列表）
+    :param ignore: 不复制的文件名
+    :param workers: 并行复制的线程数
+    :param check: 每个文件开始前调用的检查函数
+    :return: 统计 {'files', 'bytes', 'linked_files'}
+    """
+    files, dirs = world_sync.ScanTree(template, list(ignore))
+    building = dest + BUILDING_SUFFIX
+    shutil.rmtree(building, ignore_errors=True)
+    info = {'files': len(files), 'bytes': sum(size for size, _ in files.values()), 'linked_files': 0}
+    try:
+        os.makedirs(building)
+        for rel in dirs:
+            os.makedirs(os.path.join(building, rel), exist_ok=True)
+        tasks = []
+        for rel, (size, _) in files.items():
+            src, dst = os.path.join(template, rel), os.path.join(building, rel)
+            if world_sync.SyncScope.Matches(rel, link):
+                try:
+                    os.link(src, dst)
+                    info['linked_files'] += 1
+                    continue
+                except OSError as e:
+                    if e.errno not in LINK_FALLBACK_ERRNO:
+                        raise
+            tasks.append((src, dst, size))
+        world_sync.CopyFiles(tasks, workers, strategy='reflink', check=check)
+        os.rename(building, dest)
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return info
+
+
+def PortFree(port, host='0.0.0.0'):
+    """
+    :param port: 端口
+    :param host: 监听地址
+    :return: 端口当前是否可以监听
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        try:
+            s.bind((host, port))
+            return True
+        except OSError:
+            return False
+
+
+def FreePorts(count, low=PORT_MIN, high=PORT_MAX, used=()):
+    """
+    在范围内依次探测，找出没有被配置使用、当前也没有被监听的端口
+    :param count: 需要的端口数
+    :param low: 范围下限
+    :param high: 范围上限（包含）
+    :param used: 已被配置使用的端口
+    :return: 端口列表，不够时返回 None
+    """
+    ports = []
+    for port in range(low, high + 1):
+        if port in used or not PortFree(port):
+            continue
+        ports.append(port)
+        if len(ports) == count:
+            return ports
+    return None
+
+
+def RconPassword():
+    """
+    :return: 随机生成的 Rcon 密码
+    """
+    return secrets.token_urlsafe(16)
+
+
+def UpdateProperties(file_path, values):
+    """
+    修改 server.properties 中的配置项，其余内容与顺序保持不变，没有的项追加到末尾
+    先写入临时文件再替换（同时断开与模板的硬链接）
+    :param file_path: server.properties 路径
+    :param values: {键: 值}
+    :return: None
+    """
+    lines = []
+    if os.path.exists(file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+    remaining = dict(values)
+    for index, line in enumerate(lines):
+        key = line.split('=', 1)[0].strip()
+        if not line.lstrip().startswith('#') and key in remaining:
+            lines[index] = f'{key}={remaining.pop(key)}'
+    lines.extend(f'{key}={value}' for key, value in remaining.items())
+    temp = file_path + world_sync.TEMP_SUFFIX
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(temp, file_path)
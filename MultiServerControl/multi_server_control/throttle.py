@@ -0,0 +1,210 @@
+import errno
+import os
+import threading
+import time
+
+"""
+同步时的磁盘读写限速
+令牌桶按字节数与读写次数（IOPS）限制复制速度，避免同步时抢占主服的磁盘；
+开启自适应后，主服输出 Can't keep up 时降低限速，一段时间没有再卡顿后逐步恢复；
+复制完的文件通过 posix_fadvise(DONTNEED) 丢弃页缓存，避免把主服常用的数据挤出内存；
+DONTNEED 不会丢弃脏页，目标文件先 fdatasync 回写再丢弃，大文件每复制一段就回写并丢弃一次
+"""
+
+# 限速时每次读写的块大小，也是 IOPS 计数的单位
+BLOCK_SIZE = 1024 * 1024
+# 令牌桶最多积攒多少秒的令牌，空闲后允许的突发量
+BURST_SECONDS = 0.1
+# 等待令牌时检查任务是否被取消的间隔（秒）
+WAIT_SLICE = 0.1
+# 每次卡顿后限速减半，最低降到配置值的该比例
+MIN_FACTOR = 1 / 16
+# 多久没有卡顿后限速翻倍恢复（秒）
+RECOVER_INTERVAL = 30
+# 修改时间早于该秒数的源文件才丢弃页缓存，主服最近写过的文件大概率仍在使用
+DROP_SOURCE_AGE = 300
+# 大文件每复制这么多字节就回写并丢弃一次目标文件的页缓存，复制过程中占用的缓存不超过该大小
+DROP_WINDOW = 32 * 1024 * 1024
+
+
+class TokenBucket:
+    """
+    令牌桶：允许透支，透支后调用方等待到令牌补足为止，多个线程共享同一个桶时总速度不超过限制
+    """
+
+    def __init__(self, rate, burst=None):
+        """
+        :param rate: 每秒补充的令牌数
+        :param burst: 桶的容量，默认为一秒的令牌数
+        """
+        self.rate = rate
+        self.burst = burst if burst is not None else rate
+        self.tokens = self.burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def Take(self, amount, factor=1.0):
+        """
+        取出令牌
+        :param amount: 令牌数
+        :param factor: 补充速度的倍率（自适应限速）
+        :return: 需要等待的秒数
+        """
+        with self.lock:
+            now = time.monotonic()
+            rate = self.rate * factor
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * rate)
+            self.last = now
+            self.tokens -= amount
+            return -self.tokens / rate if self.tokens < 0 else 0.0
+
+
+class LagMonitor:
+    """
+    根据主服的卡顿输出计算限速倍率
+    """
+
+    def __init__(self, recover=RECOVER_INTERVAL, min_factor=MIN_FACTOR):
+        """
+        :param recover: 多久没有卡顿后倍率翻倍（秒）
+        :param min_factor: 最低倍率
+        """
+        self.recover = recover
+        self.min_factor = min_factor
+        self.lock = threading.Lock()
+        self.base = 1.0
+        self.last = None
+        self.events = 0
+
+    def OnLag(self):
+        """
+        主服出现卡顿，倍率减半
+        :return: 新的倍率
+        """
+        with self.lock:
+            self.base = max(self.min_factor, self.Current() / 2)
+            self.last = time.monotonic()
+            self.events += 1
+            return self.base
+
+    def Current(self):
+        """
+        当前倍率（调用方需要持有锁）
+        :return: 倍率
+        """
+        if self.last is None:
+            return 1.0
+        steps = int((time.monotonic() - self.last) / self.recover)
+        return min(1.0, self.base * 2 ** min(steps, 16))
+
+    def Factor(self):
+        """
+        :return: 当前的限速倍率（0~1）
+        """
+        with self.lock:
+            return self.Current()
+
+
+class IoLimiter:
+    """
+    一次同步使用的限速器，复制文件的各个线程共享
+    """
+
+    def __init__(self, bytes_per_sec=0, iops=0, monitor=None, fadvise=False):
+        """
+        :param bytes_per_sec: 每秒最多读写的字节数，0 为不限制
+        :param iops: 每秒最多读写的块数，0 为不限制
+        :param monitor: LagMonitor，不为 None 时按主服卡顿情况调整限速
+        :param fadvise: 复制后是否丢弃页缓存
+        """
+        self.bytes = TokenBucket(bytes_per_sec, max(bytes_per_sec * BURST_SECONDS, BLOCK_SIZE)) \
+            if bytes_per_sec > 0 else None
+        self.ops = TokenBucket(iops, max(iops * BURST_SECONDS, 1)) if iops > 0 else None
+        self.monitor = monitor
+        self.fadvise = fadvise
+        self.lock = threading.Lock()
+        # 因限速等待的总时间（各线程累加）
+        self.waited = 0.0
+
+    def Limited(self):
+        """
+        :return: 是否限制了速度
+        """
+        return self.bytes is not None or self.ops is not None
+
+    def Consume(self, size, ops=1, check=None):
+        """
+        读写前调用，超出限速时等待
+        :param size: 字节数
+        :param ops: 读写次数
+        :param check: 等待期间定期调用的检查函数（例如任务被取消时抛出异常）
+        :return: None
+        """
+        factor = self.monitor.Factor() if self.monitor is not None else 1.0
+        wait = 0.0
+        if self.bytes is not None and size:
+            wait = max(wait, self.bytes.Take(size, factor))
+        if self.ops is not None and ops:
+            wait = max(wait, self.ops.Take(ops, factor))
+        if wait <= 0:
+            return
+        with self.lock:
+            self.waited += wait
+        deadline = time.monotonic() + wait
+        while True:
+            remain = deadline - time.monotonic()
+            if remain <= 0:
+                return
+            if check is not None:
+                check()
+            time.sleep(min(remain, WAIT_SLICE))
+
+    def Drop(self, fd, source=False, mtime=None, offset=0, length=0):
+        """
+        丢弃文件的页缓存（不支持时忽略），目标文件先回写脏页
+        :param fd: 文件描述符（目标文件需要先 flush）
+        :param source: 是否为源文件，源文件只在较长时间没有修改时才丢弃
+        :param mtime: 源文件的修改时间（秒）
+        :param offset: 起始位置
+        :param length: 长度，0 表示到文件末尾
+        :return: None
+        """
+        if not self.fadvise:
+            return
+        if source and (mtime is None or time.time() - mtime < DROP_SOURCE_AGE):
+            return
+        if not source:
+            WriteBack(fd)
+        DropCache(fd, offset, length)
+
+
+def WriteBack(fd):
+    """
+    等待文件的脏页写回磁盘（fdatasync），之后 DONTNEED 才能丢弃这些页
+    :param fd: 文件描述符
+    :return: None
+    """
+    sync = getattr(os, 'fdatasync', os.fsync)
+    try:
+        sync(fd)
+    except OSError as e:
+        # 不支持同步的文件系统只是无法丢弃脏页，其余错误说明数据没有写入
+        if e.errno not in (errno.EINVAL, errno.EROFS):
+            raise
+
+
+def DropCache(fd, offset=0, length=0):
+    """
+    通过 posix_fadvise(DONTNEED) 丢弃文件的页缓存，脏页不会被丢弃（写入的文件先调用 WriteBack）
+    :param fd: 文件描述符
+    :param offset: 起始位置
+    :param length: 长度，0 表示到文件末尾
+    :return: None
+    """
+    fadvise = getattr(os, 'posix_fadvise', None)
+    if fadvise is None:
+        return
+    try:
+        fadvise(fd, offset, length, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
@@ -0,0 +1,215 @@
+import datetime
+import errno
+import json
+import os
+import shutil
+
+from . import world_sync
+
+"""
+子服存档的历史版本
+每次同步成功后把子服存档保存为一个版本，与上一个版本相比没有变化的文件直接硬链接到上一个版本的同一文件，
+只有变化的文件占用新的空间（支持时使用 reflink）；版本一旦生成便不再修改，多个版本共享同一份文件是安全的
+回滚时先把版本复制（支持时使用 reflink）到子服存档旁的临时文件夹，再通过重命名替换子服存档：
+子服运行时会原地改写区域文件，不能直接把版本本身（或硬链接）交给子服使用
+"""
+
+# 版本信息文件，写入该文件的版本才是完整的
+INDEX_FILE = 'version.json'
+# 正在生成的版本
+BUILDING_SUFFIX = '.msc_building'
+# 回滚时正在准备的存档与被替换下来的旧存档
+ROLLBACK_SUFFIX = '.msc_rollback'
+OLD_SUFFIX = '.msc_old'
+# 硬链接失败时退回复制
+LINK_FALLBACK_ERRNO = {errno.EMLINK, errno.EXDEV, errno.EPERM, errno.EOPNOTSUPP, errno.ENOTSUP}
+
+
+def ListVersions(root):
+    """
+    列出所有完整的版本，最新的在前
+    :param root: 版本存放文件夹
+    :return: [版本信息]
+    """
+    if not os.path.isdir(root):
+        return []
+    versions = []
+    for name in os.listdir(root):
+        try:
+            with open(os.path.join(root, name, INDEX_FILE), 'r', encoding='utf-8') as f:
+                versions.append(json.load(f))
+        except (OSError, ValueError):
+            continue
+    versions.sort(key=lambda version: version['id'], reverse=True)
+    return versions
+
+
+def NewVersionId(root):
+    """
+    按时间生成版本号，同一秒内的多个版本加上序号
+    :param root: 版本存放文件夹
+    :return: 版本号
+    """
+    base = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    version_id = base
+    index = 2
+    while os.path.exists(os.path.join(root, version_id)):
+        version_id = f'{base}-{index}'
+        index += 1
+    return version_id
+
+
+def RemoveIncomplete(root):
+    """
+    删除中途失败留下的版本
+    :param root: 版本存放文件夹
+    :return: None
+    """
+    if not os.path.isdir(root):
+        return
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if os.path.isdir(path) and not os.path.exists(os.path.join(path, INDEX_FILE)):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def CreateVersion(root, target, worlds, workers=1, check=None, limiter=None):
+    """
+    把子服存档保存为一个新版本
+    大小与修改时间都与上一个版本相同的文件硬链接到上一个版本，其余文件从子服存档复制
+    :param root: 版本存放文件夹
+    :param target: 子服的server文件夹
+    :param worlds: 存档文件夹名列表
+    :param workers: 并行复制的线程数
+    :param check: 每个文件开始前调用的检查函数
+    :param limiter: throttle.IoLimiter，为 None 时不限速
+    :return: 版本信息
+    """
+    os.makedirs(root, exist_ok=True)
+    RemoveIncomplete(root)
+    versions = ListVersions(root)
+    previous = versions[0] if versions else None
+    version_id = NewVersionId(root)
+    building = os.path.join(root, version_id + BUILDING_SUFFIX)
+    info = {
+        'id': version_id,
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'worlds': {},
+        'size': 0,
+        'linked_files': 0,
+        'copied_files': 0,
+        'copied_bytes': 0,
+    }
+    try:
+        tasks = []
+        for world in worlds:
+            source = os.path.join(target, world)
+            if not os.path.isdir(source):
+                continue
+            files, dirs = world_sync.ScanTree(source, ['session.lock'])
+            old_files = previous['worlds'].get(world, {}).get('files', {}) if previous else {}
+            dest = os.path.join(building, world)
+            os.makedirs(dest)
+            for rel in dirs:
+                os.makedirs(os.path.join(dest, rel), exist_ok=True)
+            for rel, (size, mtime) in files.items():
+                dst = os.path.join(dest, rel)
+                if old_files.get(rel) == [size, mtime]:
+                    try:
+                        os.link(os.path.join(root, previous['id'], world, rel), dst)
+                        info['linked_files'] += 1
+                        continue
+                    except FileNotFoundError:
+                        pass
+                    except OSError as e:
+                        if e.errno not in LINK_FALLBACK_ERRNO:
+                            raise
+                tasks.append((os.path.join(source, rel), dst, size))
+            info['worlds'][world] = {'files': {rel: [size, mtime] for rel, (size, mtime) in files.items()},
+                                     'dirs': sorted(dirs)}
+            info['size'] += sum(size for size, _ in files.values())
+        world_sync.CopyFiles(tasks, workers, strategy='reflink', check=check, limiter=limiter)
+        info['copied_files'] = len(tasks)
+        info['copied_bytes'] = sum(size for _, _, size in tasks)
+        with open(os.path.join(building, INDEX_FILE), 'w', encoding='utf-8') as f:
+            json.dump(info, f, ensure_ascii=False)
+        os.rename(building, os.path.join(root, version_id))
+    except BaseException:
+        shutil.rmtree(building, ignore_errors=True)
+        raise
+    return info
+
+
+def DiskUsage(root):
+    """
+    所有版本实际占用的空间，硬链接共享的文件只计算一次
+    :param root: 版本存放文件夹
+    :return: 字节数
+    """
+    seen = set()
+    total = 0
+    for dir_path, _, file_names in os.walk(root):
+        for name in file_names:
+            try:
+                st = os.lstat(os.path.join(dir_path, name))
+            except FileNotFoundError:
+                continue
+            if (st.st_dev, st.st_ino) not in seen:
+                seen.add((st.st_dev, st.st_ino))
+                total += st.st_size
+    return total
+
+
+def PruneVersions(root, keep, max_bytes=0):
+    """
+    按保留数量与空间上限删除最旧的版本，最新的版本总是保留
+    :param root: 版本存放文件夹
+    :param keep: 最多保留的版本数
+    :param max_bytes: 所有版本最多占用的空间，0 为不限制
+    :return: 被删除的版本号列表
+    """
+    versions = ListVersions(root)
+    removed = []
+    while len(versions) > max(keep, 1):
+        removed.append(versions.pop()['id'])
+        shutil.rmtree(os.path.join(root, removed[-1]))
+    while max_bytes > 0 and len(versions) > 1 and DiskUsage(root) > max_bytes:
+        removed.append(versions.pop()['id'])
+        shutil.rmtree(os.path.join(root, removed[-1]))
+    return removed
+
+
+def RestoreVersion(root, version, target, workers=1, check=None):
+    """
+    用版本替换子服存档：先在子服存档旁准备好所有存档，再依次通过重命名替换
+    :param root: 版本存放文件夹
+    :param version: 版本信息
+    :param target: 子服的server文件夹
+    :param workers: 并行复制的线程数
+    :param check: 每个文件开始前调用的检查函数
+    :return: SyncReport
+    """
+    report = world_sync.SyncReport()
+    worlds = list(version['worlds'])
+    try:
+        for world in worlds:
+            staging = os.path.join(target, world + ROLLBACK_SUFFIX)
+            if os.path.exists(staging):
+                shutil.rmtree(staging)
+            report.Merge(world_sync.FullCopy(
+                os.path.join(root, version['id'], world), staging, [], workers, 'reflink', check
+            ))
+    except BaseException:
+        for world in worlds:
+            shutil.rmtree(os.path.join(target, world + ROLLBACK_SUFFIX), ignore_errors=True)
+        raise
+    for world in worlds:
+        world_path = os.path.join(target, world)
+        old = world_path + OLD_SUFFIX
+        if os.path.exists(old):
+            shutil.rmtree(old)
+        if os.path.exists(world_path):
+            os.rename(world_path, old)
+        os.rename(world_path + ROLLBACK_SUFFIX, world_path)
+        shutil.rmtree(old, ignore_errors=True)
+    return report
@@ -0,0 +1,414 @@
+import gzip
+import multiprocessing
+import os
+import random
+import re
+import struct
+import time
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from . import anvil, world_sync
+
+"""
+存档完整性检查
+主服保存到一半时复制的存档可能带有损坏的区域文件头，这里在同步前后快速检查存档：
+level.dat 能否解压且 NBT 结构完整；每个区域文件（.mca）的位置表是否越界、扇区是否重叠、区块头的长度与压缩方式是否合法；
+另外从每个区域文件中抽取少量区块解压（优先最近写入的区块，主服保存时最可能写坏的就是它们）
+区域文件按批分给线程池检查（解压时会释放 GIL），只读取文件头、区块头与抽查的区块；
+明确开启时才改用 fork 的进程池（主服进程中有大量线程，fork 出的子进程可能继承被其他线程持有的锁）；
+不使用 mmap，主服同时改写文件时不会因为文件变短而收到 SIGBUS
+"""
+
+# 每个区域文件默认解压检查的区块数
+SAMPLE_CHUNKS = 2
+# 每个任务检查的区域文件数，减少进程间通信的次数
+BATCH_FILES = 8
+# 等待检查结果时检查任务是否被取消的间隔（秒）
+WAIT_SLICE = 0.5
+# 区块头：数据长度（包含压缩方式的 1 字节）与压缩方式
+CHUNK_HEADER = struct.Struct('>IB')
+# 区块压缩方式：1 gzip，2 zlib，3 不压缩，4 LZ4，127 自定义；最高位表示数据存放在单独的 .mcc 文件中
+COMPRESSIONS = {1, 2, 3, 4, 127}
+EXTERNAL_FLAG = 0x80
+# 区域文件名 r.<x>.<z>.mca
+REGION_NAME_PATTERN = re.compile(r'r\.(-?\d+)\.(-?\d+)\.mca')
+# NBT 标签：定长标签的大小与数组标签的元素大小
+NBT_FIXED_SIZES = {1: 1, 2: 2, 3: 4, 4: 8, 5: 4, 6: 8}
+NBT_ARRAY_SIZES = {7: 1, 11: 4, 12: 8}
+NBT_LIST = 9
+NBT_COMPOUND = 10
+NBT_STRING = 8
+# 与 Minecraft 相同的最大嵌套深度
+NBT_MAX_DEPTH = 512
+NBT_INT = struct.Struct('>i')
+NBT_USHORT = struct.Struct('>H')
+
+
+class NbtError(Exception):
+    pass
+
+
+class WorldCheckReport:
+    """
+    一次存档检查的统计结果与发现的问题
+    """
+
+    def __init__(self):
+        self.regions = 0
+        self.region_bytes = 0
+        self.chunks = 0
+        # 解压检查的区块数
+        self.sampled = 0
+        # 发现的问题 [(相对路径, 说明)]
+        self.problems = []
+        self.elapsed = 0.0
+        # 实际使用的并行方式：process/thread
+        self.mode = None
+
+    def Merge(self, other, prefix=''):
+        """
+        合并另一个存档的检查结果
+        :param other: WorldCheckReport
+        :param prefix: 加在问题路径前的前缀（检查多个存档时为存档名）
+        :return: None
+        """
+        self.regions += other.regions
+        self.region_bytes += other.region_bytes
+        self.chunks += other.chunks
+        self.sampled += other.sampled
+        self.problems.extend((prefix + rel, message) for rel, message in other.problems)
+        self.elapsed += other.elapsed
+        self.mode = self.mode or other.mode
+
+    def Summary(self):
+        """
+        生成可以直接输出到游戏内的统计文本
+        :return: 统计文本
+        """
+        return (f'§7检查了§f{self.regions}§7个区域文件（§f{world_sync.FormatSize(self.region_bytes)}§7），'
+                f'§f{self.chunks}§7个区块，解压抽查§f{self.sampled}§7个，用时§e{self.elapsed:.2f}§7秒')
+
+    def Record(self):
+        """
+        :return: 写入同步日志的记录
+        """
+        return {
+            'regions': self.regions,
+            'chunks': self.chunks,
+            'sampled': self.sampled,
+            'problems': len(self.problems),
+            'elapsed': round(self.elapsed, 3),
+            'mode': self.mode,
+        }
+
+
+def SkipNbt(data, pos, tag, depth=0):
+    """
+    跳过一个 NBT 标签的内容，只检查结构，不解析取值
+    :param data: NBT 数据
+    :param pos: 标签内容的起始位置
+    :param tag: 标签类型
+    :param depth: 嵌套深度
+    :return: 标签内容之后的位置
+    """
+    size = NBT_FIXED_SIZES.get(tag)
+    if size is not None:
+        return pos + size
+    size = NBT_ARRAY_SIZES.get(tag)
+    if size is not None:
+        length = NBT_INT.unpack_from(data, pos)[0]
+        if length < 0:
+            raise NbtError(f'数组长度为负数（位置{pos}）')
+        return pos + 4 + length * size
+    if tag == NBT_STRING:
+        return pos + 2 + NBT_USHORT.unpack_from(data, pos)[0]
+    if depth >= NBT_MAX_DEPTH:
+        raise NbtError('嵌套层数过多')
+    if tag == NBT_LIST:
+        item = data[pos]
+        length = NBT_INT.unpack_from(data, pos + 1)[0]
+        pos += 5
+        if length < 0:
+            raise NbtError(f'列表长度为负数（位置{pos}）')
+        size = NBT_FIXED_SIZES.get(item)
+        if size is not None:
+            return pos + length * size
+        if item == 0 and length:
+            raise NbtError(f'列表元素类型无效（位置{pos}）')
+        for _ in range(length):
+            pos = SkipNbt(data, pos, item, depth + 1)
+        return pos
+    if tag == NBT_COMPOUND:
+        while True:
+            child = data[pos]
+            pos += 1
+            if child == 0:
+                return pos
+            pos += 2 + NBT_USHORT.unpack_from(data, pos)[0]
+            pos = SkipNbt(data, pos, child, depth + 1)
+    raise NbtError(f'未知的标签类型{tag}（位置{pos}）')
+
+
+def CheckNbt(data, exact=True):
+    """
+    检查 NBT 数据的结构：根标签必须是 Compound，且所有标签的长度都在数据范围内
+    :param data: 解压后的 NBT 数据
+    :param exact: 根标签之后是否不允许有多余的数据
+    :return: 问题说明，没有问题时返回 None
+    """
+    try:
+        if not data or data[0] != NBT_COMPOUND:
+            return '根标签不是Compound'
+        pos = SkipNbt(data, 3 + NBT_USHORT.unpack_from(data, 1)[0], NBT_COMPOUND)
+    except (IndexError, struct.error):
+        return 'NBT数据不完整'
+    except NbtError as e:
+        return f'NBT结构错误：{e}'
+    if pos > len(data):
+        return 'NBT数据不完整'
+    if exact and pos != len(data):
+        return f'NBT数据之后有{len(data) - pos}字节多余的数据'
+    return None
+
+
+def CheckLevelDat(file_path):
+    """
+    检查 level.dat：gzip 能否完整解压（包括校验和），NBT 结构是否完整
+    :param file_path: level.dat 路径
+    :return: 问题说明，没有问题时返回 None
+    """
+    try:
+        with open(file_path, 'rb') as f:
+            data = gzip.decompress(f.read())
+    except OSError as e:
+        return f'无法解压：{e}'
+    except EOFError:
+        return '压缩数据不完整'
+    return CheckNbt(data)
+
+
+def DecompressChunk(data, compression):
+    """
+    解压区块数据
+    :param data: 压缩后的数据
+    :param compression: 压缩方式
+    :return: 解压后的数据，不支持的压缩方式返回 None
+    """
+    if compression == 1:
+        return gzip.decompress(data)
+    if compression == 2:
+        return zlib.decompress(data)
+    if compression == 3:
+        return data
+    return None
+
+
+def PickSamples(present, timestamps, sample):
+    """
+    选择需要解压检查的区块：一半为时间戳最新的区块，另一半随机选择
+    :param present: 数据位于区域文件内的区块序号
+    :param timestamps: 区块时间戳表
+    :param sample: 最多选择的区块数
+    :return: 区块序号列表
+    """
+    if len(present) <= sample:
+        return list(present)
+    newest = sorted(present, key=lambda index: timestamps[index], reverse=True)[:(sample + 1) // 2]
+    rest = [index for index in present if index not in newest]
+    return newest + random.sample(rest, sample - len(newest))
+
+
+def CheckRegion(file_path, sample=SAMPLE_CHUNKS):
+    """
+    检查一个区域文件：位置表项是否越界或与文件头、其他区块重叠，区块头的长度与压缩方式是否合法，
+    外置区块（.mcc）是否存在，并解压检查部分区块
+    :param file_path: 区域文件路径
+    :param sample: 解压检查的区块数，0 为不解压
+    :return: (区块数, 解压检查的区块数, [问题说明])
+    """
+    size = os.path.getsize(file_path)
+    # 没有任何区块的区域文件可能是空文件
+    if size == 0:
+        return 0, 0, []
+    if size < anvil.HEADER_SIZE:
+        return 0, 0, [f'文件头不完整（文件只有{size}字节）']
+    match = REGION_NAME_PATTERN.fullmatch(os.path.basename(file_path))
+    problems = []
+    chunks = 0
+    sampled = 0
+    with open(file_path, 'rb', buffering=0) as f:
+        header = anvil.ParseHeader(f.read(anvil.HEADER_SIZE))
+        if header is None:
+            return 0, 0, ['文件头不完整']
+        locations, timestamps = header
+        sectors = -(-size // anvil.SECTOR_SIZE)
+        used = bytearray(sectors)
+        used[0:2] = b'\x01\x01'
+        present = []
+        for index, (offset, count) in enumerate(locations):
+            if offset == 0 and count == 0:
+                continue
+            chunks += 1
+            where = f'区块{index % 32},{index // 32}'
+            if offset < 2 or count == 0:
+                problems.append(f'{where}的位置表项无效（扇区{offset}，共{count}个）')
+                continue
+            if offset + count > sectors:
+                problems.append(f'{where}超出文件末尾（扇区{offset}~{offset + count - 1}，文件共{sectors}个扇区）')
+                continue
+            if used.find(1, offset, offset + count) != -1:
+                problems.append(f'{where}与其他区块的扇区重叠（扇区{offset}~{offset + count - 1}）')
+                continue
+            used[offset:offset + count] = b'\x01' * count
+            start = offset * anvil.SECTOR_SIZE
+            f.seek(start)
+            head = f.read(CHUNK_HEADER.size)
+            if len(head) < CHUNK_HEADER.size:
+                problems.append(f'{where}的区块头不完整')
+                continue
+            length, compression = CHUNK_HEADER.unpack(head)
+            if (compression & ~EXTERNAL_FLAG) not in COMPRESSIONS:
+                problems.append(f'{where}的压缩方式无效（{compression}）')
+                continue
+            if compression & EXTERNAL_FLAG:
+                if match is not None:
+                    x = int(match.group(1)) * 32 + index % 32
+                    z = int(match.group(2)) * 32 + index // 32
+                    external = os.path.join(os.path.dirname(file_path), f'c.{x}.{z}.mcc')
+                    if not os.path.isfile(external):
+                        problems.append(f'{where}的外置区块文件c.{x}.{z}.mcc不存在')
+                continue
+            if length <= 1 or 4 + length > count * anvil.SECTOR_SIZE or start + 4 + length > size:
+                problems.append(f'{where}的数据长度无效（{length}字节，分配了{count}个扇区）')
+                continue
+            present.append(index)
+
+        for index in PickSamples(present, timestamps, sample) if sample > 0 else ():
+            f.seek(locations[index][0] * anvil.SECTOR_SIZE)
+            length, compression = CHUNK_HEADER.unpack(f.read(CHUNK_HEADER.size))
+            try:
+                chunk = DecompressChunk(f.read(length - 1), compression)
+            except (OSError, EOFError, zlib.error) as e:
+                problems.append(f'区块{index % 32},{index // 32}无法解压：{e}')
+                continue
+            # LZ4 与自定义压缩不解压
+            if chunk is None:
+                continue
+            sampled += 1
+            problem = CheckNbt(chunk, False)
+            if problem is not None:
+                problems.append(f'区块{index % 32},{index // 32}：{problem}')
+    return chunks, sampled, problems
+
+
+def CheckRegions(root, rels, sample):
+    """
+    检查一批区域文件（进程池中执行的任务）
+    :param root: 存档路径
+    :param rels: 区域文件的相对路径
+    :param sample: 每个区域文件解压检查的区块数
+    :return: [(相对路径, 区块数, 解压检查的区块数, [问题说明])]
+    """
+    results = []
+    for rel in rels:
+        try:
+            chunks, sampled, problems = CheckRegion(os.path.join(root, rel), sample)
+        except (OSError, ValueError, struct.error) as e:
+            chunks, sampled, problems = 0, 0, [f'无法读取：{e}']
+        results.append((rel, chunks, sampled, problems))
+    return results
+
+
+def PoolContext():
+    """
+    进程池使用的启动方式：只使用 fork，子进程直接继承已加载的插件模块，不需要重新导入（只在明确开启多进程时使用）
+    :return: multiprocessing 上下文，不支持 fork 时返回 None
+    """
+    if 'fork' not in multiprocessing.get_all_start_methods():
+        return None
+    return multiprocessing.get_context('fork')
+
+
+def RunPool(pool, tasks, check=None):
+    """
+    在执行器中执行全部任务并收集结果
+    :param pool: 进程池或线程池
+    :param tasks: 任务参数列表
+    :param check: 等待期间定期调用的检查函数（例如任务被取消时抛出异常）
+    :return: 全部任务结果拼接成的列表
+    """
+    results = []
+    with pool:
+        pending = {pool.submit(CheckRegions, *task) for task in tasks}
+        try:
+            while pending:
+                done, pending = wait(pending, WAIT_SLICE, FIRST_COMPLETED)
+                for future in done:
+                    results.extend(future.result())
+                if check is not None:
+                    check()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    return results
+
+
+def RunChecks(tasks, workers, processes=False, check=None):
+    """
+    并行执行区域文件检查，默认使用线程池；开启多进程时使用进程池，无法创建进程时退回线程池
+    :param tasks: 任务参数列表
+    :param workers: 并行数
+    :param processes: 是否使用 fork 的进程池
+    :param check: 检查函数
+    :return: (结果列表, 实际使用的并行方式)
+    """
+    context = PoolContext() if processes and workers > 1 and len(tasks) > 1 else None
+    if context is not None:
+        try:
+            return RunPool(ProcessPoolExecutor(workers, mp_context=context), tasks, check), 'process'
+        except (OSError, BrokenProcessPool):
+            pass
+    return RunPool(ThreadPoolExecutor(workers, thread_name_prefix='MSC-Verify'), tasks, check), 'thread'
+
+
+def VerifyWorld(root, ignore=(), scope=None, sample=SAMPLE_CHUNKS, workers=0, processes=False, check=None):
+    """
+    检查一个存档的完整性
+    :param root: 存档路径
+    :param ignore: 忽略列表
+    :param scope: SyncScope，只检查范围内的文件
+    :param sample: 每个区域文件解压检查的区块数，0 为不解压
+    :param workers: 并行数，0 为 CPU 核数
+    :param processes: 是否使用 fork 的进程池
+    :param check: 检查函数
+    :return: WorldCheckReport
+    """
+    start = time.monotonic()
+    report = WorldCheckReport()
+    if not os.path.isdir(root):
+        report.problems.append(('', '存档不存在'))
+        return report
+    files, _ = world_sync.ScanTree(root, ignore, scope)
+    if 'level.dat' in files:
+        problem = CheckLevelDat(os.path.join(root, 'level.dat'))
+        if problem is not None:
+            report.problems.append(('level.dat', problem))
+    elif scope is None or scope.Contains('level.dat'):
+        report.problems.append(('level.dat', '文件不存在'))
+
+    regions = sorted((rel for rel in files if rel.endswith('.mca')), key=lambda rel: files[rel][0], reverse=True)
+    report.regions = len(regions)
+    report.region_bytes = sum(files[rel][0] for rel in regions)
+    workers = workers or os.cpu_count() or 1
+    # 从大文件开始分批，让各进程的负载更平均
+    tasks = [(root, regions[i:i + BATCH_FILES], sample) for i in range(0, len(regions), BATCH_FILES)]
+    results, report.mode = RunChecks(tasks, min(workers, len(tasks)) or 1, processes, check) if tasks else ([], None)
+    for rel, chunks, sampled, problems in sorted(results):
+        report.chunks += chunks
+        report.sampled += sampled
+        report.problems.extend((rel, problem) for problem in problems)
+    report.elapsed = time.monotonic() - start
+    return report
@@ -0,0 +1,801 @@
+import errno
+import fnmatch
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows 下没有 fcntl，reflink 策略会自动退回普通复制
+    fcntl = None
+
+from . import anvil, throttle
+
+"""
+存档同步引擎
+负责比较源存档与目标存档的差异，并只复制发生变化的文件
+"""
+
+# 复制时使用的临时文件后缀
+TEMP_SUFFIX = '.msc_tmp'
+# 计算哈希时每次读取的块大小
+HASH_BLOCK_SIZE = 1024 * 1024
+# 超过该大小的文件尝试使用内核零拷贝（copy_file_range/sendfile）
+ZERO_COPY_THRESHOLD = 1024 * 1024
+# 零拷贝每次调用传输的最大字节数
+ZERO_COPY_BLOCK_SIZE = 64 * 1024 * 1024
+# 内核不支持零拷贝时返回的错误码，遇到这些错误就退回普通复制
+ZERO_COPY_ERRNO = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.EBADF}
+# ioctl FICLONE（btrfs/XFS 等支持写时复制的文件系统上创建 reflink）
+FICLONE = 0x40049409
+# 可选的同步策略
+STRATEGIES = ('copy', 'reflink', 'hardlink-readonly')
+# 文件系统不支持 reflink/硬链接时返回的错误码
+LINK_UNSUPPORTED_ERRNO = ZERO_COPY_ERRNO | {errno.ENOTTY, errno.EPERM, errno.EMLINK, errno.ENOTSUP}
+# 按坐标命名的区域文件（region/entities/poi 文件夹下的 r.<x>.<z>.mca）
+REGION_FILE_PATTERN = re.compile(r'(?:.*/)?(?:region|entities|poi)/r\.(-?\d+)\.(-?\d+)\.mca')
+# 每个区域文件在每个方向上包含的区块数
+REGION_CHUNKS = 32
+
+# 运行时检测到的策略支持情况 {(策略, 源设备号, 目标设备号): 是否支持}
+strategy_support = {}
+strategy_lock = threading.Lock()
+
+
+class SyncReport:
+    """
+    一次同步的统计结果
+    """
+
+    def __init__(self):
+        self.skipped_files = 0
+        self.skipped_bytes = 0
+        self.copied_files = 0
+        self.copied_bytes = 0
+        self.deleted_files = 0
+        self.deleted_bytes = 0
+        # 区块级增量写入的文件数与实际写入字节数
+        self.delta_files = 0
+        self.delta_bytes = 0
+        # 远程同步时压缩后实际发送的字节数
+        self.sent_bytes = 0
+        # 同步完成后目标存档应有的文件与目录（与 ScanTree 格式相同），用于生成清单
+        self.files = {}
+        self.dirs = set()
+
+    def Summary(self):
+        """
+        生成可以直接输出到游戏内的统计文本
+        :return: 统计文本
+        """
+        return (f'§7跳过§f{self.skipped_files}§7个文件（§f{FormatSize(self.skipped_bytes)}§7），'
+                f'复制§a{self.copied_files}§7个文件（§a{FormatSize(self.copied_bytes)}§7），'
+                f'删除§c{self.deleted_files}§7个文件（§c{FormatSize(self.deleted_bytes)}§7）'
+                + (f'，其中§b{self.delta_files}§7个区域文件按区块增量写入§b{FormatSize(self.delta_bytes)}'
+                   if self.delta_files else ''))
+
+    def Merge(self, other):
+        """
+        累加另一个存档的统计结果（同步多个存档时使用）
+        :param other: SyncReport
+        :return: None
+        """
+        for name in ('skipped_files', 'skipped_bytes', 'copied_files', 'copied_bytes', 'deleted_files',
+                     'deleted_bytes', 'delta_files', 'delta_bytes', 'sent_bytes'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+class SyncProgress:
+    """
+    同步进度：已完成的文件数与字节数、当前速率、预计剩余时间与各阶段耗时
+    复制线程每完成一个文件调用一次 Add，距上次报告超过 interval 秒时调用 reporter(progress)
+    """
+
+    def __init__(self, reporter=None, interval=10):
+        """
+        :param reporter: 定期报告进度的函数，参数为 SyncProgress
+        :param interval: 报告间隔（秒）
+        """
+        self.reporter = reporter
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.start = time.monotonic()
+        # 各阶段耗时（秒），按阶段开始的顺序排列
+        self.phases = {}
+        self.phase = None
+        self.total_files = 0
+        self.total_bytes = 0
+        self.done_files = 0
+        self.done_bytes = 0
+        # 上一次报告时的时间与已完成字节数，用于计算当前速率
+        self.last_time = self.start
+        self.last_bytes = 0
+        self.rate = None
+
+    @contextmanager
+    def Phase(self, name):
+        """
+        记录一个阶段的耗时，同名阶段的耗时累加
+        :param name: 阶段名
+        :return: None
+        """
+        self.phase = name
+        begin = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.monotonic() - begin
+
+    def AddTotal(self, files, size):
+        """
+        增加需要传输的文件数与字节数（每个存档传输开始时调用）
+        :param files: 文件数
+        :param size: 字节数
+        :return: None
+        """
+        with self.lock:
+            self.total_files += files
+            self.total_bytes += size
+            self.last_time = time.monotonic()
+            self.last_bytes = self.done_bytes
+
+    def Add(self, size):
+        """
+        记录完成一个文件，到达报告间隔时调用 reporter
+        :param size: 文件大小
+        :return: None
+        """
+        with self.lock:
+            self.done_files += 1
+            self.done_bytes += size
+            now = time.monotonic()
+            if now - self.last_time < self.interval:
+                return
+            self.rate = (self.done_bytes - self.last_bytes) / (now - self.last_time)
+            self.last_time = now
+            self.last_bytes = self.done_bytes
+        if self.reporter is not None:
+            self.reporter(self)
+
+    def Elapsed(self):
+        """
+        :return: 同步开始至今的秒数
+        """
+        return time.monotonic() - self.start
+
+    def Rate(self):
+        """
+        当前速率：最近一个报告间隔内的速率，还没有报告过时为传输开始至今的平均速率
+        :return: 字节/秒
+        """
+        if self.rate is not None:
+            return self.rate
+        elapsed = time.monotonic() - self.last_time
+        return (self.done_bytes - self.last_bytes) / elapsed if elapsed > 0 else 0
+
+    def Eta(self):
+        """
+        :return: 预计剩余秒数，无法估计时返回 None
+        """
+        rate = self.Rate()
+        if not rate or not self.total_bytes:
+            return None
+        return max(0, self.total_bytes - self.done_bytes) / rate
+
+    def Describe(self):
+        """
+        生成可以直接输出到游戏内的进度文本
+        :return: 进度文本
+        """
+        percent = self.done_bytes / self.total_bytes * 100 if self.total_bytes else 0
+        eta = self.Eta()
+        return (f'§7{self.phase or ""} §a{percent:.0f}% §f{FormatSize(self.done_bytes)}§7/{FormatSize(self.total_bytes)}，'
+                f'§f{self.done_files}§7/{self.total_files}个文件，§b{FormatSize(self.Rate())}/s'
+                + (f'§7，预计剩余§e{eta:.0f}§7秒' if eta is not None else ''))
+
+    def Record(self, **extra):
+        """
+        生成一次同步的结构化记录
+        :param extra: 额外写入记录的字段
+        :return: 记录字典
+        """
+        elapsed = self.Elapsed()
+        record = {
+            'elapsed': round(elapsed, 3),
+            'phases': {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            'total_files': self.total_files,
+            'total_bytes': self.total_bytes,
+            'done_files': self.done_files,
+            'done_bytes': self.done_bytes,
+            'copy_rate': round(self.done_bytes / self.phases['copy'], 1) if self.phases.get('copy') else None,
+        }
+        record.update(extra)
+        return record
+
+
+def FormatSize(size):
+    """
+    把字节数转换为便于阅读的文本
+    :param size: 字节数
+    :return: 文本，例如 12.3MB
+    """
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.1f}{unit}' if unit != 'B' else f'{size}B'
+        size /= 1024
+
+
+def IsIgnored(name, ignore):
+    """
+    判断文件（夹）名是否命中忽略列表，规则与 shutil.ignore_patterns 一致
+    :param name: 文件（夹）名
+    :param ignore: 忽略列表（支持通配符）
+    :return: 是否忽略
+    """
+    return any(fnmatch.fnmatch(name, pattern) for pattern in ignore)
+
+
+class SyncScope:
+    """
+    同步范围：按相对于存档的路径选择需要同步的文件
+    范围外的文件与忽略文件一样，既不会被复制，也不会在目标存档中被删除
+    """
+
+    def __init__(self, include=None, exclude=None, region_bbox=None):
+        """
+        :param include: 只同步匹配的文件（通配符，以 / 结尾表示整个文件夹），为空表示全部
+        :param exclude: 不同步匹配的文件与文件夹（规则同上）
+        :param region_bbox: 区块坐标范围 {'min_x', 'min_z', 'max_x', 'max_z'}，只同步与范围相交的区域文件
+        """
+        self.include = list(include or [])
+        self.exclude = list(exclude or [])
+        self.region_bbox = region_bbox
+
+    def Active(self):
+        """
+        :return: 是否限制了范围
+        """
+        return bool(self.include or self.exclude or self.region_bbox)
+
+    @staticmethod
+    def Matches(rel, patterns):
+        for pattern in patterns:
+            if pattern.endswith('/'):
+                if rel == pattern[:-1] or rel.startswith(pattern) or fnmatch.fnmatch(rel, pattern[:-1]) or \
+                        fnmatch.fnmatch(rel, pattern + '*'):
+                    return True
+            elif fnmatch.fnmatch(rel, pattern):
+                return True
+        return False
+
+    def ExcludesDir(self, rel):
+        """
+        文件夹是否被整个排除（扫描时不再进入）
+        :param rel: 相对路径
+        :return: 是否排除
+        """
+        return self.Matches(rel, self.exclude)
+
+    def InRegionBox(self, rel):
+        """
+        区域文件是否与区块坐标范围相交，不是区域文件时返回 True
+        :param rel: 相对路径
+        :return: 是否相交
+        """
+        if not self.region_bbox:
+            return True
+        match = REGION_FILE_PATTERN.fullmatch(rel)
+        if match is None:
+            return True
+        x, z = int(match.group(1)) * REGION_CHUNKS, int(match.group(2)) * REGION_CHUNKS
+        box = self.region_bbox
+        return x + REGION_CHUNKS > box['min_x'] and x <= box['max_x'] and \
+            z + REGION_CHUNKS > box['min_z'] and z <= box['max_z']
+
+    def Match(self, rel):
+        """
+        文件是否在范围内（不检查上级文件夹）
+        :param rel: 相对路径
+        :return: 是否在范围内
+        """
+        if self.exclude and self.Matches(rel, self.exclude):
+            return False
+        if self.include and not self.Matches(rel, self.include):
+            return False
+        return self.InRegionBox(rel)
+
+    def Contains(self, rel, is_dir=False):
+        """
+        路径是否在范围内（上级文件夹被排除时也不在范围内）
+        :param rel: 相对路径
+        :param is_dir: 是否为文件夹
+        :return: 是否在范围内
+        """
+        parts = rel.split('/')
+        for i in range(1, len(parts) if not is_dir else len(parts) + 1):
+            if self.ExcludesDir('/'.join(parts[:i])):
+                return False
+        return is_dir or self.Match(rel)
+
+    def Filter(self, state):
+        """
+        只保留范围内的文件与文件夹
+        :param state: (文件字典, 目录集合)
+        :return: (文件字典, 目录集合)
+        """
+        if not self.Active():
+            return state
+        files, dirs = state
+        return ({rel: stat for rel, stat in files.items() if self.Contains(rel)},
+                {rel for rel in dirs if self.Contains(rel, True)})
+
+    def ToDict(self):
+        return {'include': self.include, 'exclude': self.exclude, 'region_bbox': self.region_bbox}
+
+    @classmethod
+    def FromDict(cls, data):
+        return cls(data.get('include'), data.get('exclude'), data.get('region_bbox')) if data else None
+
+
+def ScanTree(root, ignore, scope=None):
+    """
+    扫描目录，记录其中所有文件的大小与修改时间
+    :param root: 需要扫描的目录
+    :param ignore: 忽略列表
+    :param scope: SyncScope，范围外的文件不记录，被排除的文件夹不进入
+    :return: (文件字典 {相对路径: (大小, 修改时间ns)}, 目录集合 {相对路径})
+    """
+    if scope is not None and not scope.Active():
+        scope = None
+    files = {}
+    dirs = set()
+    if not os.path.isdir(root):
+        return files, dirs
+
+    stack = ['']
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                if IsIgnored(entry.name, ignore) or entry.name.endswith(TEMP_SUFFIX):
+                    continue
+                rel = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if scope is not None and scope.ExcludesDir(rel):
+                        continue
+                    dirs.add(rel)
+                    stack.append(rel)
+                else:
+                    if scope is not None and not scope.Match(rel):
+                        continue
+                    st = entry.stat(follow_symlinks=False)
+                    files[rel] = (st.st_size, st.st_mtime_ns)
+    return files, dirs
+
+
+def TreeSignature(roots, ignore, scope=None):
+    """
+    根据目录中所有文件的路径、大小与修改时间生成签名，只读取元数据，用于快速判断存档是否有变化
+    :param roots: 需要扫描的目录列表
+    :param ignore: 忽略列表
+    :param scope: SyncScope
+    :return: 十六进制签名
+    """
+    files = {}
+    for root in roots:
+        scanned, _ = ScanTree(root, ignore, scope)
+        files.update((f'{root}\0{rel}', stat) for rel, stat in scanned.items())
+    digest = hashlib.blake2b(digest_size=16)
+    for rel in sorted(files):
+        size, mtime = files[rel]
+        digest.update(f'{rel}\0{size}\0{mtime}\n'.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def FileHash(file_path):
+    """
+    计算文件内容哈希
+    :param file_path: 文件路径
+    :return: 十六进制哈希值
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as f:
+        while True:
+            block = f.read(HASH_BLOCK_SIZE)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def ZeroCopy(fsrc, fdst, size):
+    """
+    使用内核零拷贝复制文件内容，优先 copy_file_range，其次 sendfile
+    :param fsrc: 已打开的源文件
+    :param fdst: 已打开的目标文件
+    :param size: 源文件大小
+    :return: 是否复制成功（False 表示内核不支持，需要退回普通复制）
+    """
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    for method in ('copy_file_range', 'sendfile'):
+        func = getattr(os, method, None)
+        if func is None:
+            continue
+        offset = 0
+        try:
+            while offset < size:
+                if method == 'copy_file_range':
+                    sent = func(in_fd, out_fd, min(ZERO_COPY_BLOCK_SIZE, size - offset), offset, offset)
+                else:
+                    sent = func(out_fd, in_fd, offset, min(ZERO_COPY_BLOCK_SIZE, size - offset))
+                if sent == 0:
+                    break
+                offset += sent
+            return offset == size
+        except OSError as e:
+            if e.errno not in ZERO_COPY_ERRNO or offset:
+                raise
+    return False
+
+
+def ThrottledCopy(fsrc, fdst, size, limiter, check=None):
+    """
+    按块复制文件内容，每一块之前向限速器申请令牌，块内仍尽量使用零拷贝；
+    限速器开启丢弃页缓存时，每复制 DROP_WINDOW 字节回写并丢弃一次目标文件已写入部分的页缓存
+    :param fsrc: 已打开的源文件
+    :param fdst: 已打开的目标文件
+    :param size: 源文件大小
+    :param limiter: throttle.IoLimiter
+    :param check: 等待令牌期间调用的检查函数
+    :return: None
+    """
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    zero_copy = hasattr(os, 'copy_file_range')
+    offset = 0
+    # 已回写并丢弃页缓存的位置
+    dropped = 0
+    # 空文件也计一次读写
+    limiter.Consume(0, 1 if size == 0 else 0, check)
+    while offset < size:
+        length = min(throttle.BLOCK_SIZE, size - offset)
+        limiter.Consume(length, 1, check)
+        sent = None
+        if zero_copy:
+            try:
+                sent = os.copy_file_range(in_fd, out_fd, length, offset, offset)
+            except OSError as e:
+                if e.errno not in ZERO_COPY_ERRNO or offset:
+                    raise
+                zero_copy = False
+        if sent is None:
+            fsrc.seek(offset)
+            block = fsrc.read(length)
+            fdst.seek(offset)
+            fdst.write(block)
+            sent = len(block)
+        if sent == 0:
+            break
+        offset += sent
+        if limiter.fadvise and offset - dropped >= throttle.DROP_WINDOW:
+            fdst.flush()
+            limiter.Drop(out_fd, offset=dropped, length=offset - dropped)
+            dropped = offset
+    fdst.flush()
+
+
+def CopyFileData(src, dst, limiter=None, check=None):
+    """
+    复制文件内容与修改时间，大文件尝试走零拷贝
+    :param src: 源文件
+    :param dst: 目标文件
+    :param limiter: throttle.IoLimiter，为 None 时不限速
+    :param check: 等待限速期间调用的检查函数
+    :return: None
+    """
+    if limiter is not None:
+        src_stat = os.stat(src)
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            # 丢弃页缓存时同样按块复制，复制过程中分段回写并丢弃
+            if limiter.Limited() or limiter.fadvise:
+                ThrottledCopy(fsrc, fdst, src_stat.st_size, limiter, check)
+            elif not ZeroCopy(fsrc, fdst, src_stat.st_size):
+                fsrc.seek(0)
+                fdst.seek(0)
+                fdst.truncate()
+                shutil.copyfileobj(fsrc, fdst, HASH_BLOCK_SIZE)
+            fdst.flush()
+            limiter.Drop(fdst.fileno())
+            limiter.Drop(fsrc.fileno(), True, src_stat.st_mtime)
+        shutil.copystat(src, dst)
+        return
+    size = os.path.getsize(src)
+    if size < ZERO_COPY_THRESHOLD:
+        shutil.copy2(src, dst)
+        return
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        if not ZeroCopy(fsrc, fdst, size):
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst, HASH_BLOCK_SIZE)
+    shutil.copystat(src, dst)
+
+
+def Reflink(src, dst):
+    """
+    使用 FICLONE 创建 reflink（共享数据块，写入时才复制），并复制修改时间
+    :param src: 源文件
+    :param dst: 目标文件
+    :return: None
+    """
+    if fcntl is None:
+        raise OSError(errno.EOPNOTSUPP, 'reflink is not supported on this platform')
+    with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    shutil.copystat(src, dst)
+
+
+def StrategySupported(strategy, src, dst):
+    """
+    查询上一次在同一对文件系统上使用该策略是否成功
+    :param strategy: 同步策略
+    :param src: 源文件
+    :param dst: 目标文件
+    :return: 是否支持，尚未检测过时返回 True
+    """
+    if strategy == 'copy':
+        return True
+    try:
+        key = (strategy, os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev)
+    except OSError:
+        return True
+    with strategy_lock:
+        return strategy_support.get(key, True)
+
+
+def MarkUnsupported(strategy, src, dst):
+    """
+    记录该策略在这一对文件系统上不可用，之后直接使用普通复制
+    :param strategy: 同步策略
+    :param src: 源文件
+    :param dst: 目标文件
+    :return: None
+    """
+    key = (strategy, os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev)
+    with strategy_lock:
+        strategy_support[key] = False
+
+
+def CopyFile(src, dst, strategy='copy', limiter=None, check=None):
+    """
+    复制单个文件（含修改时间），先写入临时文件再替换，避免留下半个文件
+    reflink/硬链接策略在文件系统不支持时自动退回普通复制
+    :param src: 源文件
+    :param dst: 目标文件
+    :param strategy: 同步策略（copy/reflink/hardlink-readonly）
+    :param limiter: throttle.IoLimiter，reflink/硬链接不读写数据，只计一次读写
+    :param check: 等待限速期间调用的检查函数
+    :return: None
+    """
+    if os.path.isdir(dst) and not os.path.islink(dst):
+        shutil.rmtree(dst)
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    temp = dst + TEMP_SUFFIX
+    try:
+        if strategy != 'copy' and StrategySupported(strategy, src, dst):
+            try:
+                if limiter is not None:
+                    limiter.Consume(0, 1, check)
+                if strategy == 'reflink':
+                    Reflink(src, temp)
+                else:
+                    os.link(src, temp)
+                os.replace(temp, dst)
+                return
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED_ERRNO:
+                    raise
+                MarkUnsupported(strategy, src, dst)
+                if os.path.exists(temp):
+                    os.remove(temp)
+        CopyFileData(src, temp, limiter, check)
+        os.replace(temp, dst)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def SyncFile(src, dst, region_delta=False, strategy='copy', check=None, limiter=None):
+    """
+    同步单个文件，区域文件在允许时优先按区块增量写入
+    可以使用 reflink 时整文件 reflink 比区块增量更快，此时不走区块增量
+    :param src: 源文件
+    :param dst: 目标文件
+    :param region_delta: 是否允许区块级增量同步
+    :param strategy: 同步策略
+    :param check: 每个文件开始前调用的检查函数（例如任务被取消时抛出异常）
+    :param limiter: throttle.IoLimiter，为 None 时不限速
+    :return: 按区块增量写入的字节数，整文件复制时返回 None
+    """
+    if check is not None:
+        check()
+    if region_delta and dst.endswith('.mca') and os.path.isfile(dst) and \
+            (strategy == 'copy' or not StrategySupported(strategy, src, dst)):
+        written = anvil.DeltaCopy(src, dst, limiter, check)
+        if written is not None:
+            return written
+    CopyFile(src, dst, strategy, limiter, check)
+    return None
+
+
+def CopyFiles(tasks, workers=1, region_delta=False, strategy='copy', check=None, progress=None, limiter=None):
+    """
+    批量复制文件，workers 大于 1 时使用线程池并行复制
+    :param tasks: [(源文件, 目标文件, 大小)]
+    :param workers: 并行复制的线程数
+    :param region_delta: 是否允许区块级增量同步
+    :param strategy: 同步策略
+    :param check: 每个文件开始前调用的检查函数
+    :param progress: SyncProgress，每完成一个文件记录一次
+    :param limiter: throttle.IoLimiter，所有线程共享，为 None 时不限速
+    :return: 每个任务的 SyncFile 结果，顺序与 tasks 一致
+    """
+    def Run(src, dst, size):
+        written = SyncFile(src, dst, region_delta, strategy, check, limiter)
+        if progress is not None:
+            progress.Add(size)
+        return written
+
+    if progress is not None:
+        progress.AddTotal(len(tasks), sum(size for _, _, size in tasks))
+    if workers <= 1 or len(tasks) <= 1:
+        return [Run(*task) for task in tasks]
+    # 先提交大文件，避免最后只剩一个线程在复制大文件
+    order = sorted(range(len(tasks)), key=lambda i: tasks[i][2], reverse=True)
+    results = [None] * len(tasks)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='MSC-Copy') as pool:
+        futures = {i: pool.submit(Run, *tasks[i]) for i in order}
+        for i, future in futures.items():
+            results[i] = future.result()
+    return results
+
+
+def ClearTree(target, ignore, scope):
+    """
+    删除目标存档中范围内的文件与空文件夹，范围外的文件与忽略文件原地保留（限制了范围的完整同步使用）
+    :param target: 目标存档路径
+    :param ignore: 忽略列表
+    :param scope: SyncScope
+    :return: None
+    """
+    files, dirs = ScanTree(target, ignore, scope)
+    for rel in files:
+        try:
+            os.remove(os.path.join(target, rel))
+        except FileNotFoundError:
+            continue
+    for rel in sorted(dirs, key=lambda d: d.count('/'), reverse=True):
+        dir_path = os.path.join(target, rel)
+        if os.path.isdir(dir_path) and not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+
+def FullCopy(source, target, ignore, workers=1, strategy='copy', check=None, progress=None, scope=None,
+             limiter=None):
+    """
+    完整复制存档（目标存档需要事先清理），用于替代 shutil.copytree 的并行版本
+    :param source: 源存档路径
+    :param target: 目标存档路径
+    :param ignore: 忽略列表
+    :param workers: 并行复制的线程数
+    :param strategy: 同步策略
+    :param check: 每个文件开始前调用的检查函数
+    :param progress: SyncProgress，记录 scan/copy 阶段的耗时与复制进度
+    :param scope: SyncScope，只复制范围内的文件
+    :param limiter: throttle.IoLimiter，为 None 时不限速
+    :return: SyncReport
+    """
+    progress = progress or SyncProgress()
+    report = SyncReport()
+    with progress.Phase('scan'):
+        src_files, src_dirs = ScanTree(source, ignore, scope)
+    with progress.Phase('copy'):
+        os.makedirs(target, exist_ok=True)
+        for rel in src_dirs:
+            os.makedirs(os.path.join(target, rel), exist_ok=True)
+        tasks = [(os.path.join(source, rel), os.path.join(target, rel), size) for rel, (size, _) in src_files.items()]
+        CopyFiles(tasks, workers, strategy=strategy, check=check, progress=progress, limiter=limiter)
+    report.files, report.dirs = src_files, src_dirs
+    report.copied_files = len(tasks)
+    report.copied_bytes = sum(size for _, _, size in tasks)
+    return report
+
+
+def IncrementalSync(source, target, ignore, hash_check=False, workers=1, region_delta=False, known=None,
+                    strategy='copy', check=None, progress=None, source_state=None, scope=None, limiter=None):
+    """
+    增量同步：只复制大小或修改时间发生变化的文件，删除源存档中已不存在的文件，
+    命中忽略列表的文件在目标存档中原地保留
+    :param source: 源存档路径
+    :param target: 目标存档路径
+    :param ignore: 忽略列表
+    :param hash_check: 大小一致但修改时间不同时，是否比较内容哈希再决定是否复制
+    :param workers: 并行复制的线程数
+    :param region_delta: 是否对区域文件（.mca）按区块增量同步
+    :param known: 已知的目标存档状态（来自清单），为 None 时扫描目标存档
+    :param strategy: 同步策略
+    :param check: 每个文件开始前调用的检查函数
+    :param progress: SyncProgress，记录 scan/delete/compare/copy 阶段的耗时与复制进度
+    :param source_state: 已知的源存档状态（由脏路径集合得到），为 None 时扫描源存档
+    :param scope: SyncScope，范围外的文件不复制，也不在目标存档中删除
+    :param limiter: throttle.IoLimiter，为 None 时不限速
+    :return: SyncReport
+    """
+    progress = progress or SyncProgress()
+    report = SyncReport()
+    scope = scope or SyncScope()
+    with progress.Phase('scan'):
+        src_files, src_dirs = ScanTree(source, ignore, scope) if source_state is None else source_state
+        # 清单可能是在范围调整之前生成的，范围外的文件需要在目标存档中保留
+        dst_files, dst_dirs = ScanTree(target, ignore, scope) if known is None else scope.Filter(known)
+    report.files, report.dirs = src_files, src_dirs
+    os.makedirs(target, exist_ok=True)
+
+    with progress.Phase('delete'):
+        # 先清理源存档中已不存在的文件
+        for rel, (size, _) in dst_files.items():
+            if rel not in src_files:
+                try:
+                    os.remove(os.path.join(target, rel))
+                except FileNotFoundError:
+                    continue
+                report.deleted_files += 1
+                report.deleted_bytes += size
+
+        # 由深到浅删除源存档中已不存在的文件夹，里面还有忽略文件的则保留
+        for rel in sorted(dst_dirs - src_dirs, key=lambda d: d.count('/'), reverse=True):
+            dir_path = os.path.join(target, rel)
+            if os.path.isdir(dir_path) and not os.listdir(dir_path):
+                os.rmdir(dir_path)
+
+    # 空文件夹也需要保留
+    for rel in src_dirs - dst_dirs:
+        os.makedirs(os.path.join(target, rel), exist_ok=True)
+
+    tasks = []
+    with progress.Phase('compare'):
+        for rel, (size, mtime) in src_files.items():
+            src_path = os.path.join(source, rel)
+            dst_path = os.path.join(target, rel)
+            old = dst_files.get(rel)
+            if old is not None:
+                if old == (size, mtime):
+                    report.skipped_files += 1
+                    report.skipped_bytes += size
+                    continue
+                # 按清单比较时目标文件可能已被删除，此时视为有变化直接复制
+                if hash_check and old[0] == size and os.path.isfile(dst_path) and \
+                        FileHash(src_path) == FileHash(dst_path):
+                    # 内容一致，只同步修改时间，下次可以直接按大小与时间跳过
+                    shutil.copystat(src_path, dst_path)
+                    report.skipped_files += 1
+                    report.skipped_bytes += size
+                    continue
+            tasks.append((src_path, dst_path, size))
+
+    with progress.Phase('copy'):
+        results = CopyFiles(tasks, workers, region_delta, strategy, check, progress, limiter)
+    for (_, _, size), written in zip(tasks, results):
+        if written is None:
+            report.copied_files += 1
+            report.copied_bytes += size
+        else:
+            report.delta_files += 1
+            report.delta_bytes += written
+    return report
@@ -0,0 +1,563 @@
+import abc
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import stat
+import struct
+import sys
+import threading
+
+from . import world_sync
+
+"""
+主服存档变化监视
+在两次同步之间记录主服存档中发生变化的路径（脏路径集合），增量同步时只检查这些路径，不再遍历整个存档；
+Linux 上使用 inotify（通过 ctypes 调用，不需要额外依赖），其他系统或 inotify 不可用时退回定期轮询。
+脏路径集合有数量上限，超出上限或 inotify 事件队列溢出时放弃集合，下一次同步退回完整扫描
+"""
+
+# 每台服务器脏路径集合的默认上限
+MAX_DIRTY = 100000
+# 轮询模式的默认间隔（秒）
+POLL_INTERVAL = 30
+# 等待 inotify 事件时检查停止标志的间隔（秒）
+WAIT_INTERVAL = 1
+# 每次读取 inotify 事件的缓冲区大小
+READ_SIZE = 64 * 1024
+
+# inotify 常量（linux/inotify.h）
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | \
+    IN_MOVE_SELF | IN_ONLYDIR | IN_EXCL_UNLINK
+EVENT_HEADER = struct.Struct('iIII')
+
+if sys.platform.startswith('linux'):
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+    except (OSError, AttributeError):
+        libc = None
+else:
+    libc = None
+
+
+def InotifySupported():
+    """
+    当前系统是否可以使用 inotify
+    :return: 是否可以使用
+    """
+    return libc is not None
+
+
+class DirtySet:
+    """
+    一台服务器的脏路径集合
+    complete 为 False（刚开始监视、溢出或上一次同步失败）时集合不可信，下一次同步需要完整扫描
+    """
+
+    def __init__(self, limit=MAX_DIRTY):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.paths = set()
+        self.complete = False
+
+    def Add(self, rel):
+        """
+        记录一个发生变化的路径，超出上限时放弃集合
+        :param rel: 相对于存档的路径
+        :return: None
+        """
+        with self.lock:
+            if not self.complete:
+                return
+            self.paths.add(rel)
+            if len(self.paths) > self.limit:
+                self.paths = set()
+                self.complete = False
+
+    def Invalidate(self):
+        """
+        放弃集合，下一次同步完整扫描
+        :return: None
+        """
+        with self.lock:
+            self.paths = set()
+            self.complete = False
+
+    def Take(self):
+        """
+        取出集合并从现在开始重新记录
+        :return: 脏路径集合，不可信时返回 None
+        """
+        with self.lock:
+            paths = self.paths if self.complete else None
+            self.paths = set()
+            self.complete = True
+            return paths
+
+    def Pending(self):
+        """
+        当前记录的路径数
+        :return: 路径数，不可信时返回 None
+        """
+        with self.lock:
+            return len(self.paths) if self.complete else None
+
+
+class Watcher(abc.ABC):
+    """
+    监视一个存档，把变化的路径记录到每个订阅者（使用该存档同步的服务器）的脏路径集合中
+    """
+
+    name = 'none'
+
+    def __init__(self, root):
+        """
+        :param root: 存档路径
+        """
+        self.root = root
+        self.lock = threading.Lock()
+        self.subscribers = {}
+        self.stop_event = threading.Event()
+        self.thread = None
+
+    def Subscribe(self, server_name, limit=MAX_DIRTY):
+        """
+        添加订阅者，新的订阅者在第一次同步前没有可信的集合
+        :param server_name: 服务器名字
+        :param limit: 脏路径集合上限
+        :return: None
+        """
+        with self.lock:
+            dirty = self.subscribers.get(server_name)
+            if dirty is None:
+                self.subscribers[server_name] = DirtySet(limit)
+            else:
+                dirty.limit = limit
+
+    def Unsubscribe(self, server_name):
+        with self.lock:
+            self.subscribers.pop(server_name, None)
+
+    def Get(self, server_name):
+        with self.lock:
+            return self.subscribers.get(server_name)
+
+    def Record(self, rel):
+        """
+        记录一个发生变化的路径
+        :param rel: 相对于存档的路径
+        :return: None
+        """
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+        for dirty in subscribers:
+            dirty.Add(rel)
+
+    def Overflow(self):
+        """
+        无法确定哪些路径发生了变化，所有订阅者下一次同步完整扫描
+        :return: None
+        """
+        with self.lock:
+            subscribers = list(self.subscribers.values())
+        for dirty in subscribers:
+            dirty.Invalidate()
+
+    def Take(self, server_name):
+        """
+        同步开始时取出订阅者的脏路径集合
+        :param server_name: 服务器名字
+        :return: 脏路径集合，不可信时返回 None
+        """
+        dirty = self.Get(server_name)
+        return dirty.Take() if dirty is not None else None
+
+    @abc.abstractmethod
+    def Run(self):
+        """
+        监视线程的主循环，直到 stop_event 被置位
+        :return: None
+        """
+
+    def Start(self):
+        """
+        启动监视线程
+        :return: None
+        """
+        self.stop_event.clear()
+        self.thread = threading.Thread(target=self.Run, name=f'MSC-Watch-{self.name}', daemon=True)
+        self.thread.start()
+
+    def Stop(self):
+        """
+        停止监视线程
+        :return: None
+        """
+        self.stop_event.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+
+class InotifyWatcher(Watcher):
+    """
+    使用 inotify 监视存档中的每个文件夹，新建的文件夹自动加入监视
+    """
+
+    name = 'inotify'
+
+    def __init__(self, root):
+        super().__init__(root)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        # {watch descriptor: 相对路径}
+        self.watches = {}
+
+    def AddWatch(self, rel):
+        """
+        监视一个文件夹
+        :param rel: 相对于存档的路径，'' 为存档本身
+        :return: None
+        """
+        wd = libc.inotify_add_watch(self.fd, os.fsencode(os.path.join(self.root, rel)), WATCH_MASK)
+        if wd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.watches[wd] = rel
+
+    def AddTree(self, rel):
+        """
+        监视一个文件夹及其下所有文件夹
+        :param rel: 相对于存档的路径
+        :return: None
+        """
+        self.AddWatch(rel)
+        for root, dirs, _ in os.walk(os.path.join(self.root, rel)):
+            for name in dirs:
+                child = os.path.relpath(os.path.join(root, name), self.root).replace(os.sep, '/')
+                try:
+                    self.AddWatch(child)
+                except OSError as e:
+                    # 文件夹已被删除时忽略，达到监视数量上限（ENOSPC）等其他错误向上抛出
+                    if e.errno != errno.ENOENT:
+                        raise
+
+    def Rewatch(self):
+        """
+        重新监视整个存档（开始监视、存档被删除后重建、文件夹被移动后）
+        期间发生的变化无法记录，所有订阅者下一次同步完整扫描
+        :return: 是否成功
+        """
+        for wd in list(self.watches):
+            libc.inotify_rm_watch(self.fd, wd)
+        self.watches = {}
+        self.Overflow()
+        if not os.path.isdir(self.root):
+            return False
+        try:
+            self.AddTree('')
+        except OSError:
+            for wd in list(self.watches):
+                libc.inotify_rm_watch(self.fd, wd)
+            self.watches = {}
+            return False
+        return True
+
+    def Handle(self, data):
+        """
+        处理读取到的事件
+        :param data: 读取到的数据
+        :return: 是否需要重新监视整个存档
+        """
+        offset = 0
+        rewatch = False
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b'\0')
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.Overflow()
+                continue
+            parent = self.watches.get(wd)
+            if parent is None:
+                continue
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                if parent == '':
+                    rewatch = True
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                if parent == '':
+                    rewatch = True
+                continue
+            if not name:
+                continue
+            name = os.fsdecode(name)
+            rel = f'{parent}/{name}' if parent else name
+            self.Record(rel)
+            if mask & IN_ISDIR:
+                if mask & IN_MOVED_FROM:
+                    # 被移走的文件夹仍在监视中但路径已经改变，重新监视整个存档
+                    rewatch = True
+                elif mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self.AddTree(rel)
+                    except OSError as e:
+                        if e.errno != errno.ENOENT:
+                            self.Overflow()
+        return rewatch
+
+    def Run(self):
+        """
+        监视线程
+        :return: None
+        """
+        watching = self.Rewatch()
+        try:
+            while not self.stop_event.is_set():
+                if not watching:
+                    # 存档不存在或无法监视（例如达到 fs.inotify.max_user_watches），期间同步都完整扫描，稍后重试
+                    self.stop_event.wait(POLL_INTERVAL)
+                    watching = self.Rewatch()
+                    continue
+                ready, _, _ = select.select([self.fd], [], [], WAIT_INTERVAL)
+                if not ready:
+                    continue
+                try:
+                    data = os.read(self.fd, READ_SIZE)
+                except BlockingIOError:
+                    continue
+                if self.Handle(data):
+                    watching = self.Rewatch()
+        finally:
+            os.close(self.fd)
+
+
+class PollingWatcher(Watcher):
+    """
+    定期扫描存档，与上一次扫描的结果比较得到变化的路径
+    轮询只能发现上一次扫描之前的变化，取出集合时会先补扫一次，因此不能省去同步时的扫描，只保证在没有 inotify 时结果正确
+    """
+
+    name = 'poll'
+
+    def __init__(self, root, interval=POLL_INTERVAL):
+        super().__init__(root)
+        self.interval = interval
+        self.scan_lock = threading.Lock()
+        self.state = None
+
+    def Poll(self):
+        """
+        扫描一次存档并记录变化
+        :return: None
+        """
+        with self.scan_lock:
+            files, dirs = world_sync.ScanTree(self.root, [])
+            if self.state is not None:
+                old_files, old_dirs = self.state
+                for rel in files.keys() ^ old_files.keys():
+                    self.Record(rel)
+                for rel, st in files.items():
+                    if old_files.get(rel, st) != st:
+                        self.Record(rel)
+                for rel in dirs ^ old_dirs:
+                    self.Record(rel)
+            self.state = files, dirs
+
+    def Take(self, server_name):
+        self.Poll()
+        return super().Take(server_name)
+
+    def Run(self):
+        """
+        轮询线程
+        :return: None
+        """
+        self.Poll()
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.Poll()
+            except OSError:
+                self.Overflow()
+
+
+def CreateWatcher(root, mode='auto', interval=POLL_INTERVAL):
+    """
+    创建监视器，auto 模式下优先使用 inotify
+    :param root: 存档路径
+    :param mode: auto/inotify/poll
+    :param interval: 轮询间隔（秒）
+    :return: Watcher
+    """
+    if mode != 'poll' and InotifySupported():
+        try:
+            return InotifyWatcher(root)
+        except OSError:
+            if mode == 'inotify':
+                raise
+    return PollingWatcher(root, interval)
+
+
+def IsIgnoredPath(rel, ignore):
+    """
+    路径中的任意一级命中忽略列表或是临时文件（与 world_sync.ScanTree 的规则一致）
+    :param rel: 相对路径
+    :param ignore: 忽略列表
+    :return: 是否忽略
+    """
+    return any(world_sync.IsIgnored(name, ignore) or name.endswith(world_sync.TEMP_SUFFIX) for name in rel.split('/'))
+
+
+def ApplyChanges(root, state, paths, ignore, scope=None):
+    """
+    在上一次同步时的存档状态上应用脏路径，得到与 world_sync.ScanTree 相同的结果，只访问发生变化的路径
+    :param root: 存档路径
+    :param state: 上一次同步时的存档状态 (文件字典, 目录集合)
+    :param paths: 脏路径集合
+    :param ignore: 忽略列表
+    :param scope: SyncScope
+    :return: (文件字典, 目录集合)
+    """
+    scope = scope or world_sync.SyncScope()
+    files, dirs = scope.Filter(state)
+    files, dirs = dict(files), set(dirs)
+    # 由浅到深处理，新建文件夹整体扫描后其中的路径不需要再单独处理
+    for rel in sorted(paths, key=lambda p: p.count('/')):
+        if IsIgnoredPath(rel, ignore):
+            continue
+        prefix = rel + '/'
+        try:
+            st = os.lstat(os.path.join(root, rel))
+        except (FileNotFoundError, NotADirectoryError):
+            st = None
+        if st is not None and not stat.S_ISDIR(st.st_mode):
+            if not scope.Contains(rel):
+                continue
+            files[rel] = (st.st_size, st.st_mtime_ns)
+            dirs.discard(rel)
+            continue
+        # 被删除或者（重新）创建的文件夹：去掉原有的记录，存在时重新扫描其中的内容
+        files.pop(rel, None)
+        if rel in dirs or st is None:
+            for path in [path for path in files if path.startswith(prefix)]:
+                del files[path]
+            dirs.difference_update([path for path in dirs if path.startswith(prefix)])
+            dirs.discard(rel)
+        if st is not None and scope.Contains(rel, True):
+            dirs.add(rel)
+            sub_files, sub_dirs = world_sync.ScanTree(os.path.join(root, rel), ignore)
+            sub_files, sub_dirs = scope.Filter((
+                {prefix + path: stat for path, stat in sub_files.items()},
+                {prefix + path for path in sub_dirs}
+            ))
+            files.update(sub_files)
+            dirs.update(sub_dirs)
+    return files, dirs
+
+
+class WatchManager:
+    """
+    管理所有存档的监视器：同一个存档只监视一次，使用它同步的服务器各自拥有脏路径集合
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # {存档路径: Watcher}
+        self.watchers = {}
+        # {服务器名字: 存档路径}
+        self.servers = {}
+
+    def Configure(self, targets, mode='auto', interval=POLL_INTERVAL, limit=MAX_DIRTY):
+        """
+        更新需要监视的存档，已有的监视器与脏路径集合保留
+        :param targets: {服务器名字: 主服存档路径}
+        :param mode: auto/inotify/poll
+        :param interval: 轮询间隔（秒）
+        :param limit: 每台服务器脏路径集合的上限
+        :return: {存档路径: 监视方式}
+        """
+        targets = {server_name: os.path.abspath(root) for server_name, root in targets.items()}
+        with self.lock:
+            for server_name, root in list(self.servers.items()):
+                if targets.get(server_name) != root:
+                    self.watchers[root].Unsubscribe(server_name)
+                    del self.servers[server_name]
+            for server_name, root in targets.items():
+                watcher = self.watchers.get(root)
+                if watcher is None:
+                    watcher = self.watchers[root] = CreateWatcher(root, mode, interval)
+                    watcher.Start()
+                watcher.Subscribe(server_name, limit)
+                self.servers[server_name] = root
+            for root, watcher in list(self.watchers.items()):
+                if root not in self.servers.values():
+                    watcher.Stop()
+                    del self.watchers[root]
+            return {root: watcher.name for root, watcher in self.watchers.items()}
+
+    def Watcher(self, server_name):
+        with self.lock:
+            root = self.servers.get(server_name)
+            return self.watchers.get(root) if root is not None else None
+
+    def Take(self, server_name):
+        """
+        同步开始时取出服务器的脏路径集合
+        :param server_name: 服务器名字
+        :return: 脏路径集合，没有监视或集合不可信时返回 None
+        """
+        watcher = self.Watcher(server_name)
+        return watcher.Take(server_name) if watcher is not None else None
+
+    def Pending(self, server_name):
+        """
+        上一次同步之后记录的路径数（轮询模式下不包含最近一次轮询之后的变化）
+        :param server_name: 服务器名字
+        :return: 路径数，没有监视或集合不可信时返回 None
+        """
+        watcher = self.Watcher(server_name)
+        if watcher is None or isinstance(watcher, PollingWatcher):
+            return None
+        dirty = watcher.Get(server_name)
+        return dirty.Pending() if dirty is not None else None
+
+    def Invalidate(self, server_name):
+        """
+        同步失败时放弃服务器的脏路径集合，下一次同步完整扫描
+        :param server_name: 服务器名字
+        :return: None
+        """
+        watcher = self.Watcher(server_name)
+        if watcher is not None:
+            dirty = watcher.Get(server_name)
+            if dirty is not None:
+                dirty.Invalidate()
+
+    def Close(self):
+        """
+        停止所有监视器
+        :return: None
+        """
+        self.Configure({})
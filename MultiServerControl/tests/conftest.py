@@ -0,0 +1,8 @@
+import os
+import sys
+
+# 插件所在目录（MultiServerControl），加入搜索路径后即可导入 multi_server_control
+PLUGIN_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PLUGIN_ROOT)
+# 测试复用性能测试中的本地模拟服务器（benchmark/stubs.py）
+sys.path.insert(0, os.path.join(PLUGIN_ROOT, 'benchmark'))
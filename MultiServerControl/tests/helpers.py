@@ -0,0 +1,37 @@
+import os
+
+"""
+测试的公共部分：生成与比较文件树
+"""
+
+
+def WriteTree(root, files):
+    """
+    按 {相对路径: 内容} 写入文件树
+    :param root: 根目录
+    :param files: {相对路径: bytes}
+    :return: None
+    """
+    for rel, data in files.items():
+        file_path = os.path.join(root, rel)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+
+
+def ReadTree(root, skip_suffix=None):
+    """
+    读取文件树的全部内容
+    :param root: 根目录
+    :param skip_suffix: 跳过以此结尾的文件（临时文件）
+    :return: {相对路径: bytes}
+    """
+    files = {}
+    for base, _, names in os.walk(root):
+        for name in names:
+            if skip_suffix and name.endswith(skip_suffix):
+                continue
+            file_path = os.path.join(base, name)
+            with open(file_path, 'rb') as f:
+                files[os.path.relpath(file_path, root).replace(os.sep, '/')] = f.read()
+    return files
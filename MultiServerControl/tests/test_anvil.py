@@ -0,0 +1,205 @@
+import os
+import shutil
+import struct
+
+import pytest
+
+from multi_server_control import anvil, world_sync
+
+SECTOR = anvil.SECTOR_SIZE
+# 测试区域文件中的区块数，每个区块占一个扇区，依次存放在文件头之后
+CHUNKS = 64
+
+
+def ChunkBytes(index, version, sectors=1):
+    """
+    生成区块数据（内容只用于比较，不需要是合法的 NBT）
+    :param index: 区块序号
+    :param version: 版本号，不同版本内容不同
+    :param sectors: 占用的扇区数
+    :return: bytes
+    """
+    return struct.pack('>HH', index, version) * (SECTOR * sectors // 4)
+
+
+class Region:
+    """
+    可修改的模拟区域文件
+    """
+
+    def __init__(self, count=CHUNKS):
+        self.locations = [(0, 0)] * anvil.CHUNK_COUNT
+        self.timestamps = [0] * anvil.CHUNK_COUNT
+        self.body = bytearray(anvil.HEADER_SIZE)
+        for index in range(count):
+            self.Append(index, 1)
+
+    def Write(self, index, offset, version, sectors=1):
+        """
+        把区块写入指定扇区
+        :param index: 区块序号
+        :param offset: 起始扇区
+        :param version: 版本号（同时作为时间戳）
+        :param sectors: 扇区数
+        :return: None
+        """
+        end = (offset + sectors) * SECTOR
+        if len(self.body) < end:
+            self.body.extend(bytes(end - len(self.body)))
+        self.body[offset * SECTOR:end] = ChunkBytes(index, version, sectors)
+        self.locations[index] = (offset, sectors)
+        self.timestamps[index] = version
+
+    def Append(self, index, version, sectors=1):
+        self.Write(index, len(self.body) // SECTOR, version, sectors)
+
+    def Remove(self, index):
+        self.locations[index] = (0, 0)
+        self.timestamps[index] = 0
+
+    def Bytes(self):
+        header = struct.pack(f'>{anvil.CHUNK_COUNT}I', *((offset << 8) | count for offset, count in self.locations))
+        header += struct.pack(f'>{anvil.CHUNK_COUNT}I', *self.timestamps)
+        return header + bytes(self.body[anvil.HEADER_SIZE:])
+
+    def Save(self, file_path):
+        with open(file_path, 'wb') as f:
+            f.write(self.Bytes())
+
+
+def ReadFile(file_path):
+    with open(file_path, 'rb') as f:
+        return f.read()
+
+
+@pytest.fixture
+def pair(tmp_path):
+    """
+    (源区域文件, 目标区域文件, 区域)：目标为修改前的源文件
+    """
+    region = Region()
+    src, dst = str(tmp_path / 'src.mca'), str(tmp_path / 'dst.mca')
+    region.Save(src)
+    shutil.copyfile(src, dst)
+    return src, dst, region
+
+
+def Delta(src, dst):
+    """
+    按区块增量同步并检查结果与源文件一致
+    :return: DeltaCopy 的结果
+    """
+    written = anvil.DeltaCopy(src, dst)
+    assert ReadFile(dst) == ReadFile(src)
+    return written
+
+
+def test_unchanged(pair):
+    src, dst, _ = pair
+    assert Delta(src, dst) == anvil.HEADER_SIZE
+
+
+def test_rewritten_in_place(pair):
+    src, dst, region = pair
+    for index in (3, 4, 10):
+        offset, _ = region.locations[index]
+        region.Write(index, offset, 2)
+    region.Save(src)
+    # 相邻的 3、4 合并为一个范围
+    assert anvil.ChunkRanges(anvil.ReadHeader(src), anvil.ReadHeader(dst), os.path.getsize(src),
+                             os.path.getsize(dst)) == [(5 * SECTOR, 7 * SECTOR), (12 * SECTOR, 13 * SECTOR)]
+    assert Delta(src, dst) == anvil.HEADER_SIZE + 3 * SECTOR
+
+
+def test_relocated(pair):
+    src, dst, region = pair
+    # 区块变大后移动到文件末尾，原来的扇区保持原样
+    region.Append(7, 2, sectors=3)
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE + 3 * SECTOR
+
+
+def test_relocated_same_timestamp(pair):
+    src, dst, region = pair
+    # 时间戳不变但位置变化的区块同样需要重写
+    region.Write(7, len(region.body) // SECTOR, 1)
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE + SECTOR
+
+
+def test_added(pair):
+    src, dst, region = pair
+    region.Append(CHUNKS, 1)
+    region.Append(CHUNKS + 1, 1)
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE + 2 * SECTOR
+
+
+def test_removed(pair):
+    src, dst, region = pair
+    region.Remove(20)
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE
+
+
+def test_removed_and_truncated(pair):
+    src, dst, region = pair
+    # 删除末尾的区块后源文件变短，目标文件同样截断
+    region.Remove(CHUNKS - 1)
+    del region.body[-SECTOR:]
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE
+
+
+@pytest.mark.parametrize('corrupt', ['short', 'out_of_range', 'inside_header'])
+def test_corrupt_header_falls_back(pair, corrupt):
+    src, dst, region = pair
+    region.Write(5, region.locations[5][0], 2)
+    if corrupt == 'short':
+        data = region.Bytes()[:anvil.HEADER_SIZE - 1]
+    else:
+        region.locations[9] = (1000, 1) if corrupt == 'out_of_range' else (1, 1)
+        data = region.Bytes()
+    with open(src, 'wb') as f:
+        f.write(data)
+    assert anvil.DeltaCopy(src, dst) is None
+    assert world_sync.SyncFile(src, dst, region_delta=True) is None
+    assert ReadFile(dst) == ReadFile(src)
+
+
+def test_hardlinked_target_falls_back(tmp_path, pair):
+    src, dst, region = pair
+    other = str(tmp_path / 'other.mca')
+    os.link(dst, other)
+    before = ReadFile(other)
+    region.Write(5, region.locations[5][0], 2)
+    region.Save(src)
+    assert anvil.DeltaCopy(src, dst) is None
+    assert world_sync.SyncFile(src, dst, region_delta=True) is None
+    assert ReadFile(dst) == ReadFile(src)
+    # 整文件复制替换目标文件，不会改写共享数据的另一个文件
+    assert ReadFile(other) == before
+
+
+def RewriteChunks(region, count):
+    for index in range(count):
+        region.Write(index, region.locations[index][0], 2)
+
+
+def test_delta_ratio_cutoff(pair):
+    src, dst, region = pair
+    # 文件头也计入写入量：刚好不超过一半时仍然增量同步
+    limit = int((anvil.HEADER_SIZE + CHUNKS * SECTOR) * anvil.DELTA_MAX_RATIO - anvil.HEADER_SIZE) // SECTOR
+    RewriteChunks(region, limit)
+    region.Save(src)
+    assert Delta(src, dst) == anvil.HEADER_SIZE + limit * SECTOR
+
+
+def test_delta_ratio_exceeded_falls_back(pair):
+    src, dst, region = pair
+    limit = int((anvil.HEADER_SIZE + CHUNKS * SECTOR) * anvil.DELTA_MAX_RATIO - anvil.HEADER_SIZE) // SECTOR
+    RewriteChunks(region, limit + 1)
+    region.Save(src)
+    assert anvil.DeltaCopy(src, dst) is None
+    assert world_sync.SyncFile(src, dst, region_delta=True) is None
+    assert ReadFile(dst) == ReadFile(src)
@@ -0,0 +1,113 @@
+import threading
+import time
+
+import pytest
+from mcdreforged.api.rcon import RconConnection
+
+import stubs
+from multi_server_control import rcon_pool
+
+
+@pytest.fixture
+def server():
+    server = stubs.StubRconServer()
+    yield server
+    server.Close()
+
+
+@pytest.fixture
+def pool():
+    pool = rcon_pool.RconPool(acquire_timeout=0.2)
+    yield pool
+    pool.Close()
+
+
+def Factory(server, password=None, timeout=None):
+    """
+    :param server: StubRconServer
+    :param password: 密码，默认为正确的密码
+    :param timeout: 读写超时（秒）
+    :return: 创建 RconConnection 的函数
+    """
+    def Create():
+        conn = RconConnection('127.0.0.1', server.port, server.password if password is None else password)
+        if timeout is not None:
+            conn.READ_WRITE_TIMEOUT_SEC = timeout
+        return conn
+    return Create
+
+
+def test_batch_in_order_on_one_connection(server, pool):
+    commands = [f'list {i}' for i in range(20)]
+    assert pool.Execute('mirror', Factory(server), commands) == commands
+    assert pool.Execute('mirror', Factory(server), ['time query daytime']) == ['time query daytime']
+    assert server.connections == 1
+
+
+def test_dead_socket_replaced(server, pool):
+    assert pool.Execute('mirror', Factory(server), ['a']) == ['a']
+    entry = pool.Entry('mirror', Factory(server))
+    old_socket = entry.conn.socket
+    server.Drop()
+    # 等待 FIN 到达，MSG_PEEK 检查才能发现对端已关闭
+    deadline = time.monotonic() + 5
+    while rcon_pool.RconPool.Healthy(entry.conn) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not rcon_pool.RconPool.Healthy(entry.conn)
+
+    assert pool.Execute('mirror', Factory(server), ['b', 'c']) == ['b', 'c']
+    assert entry.conn.socket is not old_socket
+    assert server.connections == 2
+
+
+def test_auth_failure(server, pool):
+    with pytest.raises(rcon_pool.RconError, match='登录失败'):
+        pool.Execute('mirror', Factory(server, 'wrong'), ['list'])
+
+
+def test_connect_failure(pool):
+    server = stubs.StubRconServer()
+    server.Close()
+    with pytest.raises(rcon_pool.RconError, match='无法连接'):
+        pool.Execute('mirror', Factory(server), ['list'])
+
+
+def test_busy_connection_times_out(server, pool):
+    entry = pool.Entry('mirror', Factory(server))
+    # 模拟另一个线程正在使用这台服务器唯一的连接
+    entry.lock.acquire()
+    try:
+        start = time.monotonic()
+        with pytest.raises(rcon_pool.RconError, match='连接正忙'):
+            pool.Execute('mirror', Factory(server), ['list'])
+        assert time.monotonic() - start < 2
+    finally:
+        entry.lock.release()
+    assert pool.Execute('mirror', Factory(server), ['list']) == ['list']
+
+
+def test_waiting_caller_gets_connection(server):
+    pool = rcon_pool.RconPool(acquire_timeout=5)
+    entry = pool.Entry('mirror', Factory(server))
+    entry.lock.acquire()
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(pool.Execute('mirror', Factory(server), ['list'])))
+    waiter.start()
+    time.sleep(0.1)
+    entry.lock.release()
+    waiter.join(5)
+    assert results == [['list']]
+    pool.Close()
+
+
+def test_command_timeout():
+    server = stubs.StubRconServer(silent=True)
+    pool = rcon_pool.RconPool()
+    try:
+        with pytest.raises(rcon_pool.RconError, match='命令没有返回'):
+            pool.Execute('mirror', Factory(server, timeout=0.1), ['list'])
+        # 失败后连接已断开，下一次使用时重新连接
+        assert pool.Entry('mirror', Factory(server)).conn.socket is None
+    finally:
+        pool.Close()
+        server.Close()
@@ -0,0 +1,279 @@
+import os
+import socket
+import struct
+import threading
+import time
+import zlib
+
+import pytest
+
+from helpers import ReadTree, WriteTree
+from multi_server_control import remote_sync
+
+TOKEN = 'test-token'
+WORLDS = ['world', 'world_nether', 'world_the_end']
+
+
+class SlowLock:
+    """
+    释放时先等待一会儿的锁，让“回复之后才释放锁”的时序问题稳定复现
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def acquire(self, blocking=True):
+        return self.lock.acquire(blocking)
+
+    def release(self):
+        time.sleep(0.05)
+        self.lock.release()
+
+
+@pytest.fixture
+def target(tmp_path):
+    target = tmp_path / 'Mirror'
+    target.mkdir()
+    return target
+
+
+def FreePort():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def receiver(target):
+    # 子服的游戏端口使用一个空闲端口，避免本机正好运行着 25565 的服务器
+    receiver = remote_sync.Receiver('127.0.0.1', 0, TOKEN, {'mirror': str(target)}, ports={'mirror': FreePort()})
+    receiver.Start()
+    yield receiver
+    receiver.Stop()
+
+
+@pytest.fixture
+def source(tmp_path):
+    source = tmp_path / 'Main' / 'world'
+    WriteTree(source, {
+        'level.dat': b'level' * 100,
+        'region/r.0.0.mca': os.urandom(64 * 1024),
+        'region/r.0.1.mca': os.urandom(3 * remote_sync.CHUNK_SIZE + 10),
+        'playerdata/steve.dat': b'steve',
+    })
+    return source
+
+
+def Sync(receiver, source, world='world', token=TOKEN, **kwargs):
+    host, port = receiver.address
+    return remote_sync.RemoteSync(host, port, token, 'mirror', str(source), ['session.lock'], timeout=10,
+                                  world=world, **kwargs)
+
+
+def WaitIdle(receiver, name='mirror'):
+    """
+    等待接收端处理完上一个连接（发送端中断时接收端还需要一点时间才能发现连接已断开）
+    """
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        if receiver.locks[name].acquire(False):
+            receiver.locks[name].release()
+            return
+        time.sleep(0.01)
+    raise TimeoutError('接收端一直没有释放锁')
+
+
+def Connect(receiver, world='world'):
+    """
+    不经过 RemoteSync 直接连接接收端，用于发送异常的消息
+    :return: (套接字, 读取流)
+    """
+    sock = socket.create_connection(receiver.address, timeout=10)
+    stream = sock.makefile('rb')
+    remote_sync.SendJson(sock, {'op': 'hello', 'version': remote_sync.PROTOCOL_VERSION, 'token': TOKEN,
+                                'server': 'mirror', 'world': world})
+    remote_sync.RecvJson(stream)
+    return sock, stream
+
+
+def SendIndex(sock, stream, files):
+    remote_sync.SendJson(sock, {'op': 'index', 'files': files, 'dirs': [], 'ignore': [], 'scope': None})
+    return remote_sync.RecvJson(stream)
+
+
+def test_sync_and_noop(receiver, source, target):
+    report = Sync(receiver, source)
+    assert report.copied_files == 4
+    assert ReadTree(target / 'world') == ReadTree(source)
+
+    report = Sync(receiver, source)
+    assert report.copied_files == 0
+    assert report.sent_bytes == 0
+    assert report.deleted_files == 0
+    assert ReadTree(target / 'world') == ReadTree(source)
+
+
+def test_back_to_back_same_server(receiver, source, target):
+    receiver.locks['mirror'] = SlowLock()
+    for round_index in range(5):
+        WriteTree(source, {f'data/map_{round_index}.dat': os.urandom(1000 + round_index)})
+        if round_index:
+            os.remove(source / 'data' / f'map_{round_index - 1}.dat')
+        Sync(receiver, source)
+        assert ReadTree(target / 'world') == ReadTree(source)
+
+
+def test_multi_world_back_to_back(tmp_path, receiver, target):
+    # 多个存档依次同步，每个存档一个连接，下一个连接不能因为上一个连接还没释放锁而被拒绝
+    receiver.locks['mirror'] = SlowLock()
+    source = tmp_path / 'Main'
+    for world in WORLDS:
+        WriteTree(source / world, {
+            'level.dat': world.encode() * 100,
+            'region/r.0.0.mca': os.urandom(64 * 1024),
+            'data/raids.dat': b'raids',
+        })
+    for _ in range(3):
+        for world in WORLDS:
+            Sync(receiver, source / world, world)
+    for world in WORLDS:
+        assert ReadTree(target / world) == ReadTree(source / world)
+
+
+def test_resume_after_interrupt(monkeypatch, receiver, source, target):
+    send_frame = remote_sync.SendFrame
+    sent = []
+
+    def Interrupt(sock, kind, payload):
+        # 大文件发送两个完整的块之后断开
+        if kind == b'D' and len(payload) > remote_sync.CHUNK_SIZE:
+            if len(sent) == 2:
+                raise ConnectionResetError('中断')
+            sent.append(len(payload))
+        send_frame(sock, kind, payload)
+
+    monkeypatch.setattr(remote_sync, 'SendFrame', Interrupt)
+    with pytest.raises(ConnectionResetError):
+        Sync(receiver, source)
+    WaitIdle(receiver)
+    part = target / 'world' / 'region' / ('r.0.1.mca' + remote_sync.PART_SUFFIX)
+    assert part.exists()
+
+    def Count(sock, kind, payload):
+        if kind == b'D' and len(payload) > remote_sync.CHUNK_SIZE:
+            sent.append(len(payload))
+        send_frame(sock, kind, payload)
+
+    sent.clear()
+    monkeypatch.setattr(remote_sync, 'SendFrame', Count)
+    Sync(receiver, source)
+    # 已接收的两块不再发送，只发送剩下的一个完整块
+    assert len(sent) == 1
+    assert ReadTree(target / 'world') == ReadTree(source)
+
+
+def test_target_running(receiver, source, target):
+    # 子服正在运行（游戏端口被占用）时拒绝同步，不改动任何文件
+    with socket.socket() as game:
+        game.bind(('0.0.0.0', receiver.ports['mirror']))
+        game.listen()
+        with pytest.raises(remote_sync.TargetRunning, match='正在运行'):
+            Sync(receiver, source)
+    assert os.listdir(target) == []
+    Sync(receiver, source)
+    assert ReadTree(target / 'world') == ReadTree(source)
+
+
+def test_server_port(tmp_path):
+    assert remote_sync.ServerPort(str(tmp_path)) == remote_sync.DEFAULT_SERVER_PORT
+    WriteTree(tmp_path, {'server.properties': b'#Minecraft server properties\nserver-ip=\nserver-port=25601\n'})
+    assert remote_sync.ServerPort(str(tmp_path)) == 25601
+
+
+def test_bad_token(receiver, source, target):
+    with pytest.raises(remote_sync.RemoteSyncError, match='令牌错误'):
+        Sync(receiver, source, token='wrong')
+    assert not (target / 'world').exists()
+
+
+@pytest.mark.parametrize('world', ['..', '../Main', 'world/../..', '/tmp'])
+def test_world_traversal(tmp_path, receiver, source, world):
+    with pytest.raises(remote_sync.RemoteSyncError):
+        Sync(receiver, source, world=world)
+    assert sorted(os.listdir(tmp_path)) == ['Main', 'Mirror']
+
+
+def test_path_traversal(tmp_path, receiver):
+    sock, stream = Connect(receiver)
+    with sock:
+        with pytest.raises(remote_sync.RemoteSyncError, match='非法路径'):
+            SendIndex(sock, stream, {'../evil.dat': [4, 0]})
+
+    # 文件消息只能是索引中需要的文件
+    WaitIdle(receiver)
+    sock, stream = Connect(receiver)
+    with sock:
+        SendIndex(sock, stream, {'ok.dat': [4, 0]})
+        remote_sync.SendJson(sock, {'op': 'file', 'path': '../evil.dat', 'offset': 0, 'mtime': 0})
+        with pytest.raises(remote_sync.RemoteSyncError, match='非法文件消息'):
+            remote_sync.RecvJson(stream)
+    assert not (tmp_path / 'evil.dat').exists()
+
+
+def test_unexpected_op(receiver, target):
+    sock, stream = Connect(receiver)
+    with sock:
+        SendIndex(sock, stream, {'ok.dat': [4, 0]})
+        remote_sync.SendJson(sock, {'op': 'delete', 'path': 'ok.dat'})
+        with pytest.raises(remote_sync.RemoteSyncError, match='期望文件消息'):
+            remote_sync.RecvJson(stream)
+
+
+def test_decompress_bomb(receiver, target):
+    size = 3 * remote_sync.CHUNK_SIZE
+    sock, stream = Connect(receiver)
+    with sock:
+        SendIndex(sock, stream, {'bomb.dat': [size, 0]})
+        remote_sync.SendJson(sock, {'op': 'file', 'path': 'bomb.dat', 'offset': 0, 'mtime': 0})
+        block = bytes(size)
+        payload = struct.pack('>I', zlib.crc32(block)) + zlib.compress(block)
+        assert len(payload) < remote_sync.MAX_FRAME_SIZE
+        remote_sync.SendFrame(sock, b'D', payload)
+        with pytest.raises(remote_sync.RemoteSyncError, match='解压后超过'):
+            remote_sync.RecvJson(stream)
+
+
+@pytest.mark.parametrize('corrupt', ['crc', 'hash'])
+def test_mismatch_retransfers(monkeypatch, receiver, source, target, corrupt):
+    Sync(receiver, source)
+    # 子服上多余的文件在所有文件接收成功之前不会被删除
+    WriteTree(target / 'world', {'extra.dat': b'extra'})
+    WriteTree(source, {'region/r.0.0.mca': os.urandom(80 * 1024)})
+
+    send_frame, send_json = remote_sync.SendFrame, remote_sync.SendJson
+
+    def CorruptFrame(sock, kind, payload):
+        if kind == b'D':
+            crc = struct.unpack('>I', payload[:4])[0]
+            payload = struct.pack('>I', crc ^ 1) + payload[4:]
+        send_frame(sock, kind, payload)
+
+    def CorruptHash(sock, data):
+        if data.get('op') == 'end':
+            data = dict(data, hash='0' * 32)
+        send_json(sock, data)
+
+    if corrupt == 'crc':
+        monkeypatch.setattr(remote_sync, 'SendFrame', CorruptFrame)
+    else:
+        monkeypatch.setattr(remote_sync, 'SendJson', CorruptHash)
+    with pytest.raises(remote_sync.RemoteSyncError, match='校验失败'):
+        Sync(receiver, source)
+    assert (target / 'world' / 'extra.dat').exists()
+    assert ReadTree(target / 'world')['region/r.0.0.mca'] != ReadTree(source)['region/r.0.0.mca']
+
+    monkeypatch.undo()
+    report = Sync(receiver, source)
+    assert report.copied_files == 1
+    assert report.deleted_files == 1
+    assert ReadTree(target / 'world') == ReadTree(source)
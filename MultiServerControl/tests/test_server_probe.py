@@ -0,0 +1,98 @@
+import socket
+import struct
+
+import pytest
+
+import stubs
+from multi_server_control import server_probe
+
+
+class StubReplyServer(stubs.StubServer):
+    """
+    读取一次请求后回复固定的字节并断开，用于模拟回复异常的服务器
+    """
+
+    def __init__(self, reply):
+        self.reply = reply
+        super().__init__()
+
+    def Serve(self, conn):
+        with conn:
+            conn.recv(4096)
+            conn.sendall(self.reply)
+
+
+@pytest.fixture
+def reply_server(request):
+    server = StubReplyServer(request.param)
+    yield server
+    server.Close()
+
+
+def test_rcon_ready():
+    server = stubs.StubRconServer()
+    try:
+        assert server_probe.RconReady('127.0.0.1', server.port, server.password)
+        assert not server_probe.RconReady('127.0.0.1', server.port, 'wrong')
+    finally:
+        server.Close()
+
+
+def test_rcon_ready_refused():
+    # 绑定但不监听的端口，连接会被拒绝
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        assert not server_probe.RconReady('127.0.0.1', sock.getsockname()[1], 'password')
+
+
+@pytest.mark.parametrize('reply_server', [
+    b'',
+    # 长度头不完整
+    b'\x0a\x00',
+    # 数据包短于请求ID与类型
+    struct.pack('<i', 2) + b'\x00\x00',
+    # 内容不是 UTF-8
+    struct.pack('<i', 12) + struct.pack('<ii', 1, 2) + b'\xff\xfe\x00\x00',
+], indirect=True)
+def test_rcon_ready_bad_reply(reply_server):
+    assert not server_probe.RconReady('127.0.0.1', reply_server.port, 'password')
+
+
+def StatusReply(status):
+    """
+    :param status: 状态 JSON 文本
+    :return: Server List Ping 的状态回复
+    """
+    text = status.encode('utf-8')
+    return server_probe.PackPacket(0x00, server_probe.PackVarInt(len(text)) + text)
+
+
+@pytest.mark.parametrize('reply_server', [
+    # 长度为 0 的数据包
+    server_probe.PackVarInt(0),
+    server_probe.PackVarInt(-1),
+    server_probe.PackVarInt(server_probe.MAX_PACKET_SIZE + 1),
+    # 状态文本比声明的短
+    server_probe.PackPacket(0x00, server_probe.PackVarInt(100) + b'{}'),
+    StatusReply('[]'),
+    StatusReply('{"version": "1.20.4"}'),
+    StatusReply('{"players": 3}'),
+    StatusReply('{"players": {"online": "3", "max": 20}}'),
+    StatusReply('{"version": {"name": 765}}'),
+], indirect=True)
+def test_slp_bad_reply(reply_server):
+    with pytest.raises(ValueError):
+        server_probe.ServerListPing('127.0.0.1', reply_server.port)
+    status = server_probe.ProbeServer('127.0.0.1', reply_server.port)
+    assert status['online'] and not status['ready']
+
+
+def test_slp_status():
+    server = stubs.StubSlpServer(players=5)
+    try:
+        status = server_probe.ProbeServer('127.0.0.1', server.port)
+    finally:
+        server.Close()
+    assert status['ready']
+    assert (status['version'], status['players'], status['max_players'], status['motd']) == \
+        ('1.20.4', 5, 20, 'MSC benchmark')
@@ -0,0 +1,55 @@
+import sys
+import threading
+import time
+
+import pytest
+
+from multi_server_control import supervisor
+
+# 启动后立即退出的“子服”
+COMMAND = [sys.executable, '-c', 'print("done")']
+
+
+@pytest.fixture(autouse=True)
+def backoff(monkeypatch):
+    monkeypatch.setattr(supervisor, 'RESTART_BACKOFF_INITIAL', 0.2)
+
+
+def Wait(predicate, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            raise TimeoutError('等待超时')
+        time.sleep(0.01)
+
+
+def test_restart_pending_until_relaunch(tmp_path):
+    launched = threading.Event()
+    pending = []
+
+    def BeforeRestart(managed):
+        pending.append(processes.RestartPending('mirror'))
+        launched.set()
+        managed.auto_restart = False
+        return True
+
+    processes = supervisor.Supervisor(before_restart=BeforeRestart)
+    managed = processes.Start('mirror', COMMAND, str(tmp_path), auto_restart=True)
+    Wait(managed.exited.is_set)
+    # 崩溃后、重新启动之前，同步与回滚能看到子服即将重新运行
+    assert processes.RestartPending('mirror')
+    assert launched.wait(10)
+    Wait(lambda: managed.restarts == 1 and managed.exited.is_set())
+    assert pending == [True]
+    assert not processes.RestartPending('mirror')
+
+
+def test_before_restart_cancels(tmp_path):
+    calls = []
+    processes = supervisor.Supervisor(before_restart=lambda managed: calls.append(managed) and False)
+    managed = processes.Start('mirror', COMMAND, str(tmp_path), auto_restart=True)
+    Wait(lambda: calls and not processes.RestartPending('mirror'))
+    time.sleep(0.1)
+    assert managed.restarts == 0
+    assert not processes.Running('mirror')
+    assert list(managed.output)[-1] == '[MSC] 自动重启已取消'
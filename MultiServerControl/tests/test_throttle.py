@@ -0,0 +1,63 @@
+import os
+
+import pytest
+
+from multi_server_control import throttle, world_sync
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    """
+    记录 fdatasync 与 posix_fadvise 的调用顺序
+    """
+    calls = []
+    sync = getattr(os, 'fdatasync', os.fsync)
+    fadvise = getattr(os, 'posix_fadvise', None)
+
+    def Sync(fd):
+        calls.append(('sync', fd))
+        sync(fd)
+
+    def Fadvise(fd, offset, length, advice):
+        calls.append(('drop', fd, offset, length))
+        if fadvise is not None:
+            fadvise(fd, offset, length, advice)
+
+    monkeypatch.setattr(os, 'fdatasync', Sync, raising=False)
+    monkeypatch.setattr(os, 'posix_fadvise', Fadvise, raising=False)
+    monkeypatch.setattr(os, 'POSIX_FADV_DONTNEED', getattr(os, 'POSIX_FADV_DONTNEED', 4), raising=False)
+    return calls
+
+
+def test_drop_writes_back_target_first(tmp_path, calls):
+    limiter = throttle.IoLimiter(fadvise=True)
+    with open(tmp_path / 'file', 'wb') as f:
+        f.write(b'x' * 4096)
+        f.flush()
+        limiter.Drop(f.fileno())
+        assert calls == [('sync', f.fileno()), ('drop', f.fileno(), 0, 0)]
+
+
+def test_drop_source_skips_write_back(tmp_path, calls):
+    limiter = throttle.IoLimiter(fadvise=True)
+    with open(tmp_path / 'file', 'wb') as f:
+        limiter.Drop(f.fileno(), True, 0)
+        assert calls == [('drop', f.fileno(), 0, 0)]
+
+
+def test_copy_drops_per_window(tmp_path, calls, monkeypatch):
+    monkeypatch.setattr(throttle, 'DROP_WINDOW', 2 * throttle.BLOCK_SIZE)
+    src, dst = tmp_path / 'src', tmp_path / 'dst'
+    data = os.urandom(5 * throttle.BLOCK_SIZE + 100)
+    src.write_bytes(data)
+    world_sync.CopyFileData(str(src), str(dst), throttle.IoLimiter(fadvise=True))
+    assert dst.read_bytes() == data
+
+    drops = [call[2:] for call in calls if call[0] == 'drop']
+    window = 2 * throttle.BLOCK_SIZE
+    # 复制过程中每个窗口丢弃一次，复制完成后再丢弃整个目标文件（源文件刚修改过，不丢弃）
+    assert drops == [(0, window), (window, window), (0, 0)]
+    # 每次丢弃目标文件的页缓存之前都先回写
+    for index, call in enumerate(calls):
+        if call[0] == 'drop':
+            assert calls[index - 1] == ('sync', call[1])
@@ -0,0 +1,18 @@
+import os
+
+from helpers import ReadTree, WriteTree
+from multi_server_control import world_sync
+
+
+def test_hash_check_missing_target(tmp_path):
+    source, target = tmp_path / 'source', tmp_path / 'target'
+    WriteTree(source, {'level.dat': b'level', 'data/raids.dat': b'raids'})
+    world_sync.IncrementalSync(str(source), str(target), [])
+    # 清单中记录的目标文件大小一致、修改时间不同，但文件已被删除
+    known = world_sync.ScanTree(str(target), [])
+    os.remove(target / 'level.dat')
+    os.utime(source / 'level.dat', ns=(0, 0))
+
+    report = world_sync.IncrementalSync(str(source), str(target), [], hash_check=True, known=known)
+    assert report.copied_files == 1
+    assert ReadTree(target) == ReadTree(source)